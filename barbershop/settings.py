@@ -85,10 +85,45 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            # Сколько ждать чужую блокировку на запись, с. Транзакции записи
+            # к мастеру начинаются с BEGIN IMMEDIATE (см. core/booking.py)
+            "timeout": 20,
+        },
+        # Тестовая БД в файле: в памяти параллельные потоки получают
+        # "table is locked" вместо ожидания блокировки
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
     }
 }
 
 
+# Кеш
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# Кеш общий для всех процессов (воркеры веб-сервера, manage.py-команды):
+# в нем лежат счетчики статусов заявок и номера поколений (карта услуг,
+# варианты в формах, лендинг, расписание мастеров). Кеш в памяти процесса
+# (LocMemCache) не подходит - сброс в одном процессе не виден другим.
+# С REDIS_URL - Redis (нужен пакет redis, incr атомарный), без него -
+# таблица в БД: python manage.py createcachetable
+REDIS_URL = os.getenv("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "django_cache",
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -145,6 +180,36 @@ MEDIA_URL = "/media/"
 # ImageField(upload_to="reviews/") - это означает что изображение будет лежать в папке media/reviews/...
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Медиафайлы хранятся по SHA-256 содержимого: одинаковые загрузки - один файл
+# на диске со счетчиком ссылок (см. core/storage.py)
+STORAGES = {
+    "default": {"BACKEND": "core.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+# Загрузки больше этого размера Django пишет кусками во временный файл на диске,
+# а не держит в памяти
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024  # 1 МБ
+
+# Ограничения для фото отзывов и аватаров (см. core/images.py)
+IMAGE_UPLOAD_MAX_BYTES = 10 * 1024 * 1024  # 10 МБ
+IMAGE_MAX_DIMENSION = 8000  # по большей стороне, px
+IMAGE_MAX_PIXELS = 40_000_000
+# Варианты для адаптивных картинок (ширина, px) и квадратная миниатюра
+IMAGE_VARIANT_WIDTHS = [320, 640, 1280]
+IMAGE_THUMBNAIL_SIZE = 160
+IMAGE_WEBP_QUALITY = 80
+
+# Запись к мастерам (core/availability.py).
+# Рабочий день в локальном времени (TIME_ZONE) и шаг сетки начала записи
+BOOKING_DAY_START = "10:00"
+BOOKING_DAY_END = "21:00"
+# Шаг должен делить час. Занятые ячейки хранятся в БД (MasterSlot): после смены
+# шага выполните python manage.py rebuild_master_slots
+BOOKING_SLOT_STEP_MINUTES = 15
+# Расписание всех мастеров строится одним запросом на окно в столько дней
+BOOKING_WINDOW_DAYS = 14
+
 MISTRAL_MODERATIONS_GRADES = {
     "hate_and_discrimination": 0.1,  # ненависть и дискриминация
     "sexual": 0.1,  # сексуальный
@@ -157,10 +222,42 @@ MISTRAL_MODERATIONS_GRADES = {
     "pii": 0.1,  # личная информация
 }
 
+# Бэкенд модерации отзывов: MistralBackend, StubBackend или KeywordBackend
+# из core.moderation_backends
+MODERATION_BACKEND = {
+    "BACKEND": "core.moderation_backends.MistralBackend",
+    "OPTIONS": {},
+}
+
+# Клиент API модерации: адрес (для локального тестового сервера), дедлайн
+# на вызов, число повторов, размер пула соединений и автоматический выключатель
+MISTRAL_SERVER_URL = os.getenv("MISTRAL_SERVER_URL") or None
+MISTRAL_TIMEOUT_MS = 5000
+MISTRAL_MAX_RETRIES = 2
+MISTRAL_POOL_SIZE = 10
+MISTRAL_BREAKER_THRESHOLD = 5
+MISTRAL_BREAKER_RESET_SECONDS = 30
+
+# Кеш результатов модерации: сколько записей держать в памяти процесса
+# и сколько секунд хранить результат в БД
+MODERATION_CACHE_SIZE = 10_000
+MODERATION_CACHE_TTL = 60 * 60 * 24 * 30  # 30 дней
+
 
 TELEGRAM_BOT_API_KEY = os.getenv("TELEGRAM_BOT_API_KEY")
 TELEGRAM_USER_ID = os.getenv("TELEGRAM_USER_ID")
 
+# Лимиты отправки в Telegram для диспетчера уведомлений:
+# всего сообщений в секунду и сообщений в секунду в один чат
+TELEGRAM_RATE_PER_SECOND = 25
+TELEGRAM_CHAT_RATE_PER_SECOND = 1
+
+# Режим дайджеста: при потоке заказов уведомления одного чата копятся
+# до TELEGRAM_DIGEST_WINDOW_SECONDS секунд или TELEGRAM_DIGEST_MAX_ORDERS штук
+# и уходят одним сообщением. 0 секунд - каждый заказ отдельным сообщением
+TELEGRAM_DIGEST_WINDOW_SECONDS = 10
+TELEGRAM_DIGEST_MAX_ORDERS = 20
+
 
 # Маршруты для авторизации
 LOGIN_URL = reverse_lazy("login")
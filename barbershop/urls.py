@@ -5,11 +5,13 @@ from core.views import (
     MasterDetailView,
     MasterListView,
     OrderListView,
+    OrderExportView,
     ThanksTemplateView,
     OrderUpdateView,
     OrderCreateView,
     ReviewCreateView,
     MasterServicesView,
+    AvailabilityView,
 )
 from django.conf import settings
 from django.conf.urls.static import static
@@ -19,12 +21,20 @@ from users import urls as users_urls
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("ajax/get-master-services/", MasterServicesView.as_view(), name="get_master_services"),
+    path("ajax/master-services/", MasterServicesView.as_view(), name="master_services_map"),
+    path(
+        "ajax/master-services/<int:master_id>/",
+        MasterServicesView.as_view(),
+        name="master_services",
+    ),
+    path("ajax/availability/", AvailabilityView.as_view(), name="availability"),
     path("", LandingView.as_view(), name="landing"),
     path("masters/", MasterListView.as_view(), name="master_list"),
     path("masters/<int:master_id>/", MasterDetailView.as_view(), name="master_detail"),
     path("orders/create/", OrderCreateView.as_view(), name="order_create"),
     path("orders/update/<int:order_id>/", OrderUpdateView.as_view(), name="order_update"),
     path("orders/", OrderListView.as_view(), name="order_list"),
+    path("orders/export/", OrderExportView.as_view(), name="order_export"),
     path("thanks/", ThanksTemplateView.as_view(), name="thanks"),
     path("reviews/create/", ReviewCreateView.as_view(), name="review_create"),
 
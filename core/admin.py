@@ -1,11 +1,199 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Count, Prefetch
+from django.http import HttpResponseRedirect
+from django.utils.functional import cached_property
+from .booking import SlotTaken, sync_slots
+from .forms import OrderAdminForm
 from .models import Master, Order, Review, Service
-from django.db.models import Count
+from .name_search import prefix_search_q
+from .order_filters import OrderFilter
 
-# Сделать регистрацию самым простым способом
-admin.site.register(Master)
-admin.site.register(Order)
-admin.site.register(Review)
+# Начиная с этого размера таблицы в админке показываем оценку числа строк
+ESTIMATED_COUNT_THRESHOLD = 100_000
+
+
+def estimate_row_count(model) -> int | None:
+    """
+    Примерное число строк в таблице без полного прохода COUNT(*).
+    None - если СУБД не умеет быстро оценивать.
+    """
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+        elif connection.vendor == "sqlite":
+            # Максимальный rowid берется из B-дерева за O(log n).
+            # Это верхняя граница: удаленные строки не вычитаются
+            cursor.execute(f'SELECT MAX(rowid) FROM "{table}"')
+        elif connection.vendor == "mysql":
+            cursor.execute(
+                "SELECT table_rows FROM information_schema.tables "
+                "WHERE table_schema = DATABASE() AND table_name = %s",
+                [table],
+            )
+        else:
+            return None
+        row = cursor.fetchone()
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор для больших таблиц: без фильтров не считает COUNT(*),
+    а берет оценку числа строк. С фильтрами - обычный точный подсчет.
+
+    Оценка может быть больше настоящего числа (на SQLite удаленные строки
+    не вычитаются), поэтому page() уточняет его: неполная страница - последняя,
+    а за пустой страницей считаем точно и отдаем последнюю настоящую.
+    """
+
+    estimated = False
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, "query", None)
+        if query is not None and not query.where:
+            estimate = estimate_row_count(self.object_list.model)
+            if estimate is not None and estimate >= ESTIMATED_COUNT_THRESHOLD:
+                self.estimated = True
+                return estimate
+        return super().count
+
+    def _set_count(self, count):
+        self.__dict__["count"] = count
+        self.__dict__.pop("num_pages", None)
+        self.estimated = False
+
+    def page(self, number):
+        page = super().page(number)
+        if not self.estimated:
+            return page
+        rows = len(page.object_list)
+        if rows == self.per_page:
+            return page
+        if rows:
+            self._set_count((page.number - 1) * self.per_page + rows)
+            return page
+        # Страница за реальным концом таблицы - точный подсчет и последняя страница
+        self._set_count(super().count)
+        return super().page(min(page.number, self.num_pages))
+
+
+class PrefixSearchMixin:
+    """
+    Поиск по началу слов через индексированные колонки prefix_search_fields
+    (см. core/name_search.py) вместо LIKE по всей таблице. Им же пользуется
+    автодополнение в формах заявок и отзывов
+    """
+
+    prefix_search_fields = []
+
+    def get_search_results(self, request, queryset, search_term):
+        query = prefix_search_q(search_term, self.prefix_search_fields)
+        if query is None:
+            return queryset, False
+        return queryset.filter(query), False
+
+
+class MasterAdmin(PrefixSearchMixin, admin.ModelAdmin):
+    list_display = ["last_name", "first_name", "phone", "services_count"]
+    # Поиск по началу фамилии/имени - для автодополнения в заявках и отзывах
+    search_fields = ["last_name", "first_name"]
+    prefix_search_fields = ["last_name_search", "first_name_search"]
+    search_help_text = "Начало фамилии или имени"
+    ordering = ["last_name", "first_name"]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(services_count=Count("services"))
+
+    @admin.display(description="Услуг", ordering="services_count")
+    def services_count(self, obj):
+        return obj.services_count
+
+
+class OrderAdmin(admin.ModelAdmin):
+    # Проверка занятости мастера, как в форме заявки на сайте
+    form = OrderAdminForm
+    list_display = ["id", "name", "phone", "master", "status", "order_date", "created_at", "services_list"]
+    list_display_links = ["id", "name"]
+    list_filter = ["status", "master"]
+    # Мастер одним JOIN, без запроса на каждую строку
+    list_select_related = ["master"]
+    # Сортировка совпадает с индексом order_created_id_idx
+    ordering = ["-created_at", "-id"]
+    search_fields = ["name", "phone", "comment"]
+    search_help_text = "Имя, телефон (начало или последние цифры) или комментарий"
+    autocomplete_fields = ["master", "services"]
+    readonly_fields = ["created_at", "updated_at"]
+    paginator = EstimatedCountPaginator
+    # Не считаем всю таблицу ради "(N всего)" рядом с результатами поиска
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch("services", Service.objects.only("id", "name"))
+        )
+
+    def save_model(self, request, obj, form, change):
+        # Время мастера занимаем один раз - когда сохранены и услуги (save_related)
+        obj._slots_deferred = True
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance._slots_deferred = False
+        sync_slots(form.instance)
+
+    def changeform_view(self, request, object_id=None, form_url="", extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except SlotTaken:
+            # Время заняли между проверкой формы и сохранением - сохранение
+            # откатилось целиком. Повторная проверка формы уже видит чужую
+            # заявку и покажет ошибку у полей, не теряя введенного
+            pass
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except SlotTaken as error:
+            self.message_user(request, f"{error} Заявка не сохранена.", messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
+
+    def get_search_results(self, request, queryset, search_term):
+        """Тот же индексный поиск, что и в списке заявок: FTS5 и колонки телефона"""
+        if not search_term:
+            return queryset, False
+        order_filter = OrderFilter(
+            {
+                "q": search_term,
+                **{f"search_by_{field}": "true" for field in ("phone", "name", "comment")},
+            }
+        )
+        return queryset.filter(order_filter.get_q()), False
+
+    @admin.display(description="Услуги")
+    def services_list(self, obj):
+        return ", ".join(service.name for service in obj.services.all())
+
+
+class ReviewAdmin(admin.ModelAdmin):
+    list_display = ["id", "client_name", "master", "rating", "is_published", "ai_checked_status", "created_at"]
+    list_display_links = ["id", "client_name"]
+    list_filter = ["is_published", "ai_checked_status", "rating"]
+    list_select_related = ["master"]
+    ordering = ["-created_at", "-id"]
+    search_fields = ["^client_name"]
+    autocomplete_fields = ["master"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+admin.site.register(Master, MasterAdmin)
+admin.site.register(Order, OrderAdmin)
+admin.site.register(Review, ReviewAdmin)
 # admin.site.register(Service)
 
 class MastersCountFilter(admin.SimpleListFilter):
@@ -20,7 +208,9 @@ class MastersCountFilter(admin.SimpleListFilter):
         ]
 
     def queryset(self, request, queryset):
-        queryset = queryset.annotate(masters_count=Count("masters"))
+        # Количество уже посчитано в ServiceAdmin.get_queryset
+        if "masters_count" not in queryset.query.annotations:
+            queryset = queryset.annotate(masters_count=Count("masters"))
         if self.value() == "0":
             return queryset.filter(masters_count=0)
         if self.value() == "1-3":
@@ -31,11 +221,16 @@ class MastersCountFilter(admin.SimpleListFilter):
 
 
 # Пайтон класс для услуги
-class ServiceAdmin(admin.ModelAdmin):
+class ServiceAdmin(PrefixSearchMixin, admin.ModelAdmin):
     # Какие поля будут отображаться в админке (отображаются в виде таблицы)
     list_display = ["name", "duration", "is_popular", "price", "masters_count"]
-    # Какие поля будут участвуют в поиске (появится поле  поиска))
-    search_fields = ["name", "description"]
+    # Какие поля будут участвуют в поиске (появится поле  поиска)).
+    # Ищем по началу названия через индекс - им пользуется автодополнение в заявках
+    search_fields = ["name"]
+    prefix_search_fields = ["name_search"]
+    search_help_text = "Начало названия"
+    # Стабильный порядок страниц списка и автодополнения
+    ordering = ["name"]
     # Фильтры для спискового отображения
     list_filter = ["is_popular", "duration", "price", MastersCountFilter]
     # Кликабельные поля
@@ -45,12 +240,15 @@ class ServiceAdmin(admin.ModelAdmin):
     # Кастомные действия
     actions = ["make_popular", "make_not_popular"]
 
+    def get_queryset(self, request):
+        # Считаем мастеров одним запросом со всей страницей, а не COUNT на каждую строку
+        return super().get_queryset(request).annotate(masters_count=Count("masters"))
 
     # Метод для подсчета количества мастеров которые работают с услугой
-    @admin.display(description="Количество мастеров")
+    @admin.display(description="Количество мастеров", ordering="masters_count")
     def masters_count(self, obj):
-        return obj.masters.count()
-    
+        return obj.masters_count
+
     # Методы для кастомных действий
     @admin.action(description="Сделать популярным")
     def make_popular(self, request, queryset):
@@ -62,4 +260,4 @@ class ServiceAdmin(admin.ModelAdmin):
 
 
 # Регистрация класса для услуги
-admin.site.register(Service, ServiceAdmin)
\ No newline at end of file
+admin.site.register(Service, ServiceAdmin)
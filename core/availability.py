@@ -0,0 +1,217 @@
+"""
+Свободное время мастеров.
+
+Мастер занят с Order.order_date на суммарную длительность услуг заявки
+(Service.duration, минуты). Отмененные заявки время не занимают.
+
+- build_schedules одним запросом (GROUP BY по заявке) строит занятые
+  интервалы всех мастеров за диапазон дат;
+- интервалы мастера хранятся в BusyIntervals: два отсортированных списка
+  начал и концов без пересечений, поиск - bisect;
+- расписание строится на окно в BOOKING_WINDOW_DAYS дней для всех мастеров
+  сразу и лежит в кеше по поколениям (core/page_cache.py): сигналы заявок
+  и услуг только увеличивают номер поколения "availability".
+  Ответ "свободные слоты мастера X на услуги S в день D" - одно чтение
+  из кеша и проход по интервалам одного дня;
+- проверка формы заявки (find_conflict) кеш не использует - смотрит в БД.
+
+Время внутри модуля - целые минуты от начала эпохи (UTC).
+
+Занятость считается по ячейкам сетки BOOKING_SLOT_STEP_MINUTES от начала
+эпохи (grid_bounds) - так же, как ее занимает core/booking.py: заявка
+10:05-10:35 занимает 10:00-10:45. Поэтому шаг должен делить час,
+а после его смены ячейки предстоящих заявок пересобирает
+manage.py rebuild_master_slots.
+"""
+
+from bisect import bisect_right
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from .form_choices import get_choice_data
+from .page_cache import bump_generation, get_generation
+
+GENERATION = "availability"
+SCHEDULE_KEY = "availability:{}:{}:{}"
+CACHE_TIMEOUT = 60 * 60
+# Заявка не длиннее суток: на столько смотрим назад от начала диапазона
+LOOKBACK = timedelta(days=1)
+# Эти заявки время мастера не занимают
+FREE_STATUSES = ["cancelled"]
+
+
+def to_minutes(value: datetime) -> int:
+    return int(value.timestamp()) // 60
+
+
+def from_minutes(minutes: int) -> datetime:
+    return datetime.fromtimestamp(minutes * 60, tz=dt_timezone.utc)
+
+
+def grid_bounds(begin: int, duration: int) -> tuple[int, int]:
+    """Интервал [begin, begin + duration), расширенный до границ ячеек сетки"""
+    step = settings.BOOKING_SLOT_STEP_MINUTES
+    if duration <= 0:
+        return begin, begin
+    return begin // step * step, -(-(begin + duration) // step) * step
+
+
+class BusyIntervals:
+    """Занятые интервалы [начало, конец) одного мастера, в минутах"""
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, intervals=()):
+        # Пересекающиеся и соседние интервалы склеиваем: после этого
+        # и начала, и концы отсортированы, и bisect работает по любому списку
+        self.starts = []
+        self.ends = []
+        for start, end in sorted(intervals):
+            if end <= start:
+                continue
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlaps(self, start: int, end: int) -> bool:
+        # Первый интервал, который заканчивается позже start
+        index = bisect_right(self.ends, start)
+        return index < len(self.starts) and self.starts[index] < end
+
+    def free_starts(self, day_start: int, day_end: int, duration: int, step: int) -> list[int]:
+        """Начала по сетке step от day_start, с которых duration минут свободны"""
+        result = []
+        current = day_start
+        index = bisect_right(self.ends, current)
+        count = len(self.starts)
+        while current + duration <= day_end:
+            if index < count and self.starts[index] < current + duration:
+                # Мешает занятый интервал - переходим на первый шаг сетки после него
+                current = day_start + -(-(self.ends[index] - day_start) // step) * step
+                index = bisect_right(self.ends, current, index)
+                continue
+            result.append(current)
+            current += step
+        return result
+
+
+def busy_rows(start: datetime, end: datetime, master_ids=None, exclude_order_id=None):
+    """(master_id, order_date, минуты) заявок, которые могут пересекать [start, end)"""
+    from .models import Order
+
+    queryset = Order.objects.filter(
+        master__isnull=False,
+        order_date__gte=start - LOOKBACK,
+        order_date__lt=end,
+    ).exclude(status__in=FREE_STATUSES)
+    if master_ids is not None:
+        queryset = queryset.filter(master_id__in=master_ids)
+    if exclude_order_id is not None:
+        queryset = queryset.exclude(pk=exclude_order_id)
+    # id в группировке, чтобы две заявки на одно время не сложились в одну
+    return (
+        queryset.order_by()
+        .values_list("id", "master_id", "order_date")
+        .annotate(minutes=Sum("services__duration"))
+        .values_list("master_id", "order_date", "minutes")
+    )
+
+
+def build_schedules(start: datetime, end: datetime, master_ids=None, exclude_order_id=None) -> dict:
+    """{master_id: BusyIntervals} одним запросом"""
+    intervals = {}
+    for master_id, order_date, minutes in busy_rows(start, end, master_ids, exclude_order_id):
+        if not minutes:
+            continue
+        intervals.setdefault(master_id, []).append(grid_bounds(to_minutes(order_date), minutes))
+    return {master_id: BusyIntervals(items) for master_id, items in intervals.items()}
+
+
+def _local_datetime(day, value: str) -> datetime:
+    return timezone.make_aware(
+        datetime.combine(day, dt_time.fromisoformat(value)), timezone.get_current_timezone()
+    )
+
+
+def window_bounds(window: int) -> tuple[datetime, datetime]:
+    days = settings.BOOKING_WINDOW_DAYS
+    first_day = datetime.fromordinal(window * days).date()
+    return (
+        _local_datetime(first_day, "00:00"),
+        _local_datetime(first_day + timedelta(days=days), "00:00"),
+    )
+
+
+def get_schedule(master_id: int, day) -> BusyIntervals:
+    """Занятость мастера на окно, в которое попадает day (из кеша)"""
+    generation = get_generation(GENERATION)
+    window = day.toordinal() // settings.BOOKING_WINDOW_DAYS
+    key = SCHEDULE_KEY.format(generation, window, master_id)
+    schedule = cache.get(key)
+    if schedule is not None:
+        return schedule
+
+    schedules = build_schedules(*window_bounds(window))
+    # Мастера без заявок тоже кладем в кеш - пустым расписанием
+    master_ids = {row[0] for row in get_choice_data()["core.master"]} | {master_id}
+    values = {
+        SCHEDULE_KEY.format(generation, window, pk): schedules.get(pk, BusyIntervals())
+        for pk in master_ids
+    }
+    cache.set_many(values, CACHE_TIMEOUT)
+    return values[key]
+
+
+def invalidate_availability() -> None:
+    bump_generation(GENERATION)
+
+
+def services_duration(service_ids) -> int | None:
+    """Суммарная длительность услуг из кеша форм. None - если услуги нет"""
+    durations = {row[0]: row[2] for row in get_choice_data()["core.service"]}
+    total = 0
+    for service_id in set(service_ids):
+        if service_id not in durations:
+            return None
+        total += durations[service_id]
+    return total
+
+
+def working_hours(day) -> tuple[int, int]:
+    return (
+        to_minutes(_local_datetime(day, settings.BOOKING_DAY_START)),
+        to_minutes(_local_datetime(day, settings.BOOKING_DAY_END)),
+    )
+
+
+def free_slots(master_id: int, day, duration: int) -> list[datetime]:
+    """Свободные начала записи на duration минут к мастеру в день day"""
+    step = settings.BOOKING_SLOT_STEP_MINUTES
+    day_start, day_end = working_hours(day)
+    now = to_minutes(timezone.now())
+    if now > day_start:
+        # Сегодня - только будущие шаги сетки
+        day_start += -(-(now - day_start) // step) * step
+    starts = get_schedule(master_id, day).free_starts(day_start, day_end, max(duration, 1), step)
+    return [from_minutes(start) for start in starts]
+
+
+def find_conflict(master_id: int, start: datetime, duration: int, exclude_order_id=None) -> bool:
+    """
+    Пересекается ли запись с другими заявками мастера (по данным БД, без кеша).
+    Сравниваются ячейки сетки - те же, что займет core/booking.py
+    """
+    begin, end = grid_bounds(to_minutes(start), duration)
+    schedule = build_schedules(
+        from_minutes(begin), from_minutes(end), [master_id], exclude_order_id
+    ).get(master_id)
+    return bool(schedule) and schedule.overlaps(begin, end)
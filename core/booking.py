@@ -0,0 +1,172 @@
+"""
+Атомарная запись к мастеру.
+
+Проверка в форме (core/availability.find_conflict) и сохранение заявки -
+разные шаги: два клиента, одновременно выбравшие одно время, оба проходят
+проверку. Окончательно время занимает БД: интервал заявки режется на ячейки
+сетки BOOKING_SLOT_STEP_MINUTES, и на каждую ячейку вставляется строка
+MasterSlot с уникальностью (мастер, начало ячейки). Пересекающиеся заявки
+делят хотя бы одну ячейку - вставка второй падает с IntegrityError,
+и транзакция с заявкой откатывается целиком.
+
+Ячейки всегда соответствуют заявке: сигналы Order (core/signals.py)
+пересобирают их при смене мастера, даты, статуса или услуг - откуда бы
+ни пришло изменение (сайт, админка, save() в коде). Отмененная заявка
+ячеек не держит. Импорт (core/importer.py) вставляет ячейки пачкой
+через reserve_many. После изменений в обход сигналов (bulk update,
+смена длительности услуги или шага сетки) ячейки предстоящих заявок
+пересобирает manage.py rebuild_master_slots.
+
+Транзакция короткая: заявка, ее услуги и ячейки, без SELECT "свободно ли".
+На SQLite она открывается через BEGIN IMMEDIATE (booking_atomic): блокировка
+на запись берется сразу, и конкурирующие записи ждут ее до timeout секунд
+(settings.DATABASES), а не падают с "database is locked" при попытке
+поднять чтение до записи. Остальные транзакции проекта - обычные DEFERRED.
+
+Ячейки идут по сетке, поэтому заявка не с начала шага занимает ячейки
+целиком: 10:05-10:35 занимает 10:00-10:45 (так же считает и find_conflict).
+"""
+
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .availability import FREE_STATUSES, from_minutes, grid_bounds, to_minutes
+from .models import MasterSlot, Order
+
+
+class SlotTaken(Exception):
+    """Время мастера уже занято другой заявкой"""
+
+
+@contextmanager
+def booking_atomic():
+    """
+    transaction.atomic(), который на SQLite сразу берет блокировку на запись.
+    Вложенный в чужую транзакцию - обычная точка сохранения
+    """
+    if connection.vendor != "sqlite" or connection.in_atomic_block:
+        with transaction.atomic():
+            yield
+        return
+    connection.ensure_connection()
+    previous = connection.transaction_mode
+    # Режим читается только в момент BEGIN - на входе во внешний atomic
+    connection.transaction_mode = "IMMEDIATE"
+    try:
+        with transaction.atomic():
+            connection.transaction_mode = previous
+            yield
+    finally:
+        connection.transaction_mode = previous
+
+
+def slot_starts(start: datetime, duration: int) -> list[datetime]:
+    """Начала ячеек сетки, которые задевает интервал [start, start + duration)"""
+    step = settings.BOOKING_SLOT_STEP_MINUTES
+    begin, end = grid_bounds(to_minutes(start), duration)
+    return [from_minutes(minutes) for minutes in range(begin, end, step)]
+
+
+def holds_time(order) -> bool:
+    return (
+        order.master_id is not None
+        and order.order_date is not None
+        and order.status not in FREE_STATUSES
+    )
+
+
+def reserve_slots(order, duration: int) -> None:
+    """
+    Занимает время заявки вместо прежнего. Отмененная заявка, заявка без
+    мастера, даты или услуг время не занимает. SlotTaken - время занято.
+    """
+    with booking_atomic():
+        MasterSlot.objects.filter(order=order).delete()
+        if not holds_time(order):
+            return
+        slots = [
+            MasterSlot(master_id=order.master_id, starts_at=starts_at, order=order)
+            for starts_at in slot_starts(order.order_date, duration)
+        ]
+        if not slots:
+            return
+        try:
+            with transaction.atomic():
+                MasterSlot.objects.bulk_create(slots)
+        except IntegrityError as error:
+            raise SlotTaken(f"Мастер {order.master} в это время занят.") from error
+
+
+def sync_slots(order) -> None:
+    """Пересобирает ячейки заявки по ее текущим услугам в БД"""
+    duration = order.services.aggregate(minutes=Sum("duration"))["minutes"] or 0
+    reserve_slots(order, duration)
+
+
+def reserve_many(orders, durations: dict) -> set[int]:
+    """
+    Ячейки для пачки новых заявок (импорт). durations - {id заявки: минуты}.
+    Занятые ячейки пропускаются; возвращает id заявок, время которых
+    пересеклось с другими заявками и занято не полностью.
+    """
+    slots = [
+        MasterSlot(master_id=order.master_id, starts_at=starts_at, order_id=order.pk)
+        for order in orders
+        if holds_time(order)
+        for starts_at in slot_starts(order.order_date, durations.get(order.pk, 0))
+    ]
+    if not slots:
+        return set()
+    expected = {}
+    for slot in slots:
+        expected[slot.order_id] = expected.get(slot.order_id, 0) + 1
+    MasterSlot.objects.bulk_create(slots, batch_size=2000, ignore_conflicts=True)
+    reserved = dict(
+        MasterSlot.objects.filter(order_id__in=expected)
+        .values("order_id")
+        .annotate(count=Count("id"))
+        .values_list("order_id", "count")
+    )
+    return {order_id for order_id, count in expected.items() if reserved.get(order_id, 0) < count}
+
+
+def rebuild_slots() -> tuple[int, set[int]]:
+    """
+    Пересобирает ячейки всех предстоящих заявок. Возвращает число заявок
+    и id тех, чье время пересеклось с более ранними
+    """
+    now = timezone.now()
+    with booking_atomic():
+        MasterSlot.objects.filter(order__order_date__gte=now).delete()
+        rows = (
+            Order.objects.filter(master__isnull=False, order_date__gte=now)
+            .exclude(status__in=FREE_STATUSES)
+            .order_by("order_date", "id")
+            .annotate(minutes=Sum("services__duration"))
+        )
+        orders = list(rows.only("id", "master_id", "order_date", "status"))
+        conflicts = reserve_many(orders, {order.pk: order.minutes or 0 for order in orders})
+    return len(orders), conflicts
+
+
+def book(form):
+    """
+    Сохраняет заявку из OrderModelForm и занимает время мастера одной
+    транзакцией. Ячейки собираются один раз - после сохранения услуг
+    """
+    with booking_atomic():
+        order = form.save(commit=False)
+        # Сигналы не пересобирают ячейки по промежуточному состоянию
+        order._slots_deferred = True
+        try:
+            order.save()
+            form.save_m2m()
+        finally:
+            order._slots_deferred = False
+        reserve_slots(order, sum(service.duration for service in form.cleaned_data["services"]))
+    return order
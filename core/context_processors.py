@@ -1,5 +1,7 @@
 from django.urls import reverse
 
+from .counters import get_status_counts
+
 
 def get_main_menu(request):
     """Функция возвращает список пунктов меню для сайта"""
@@ -16,4 +18,9 @@ def get_main_menu(request):
         ]
     }
 
+    # Бейдж с количеством новых заявок - только для вошедших пользователей.
+    # Счетчик берется из кеша и не запускает подсчет по таблице заявок
+    if request.user.is_authenticated:
+        context["menu"][-1]["badge"] = get_status_counts()["new"]
+
     return context
\ No newline at end of file
@@ -0,0 +1,74 @@
+"""
+Счетчики заявок по статусам.
+
+Для фасетов в списке заявок и бейджа "новые" в меню нужны количества заявок
+по каждому статусу. Считаем их одним запросом с условной агрегацией,
+кладем в кеш и дальше поддерживаем инкрементально из сигналов Order,
+не пересчитывая таблицу на каждой странице. Инкрементально - только если
+incr бэкенда кеша атомарный (Redis), иначе изменение сбрасывает счетчики.
+"""
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import BaseCache
+from django.db.models import Count, Q
+
+CACHE_KEY = "order_status_count:{}"
+# Время жизни счетчиков: страховка от расхождений после bulk-операций,
+# которые не отправляют сигналы
+CACHE_TIMEOUT = 60 * 60
+
+
+def status_keys() -> list[str]:
+    from .models import Order
+
+    return [key for key, _ in Order.STATUS_CHOICES]
+
+
+def count_statuses(queryset=None) -> dict[str, int]:
+    """Количество заявок по всем статусам одним запросом"""
+    from .models import Order
+
+    if queryset is None:
+        queryset = Order.objects.all()
+    return queryset.aggregate(
+        **{status: Count("id", filter=Q(status=status)) for status in status_keys()}
+    )
+
+
+def get_status_counts() -> dict[str, int]:
+    """Счетчики из кеша. Если хоть одного нет - пересчитываем все разом"""
+    keys = {status: CACHE_KEY.format(status) for status in status_keys()}
+    cached = cache.get_many(keys.values())
+    if len(cached) == len(keys):
+        return {status: cached[key] for status, key in keys.items()}
+
+    counts = count_statuses()
+    cache.set_many({keys[status]: value for status, value in counts.items()}, CACHE_TIMEOUT)
+    return counts
+
+
+def atomic_incr_supported() -> bool:
+    """
+    Свой incr у бэкенда (Redis, Memcached, LocMem) атомарный. Унаследованный
+    BaseCache.incr (DatabaseCache, FileBasedCache) - это get + set, при
+    параллельных заявках сдвиги теряются
+    """
+    return type(caches["default"]).incr is not BaseCache.incr
+
+
+def change_status_count(status: str | None, delta: int) -> None:
+    """Сдвигает счетчик статуса. Отсутствующий ключ не трогаем - он пересчитается"""
+    if status not in status_keys():
+        return
+    if not atomic_incr_supported():
+        # Сдвигать неатомарно нельзя - следующее чтение пересчитает все одним запросом
+        reset_status_counts()
+        return
+    try:
+        cache.incr(CACHE_KEY.format(status), delta)
+    except ValueError:
+        pass
+
+
+def reset_status_counts() -> None:
+    cache.delete_many([CACHE_KEY.format(status) for status in status_keys()])
@@ -0,0 +1,82 @@
+"""
+Потоковая выгрузка заявок в CSV и JSONL.
+
+Заявки читаются через QuerySet.iterator(chunk_size=...): в памяти одновременно
+лежит только одна пачка строк, а услуги для нее подгружаются одним запросом
+prefetch_related на пачку. Строки отдаются генератором, поэтому ответ
+начинает уходить клиенту сразу, а память не растет с количеством заявок.
+"""
+
+import csv
+import json
+
+from django.db.models import Prefetch
+
+from .models import Order, Service
+
+EXPORT_FORMATS = ("csv", "jsonl")
+EXPORT_FIELDS = [
+    "id",
+    "created_at",
+    "order_date",
+    "status",
+    "name",
+    "phone",
+    "comment",
+    "master",
+    "services",
+]
+DEFAULT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: write возвращает строку, а не пишет ее"""
+
+    def write(self, value):
+        return value
+
+
+def export_queryset(order_filter):
+    """Отфильтрованные заявки с мастером и услугами для выгрузки"""
+    queryset = Order.objects.select_related("master").prefetch_related(
+        Prefetch("services", queryset=Service.objects.only("id", "name"))
+    )
+    return order_filter.apply(queryset, allow_ranking=False)
+
+
+def order_rows(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Генератор словарей по заявкам, читает БД пачками"""
+    for order in queryset.iterator(chunk_size=chunk_size):
+        yield {
+            "id": order.id,
+            "created_at": order.created_at.isoformat() if order.created_at else None,
+            "order_date": order.order_date.isoformat() if order.order_date else None,
+            "status": order.status,
+            "name": order.name,
+            "phone": order.phone,
+            "comment": order.comment or "",
+            "master": str(order.master) if order.master else "",
+            "services": [service.name for service in order.services.all()],
+        }
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    # Заголовок отдаем до первого запроса к БД
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        row["services"] = "; ".join(row["services"])
+        yield writer.writerow([row[field] for field in EXPORT_FIELDS])
+
+
+def stream_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def stream_orders(order_filter, export_format="csv", chunk_size=DEFAULT_CHUNK_SIZE):
+    """Генератор строк выгрузки в нужном формате"""
+    rows = order_rows(export_queryset(order_filter), chunk_size=chunk_size)
+    if export_format == "jsonl":
+        return stream_jsonl(rows)
+    return stream_csv(rows)
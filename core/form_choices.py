@@ -0,0 +1,164 @@
+"""
+Кешированные варианты выбора мастеров и услуг для форм заявки.
+
+Раньше каждая форма заявки при создании и проверке ходила в БД за мастером
+"по умолчанию", за всеми мастерами и услугами (для выпадающих списков),
+за выбранными объектами и за услугами мастера. Теперь все это - один набор
+данных в кеше:
+- мастера и услуги (только поля, нужные для подписи в списке);
+- услуги каждого мастера (множества id);
+- id мастера по умолчанию.
+
+Кеш по поколениям (счетчики core/page_cache.py): сигналы (см. core/signals.py)
+только увеличивают номер поколения, а данные лежат под ключом с номером.
+Форма, собравшая данные по старому поколению, не перезапишет ими новое,
+а старые записи просто истекут.
+"""
+
+from django import forms
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import router
+from django.forms.models import ModelChoiceIterator
+
+from .page_cache import bump_generation, get_generation
+
+GENERATION = "form_choices"
+DATA_KEY = "form_choices:{}"
+CACHE_TIMEOUT = 60 * 60
+
+# Поля, которые храним в кеше для каждой модели: для __str__
+# и длительность услуг для проверки занятости мастера (core/availability.py)
+CACHED_FIELDS = {
+    "core.master": ["id", "first_name", "last_name"],
+    "core.service": ["id", "name", "duration"],
+}
+# Мастер, выбранный в форме по умолчанию
+DEFAULT_MASTER_NAME = "Алевтина"
+
+
+def invalidate_choices() -> None:
+    bump_generation(GENERATION)
+
+
+def build_choice_data() -> dict:
+    from .models import Master, Service
+
+    masters = list(Master.objects.values_list(*CACHED_FIELDS["core.master"]))
+    services = list(Service.objects.values_list(*CACHED_FIELDS["core.service"]))
+    master_services = {}
+    for master_id, service_id in Master.services.through.objects.values_list(
+        "master_id", "service_id"
+    ):
+        master_services.setdefault(master_id, set()).add(service_id)
+
+    default_master = [row[0] for row in masters if DEFAULT_MASTER_NAME in row[1]]
+    return {
+        "core.master": masters,
+        "core.service": services,
+        "master_services": master_services,
+        # Как и раньше: мастер по умолчанию только если он единственный
+        "default_master": default_master[0] if len(default_master) == 1 else None,
+    }
+
+
+def get_choice_data() -> dict:
+    key = DATA_KEY.format(get_generation(GENERATION))
+    data = cache.get(key)
+    if data is None:
+        data = build_choice_data()
+        cache.set(key, data, CACHE_TIMEOUT)
+    return data
+
+
+def get_master_service_ids(master_id) -> set[int]:
+    return get_choice_data()["master_services"].get(master_id, set())
+
+
+def get_default_master_id() -> int | None:
+    return get_choice_data()["default_master"]
+
+
+class CachedChoiceIterator(ModelChoiceIterator):
+    """Варианты выбора из кеша вместо запроса к queryset"""
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for obj in self.field.cached_objects().values():
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.field.cached_objects()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.cached_objects())
+
+
+class CachedChoicesMixin:
+    iterator = CachedChoiceIterator
+
+    def cached_objects(self) -> dict:
+        """
+        {str(pk): объект} из кеша. Объекты собраны через Model.from_db:
+        поля не из CACHED_FIELDS отложены и подгрузятся при обращении
+        """
+        model = self.queryset.model
+        label = model._meta.label_lower
+        fields = CACHED_FIELDS[label]
+        db = router.db_for_read(model)
+        return {
+            str(row[0]): model.from_db(db, fields, row)
+            for row in get_choice_data()[label]
+        }
+
+
+class CachedModelChoiceField(CachedChoicesMixin, forms.ModelChoiceField):
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, self.queryset.model):
+            value = value.pk
+        obj = self.cached_objects().get(str(value))
+        if obj is None:
+            raise ValidationError(
+                self.error_messages["invalid_choice"],
+                code="invalid_choice",
+                params={"value": value},
+            )
+        return obj
+
+
+class CachedModelMultipleChoiceField(CachedChoicesMixin, forms.ModelMultipleChoiceField):
+    def clean(self, value):
+        value = self.prepare_value(value)
+        if not value:
+            if self.required:
+                raise ValidationError(self.error_messages["required"], code="required")
+            return []
+        if not isinstance(value, (list, tuple)):
+            raise ValidationError(self.error_messages["invalid_list"], code="invalid_list")
+
+        objects = self.cached_objects()
+        result = {}
+        for pk in value:
+            obj = objects.get(str(pk))
+            if obj is None:
+                raise ValidationError(
+                    self.error_messages["invalid_choice"],
+                    code="invalid_choice",
+                    params={"value": pk},
+                )
+            result[obj.pk] = obj
+        self.run_validators(value)
+        return list(result.values())
+
+
+def validate_master_services(master, services) -> None:
+    """Все ли выбранные услуги есть у мастера - одна разность множеств"""
+    if not master or not services:
+        return
+    missing = {service.pk for service in services} - get_master_service_ids(master.pk)
+    if missing:
+        service = next(service for service in services if service.pk in missing)
+        raise ValidationError(f'Мастер {master} не предоставляет услугу "{service}".')
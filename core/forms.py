@@ -2,6 +2,13 @@
 from django import forms
 from .models import Order, Service, Review, Master
 from django.core.exceptions import ValidationError
+from .availability import FREE_STATUSES, find_conflict
+from .form_choices import (
+    CachedModelChoiceField,
+    CachedModelMultipleChoiceField,
+    get_default_master_id,
+    validate_master_services,
+)
 import re
 
 
@@ -34,9 +41,10 @@ class OrderForm(forms.Form):
             attrs={"class": "form-control", "placeholder": "Комментарий"}
         ),
     )
-    master = forms.ModelChoiceField(
+    # Варианты выбора берутся из кеша (core/form_choices.py), а не из БД
+    master = CachedModelChoiceField(
         label="Мастер",
-        queryset=Master.objects.none(),  # Устанавливаем пустой queryset
+        queryset=Master.objects.all(),
         required=False,
         widget=forms.Select(attrs={"class": "form-control"}),
     )
@@ -50,7 +58,7 @@ class OrderForm(forms.Form):
             time_attrs={"class": "form-control", "type": "time"},
         ),
     )
-    services = forms.ModelMultipleChoiceField(
+    services = CachedModelMultipleChoiceField(
         label="Услуги",
         queryset=Service.objects.all(),
         widget=forms.SelectMultiple(attrs={"class": "form-control"}),
@@ -58,15 +66,8 @@ class OrderForm(forms.Form):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        master_field = self.fields["master"]
-        if isinstance(master_field, forms.ModelChoiceField):
-            master_field.queryset = Master.objects.all()
-            try:
-                master_field.initial = Master.objects.get(
-                    first_name__contains="Алевтина"
-                )
-            except (Master.DoesNotExist, Master.MultipleObjectsReturned):
-                pass
+        # Мастер по умолчанию тоже из кеша - без запроса на каждую форму
+        self.fields["master"].initial = get_default_master_id()
 
     def clean(self):
         cleaned_data = super().clean()
@@ -91,13 +92,7 @@ class OrderForm(forms.Form):
         master = self.cleaned_data.get("master")
         services = self.cleaned_data.get("services")
 
-        if master and services:
-            master_services = master.services.all()
-            for service in services:
-                if service not in master_services:
-                    raise ValidationError(
-                        f'Мастер {master} не предоставляет услугу "{service}".'
-                    )
+        validate_master_services(master, services)
         return services
 
 
@@ -133,6 +128,10 @@ class OrderModelForm(forms.ModelForm):
             ),
             "services": forms.SelectMultiple(attrs={"class": "form-control"}),
         }
+        field_classes = {
+            "master": CachedModelChoiceField,
+            "services": CachedModelMultipleChoiceField,
+        }
 
     def clean_phone(self):
         data = self.cleaned_data["phone"]
@@ -148,15 +147,44 @@ class OrderModelForm(forms.ModelForm):
         master = self.cleaned_data.get("master")
         services = self.cleaned_data.get("services")
 
-        if master and services:
-            master_services = master.services.all()
-            for service in services:
-                if service not in master_services:
-                    raise ValidationError(
-                        f'Мастер {master} не предоставляет услугу "{service}".'
-                    )
+        validate_master_services(master, services)
         return services
 
+    def clean(self):
+        cleaned_data = super().clean()
+        validate_master_free(cleaned_data, self.instance)
+        return cleaned_data
+
+
+def validate_master_free(cleaned_data, instance) -> None:
+    """Не пересекается ли запись с другими заявками мастера"""
+    master = cleaned_data.get("master")
+    order_date = cleaned_data.get("order_date")
+    services = cleaned_data.get("services")
+    if cleaned_data.get("status", instance.status) in FREE_STATUSES:
+        # Отмененная заявка время не занимает
+        return
+    if master and order_date and services:
+        # Занятость мастера - из БД, по тем же ячейкам сетки, что займет запись
+        duration = sum(service.duration for service in services)
+        if find_conflict(master.pk, order_date, duration, exclude_order_id=instance.pk):
+            raise ValidationError(
+                f"Мастер {master} в это время занят. Выберите другое время."
+            )
+
+
+class OrderAdminForm(forms.ModelForm):
+    """Форма заявки в админке: та же проверка занятости мастера, что и на сайте"""
+
+    class Meta:
+        model = Order
+        fields = "__all__"
+
+    def clean(self):
+        cleaned_data = super().clean()
+        validate_master_free(cleaned_data, self.instance)
+        return cleaned_data
+
 
 
 
@@ -0,0 +1,289 @@
+"""
+Обработка загруженных изображений: фото отзывов и аватары.
+
+Загрузка:
+- файлы больше FILE_UPLOAD_MAX_MEMORY_SIZE Django пишет кусками во временный
+  файл, а не держит в памяти;
+- validate_image_upload проверяет размер файла и размеры картинки по заголовку,
+  не декодируя изображение целиком.
+
+Обработка (воркер manage.py process_images):
+- после сохранения модели в очередь ставится строка ProcessedImage;
+- воркер делает квадратную миниатюру и уменьшенные копии по ширинам
+  IMAGE_VARIANT_WIDTHS в WebP, без увеличения маленьких картинок;
+- файлы вариантов учитываются хранилищем как обычные загрузки: повторная
+  обработка и удаление картинки отпускают их через release_variants;
+- шаблонные теги (core/templatetags/images.py) выбирают самый маленький
+  подходящий вариант, а пока вариантов нет - отдают оригинал.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from . import leases
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 120
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 30
+VARIANTS_CACHE_KEY = "image_variants:{}"
+VARIANTS_CACHE_TIMEOUT = 60 * 60 * 24
+# Пока картинка в очереди, пустой результат кешируем ненадолго
+PENDING_CACHE_TIMEOUT = 60
+THUMBNAIL_KEY = "thumb"
+
+
+def validate_image_upload(value) -> None:
+    """Валидатор ImageField: размер файла и размеры картинки"""
+    if not value or getattr(value, "_committed", True):
+        # Файл уже лежит в хранилище - его проверили при загрузке
+        return
+
+    max_bytes = settings.IMAGE_UPLOAD_MAX_BYTES
+    if value.size > max_bytes:
+        raise ValidationError(
+            f"Файл слишком большой: максимум {max_bytes // (1024 * 1024)} МБ."
+        )
+
+    file = value.file
+    position = file.tell()
+    try:
+        # Image.open читает только заголовок - пиксели не декодируются
+        with Image.open(file) as image:
+            width, height = image.size
+    except Exception:
+        raise ValidationError("Не удалось прочитать изображение.")
+    finally:
+        file.seek(position)
+
+    max_dimension = settings.IMAGE_MAX_DIMENSION
+    if max(width, height) > max_dimension or width * height > settings.IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            f"Изображение слишком большое: {width}x{height}, "
+            f"максимум {max_dimension} px по большей стороне."
+        )
+
+
+def variant_name(source: str, key: str) -> str:
+    base, _ = os.path.splitext(source)
+    return f"variants/{base}-{key}.webp"
+
+
+def release_variants(variants: dict) -> None:
+    """
+    Отпускает файлы вариантов. Хранилище со ссылками (core/storage.py)
+    снимает по одной ссылке, обычное - удаляет файл
+    """
+    release = getattr(default_storage, "release", default_storage.delete)
+    for variant in variants.values():
+        release(variant["name"])
+
+
+def _save_webp(image: Image.Image, name: str) -> dict:
+    buffer = io.BytesIO()
+    image.save(buffer, "WEBP", quality=settings.IMAGE_WEBP_QUALITY, method=4)
+    saved = default_storage.save(name, ContentFile(buffer.getvalue()))
+    return {
+        "name": saved,
+        "width": image.width,
+        "height": image.height,
+        "size": buffer.tell(),
+    }
+
+
+def render_variants(source: str) -> dict:
+    """Делает миниатюру и уменьшенные копии source, возвращает их описание"""
+    widths = sorted(settings.IMAGE_VARIANT_WIDTHS)
+    thumbnail_size = settings.IMAGE_THUMBNAIL_SIZE
+
+    with default_storage.open(source, "rb") as file, Image.open(file) as original:
+        # JPEG можно декодировать сразу в уменьшенном масштабе - это в разы быстрее
+        original.draft("RGB", (widths[-1], widths[-1]))
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    variants = {}
+    try:
+        variants[THUMBNAIL_KEY] = _save_webp(
+            ImageOps.fit(image, (thumbnail_size, thumbnail_size), Image.LANCZOS),
+            variant_name(source, THUMBNAIL_KEY),
+        )
+        for width in widths:
+            # Не увеличиваем: последний вариант - в исходной ширине
+            target = min(width, image.width)
+            height = max(1, round(image.height * target / image.width))
+            resized = image if target == image.width else image.resize((target, height), Image.LANCZOS)
+            variants[str(target)] = _save_webp(resized, variant_name(source, f"{target}w"))
+            if target == image.width:
+                break
+    except BaseException:
+        # Уже сохраненные варианты никуда не записаны - отпускаем их сразу
+        release_variants(variants)
+        raise
+    return variants
+
+
+# --- Очередь обработки ---
+
+
+def enqueue_image(source: str):
+    """Ставит файл в очередь (один раз на имя файла)"""
+    from .models import ProcessedImage
+
+    if not source:
+        return None
+    record, _ = ProcessedImage.objects.get_or_create(source=source)
+    return record
+
+
+def claim_images(limit: int) -> list:
+    from .models import ProcessedImage
+
+    claimed = leases.claim(ProcessedImage.objects.filter(status="pending"), limit, LEASE_SECONDS)
+    return list(ProcessedImage.objects.filter(pk__in=claimed).order_by("id"))
+
+
+def process_image(record) -> bool:
+    """Обрабатывает одну захваченную картинку. True - успешно"""
+    from .models import ProcessedImage
+
+    queryset = ProcessedImage.objects.filter(pk=record.pk, status="pending")
+    try:
+        variants = render_variants(record.source)
+    except Exception as error:
+        logger.warning("Не удалось обработать %s: %s", record.source, error)
+        if record.attempts >= MAX_ATTEMPTS:
+            queryset.update(status="failed", last_error=str(error))
+        else:
+            queryset.update(
+                available_at=timezone.now() + timedelta(seconds=RETRY_DELAY * record.attempts),
+                last_error=str(error),
+            )
+        return False
+
+    updated = queryset.update(
+        status="done", variants=variants, processed_at=timezone.now(), last_error=""
+    )
+    if not updated:
+        # Картинку успели удалить (release_image) - варианты ей не нужны
+        release_variants(variants)
+        return False
+    # Прежние варианты (повторная обработка) отпускаем после того, как записаны
+    # новые: одинаковые файлы в хранилище со ссылками не успевают пропасть
+    release_variants(record.variants)
+    cache.set(_variants_cache_key(record.source), variants, VARIANTS_CACHE_TIMEOUT)
+    return True
+
+
+def release_image(source: str) -> None:
+    """
+    Файл больше не нужен модели. Если это была последняя ссылка на него
+    (хранилище удалило файл), удаляем и его варианты.
+    """
+    from .models import ProcessedImage
+
+    if not source:
+        return
+    release = getattr(default_storage, "release", None)
+    if release is None:
+        # Обычное хранилище не считает ссылки - файлы не трогаем, как и раньше
+        return
+    if not release(source):
+        return
+    record = ProcessedImage.objects.filter(source=source).first()
+    if record is None:
+        return
+    release_variants(record.variants)
+    record.delete()
+    cache.delete(_variants_cache_key(source))
+
+
+def run_image_worker(batch_size=10, poll_interval=1.0, once=False) -> int:
+    """Цикл воркера. Возвращает количество обработанных картинок"""
+    processed = 0
+    while True:
+        records = claim_images(batch_size)
+        for record in records:
+            processed += process_image(record)
+        if records:
+            continue
+        if once:
+            return processed
+        time.sleep(poll_interval)
+
+
+def enqueue_existing() -> int:
+    """Ставит в очередь все уже загруженные фото отзывов и аватары"""
+    from django.contrib.auth import get_user_model
+
+    from .models import ProcessedImage, Review
+
+    names = set(
+        Review.objects.exclude(photo="").exclude(photo=None).values_list("photo", flat=True)
+    )
+    names |= set(
+        get_user_model()
+        .objects.exclude(avatar="")
+        .exclude(avatar=None)
+        .values_list("avatar", flat=True)
+    )
+    created = ProcessedImage.objects.bulk_create(
+        [ProcessedImage(source=name) for name in names], ignore_conflicts=True
+    )
+    return len(created)
+
+
+# --- Выбор варианта для шаблонов ---
+
+
+def _variants_cache_key(source: str) -> str:
+    return VARIANTS_CACHE_KEY.format(hashlib.sha1(source.encode()).hexdigest())
+
+
+def get_variants(source: str) -> dict:
+    """Готовые варианты картинки (из кеша, при промахе - из БД)"""
+    from .models import ProcessedImage
+
+    if not source:
+        return {}
+    key = _variants_cache_key(source)
+    variants = cache.get(key)
+    if variants is None:
+        variants = (
+            ProcessedImage.objects.filter(source=source, status="done")
+            .values_list("variants", flat=True)
+            .first()
+        ) or {}
+        cache.set(key, variants, VARIANTS_CACHE_TIMEOUT if variants else PENDING_CACHE_TIMEOUT)
+    return variants
+
+
+def width_variants(variants: dict) -> list[dict]:
+    """Варианты по ширине (без миниатюры), от меньшего к большему"""
+    return sorted(
+        (variant for key, variant in variants.items() if key != THUMBNAIL_KEY),
+        key=lambda variant: variant["width"],
+    )
+
+
+def pick_variant(variants: dict, width: int) -> dict | None:
+    """Самый маленький вариант не уже width, иначе самый большой из имеющихся"""
+    candidates = width_variants(variants)
+    for variant in candidates:
+        if variant["width"] >= width:
+            return variant
+    return candidates[-1] if candidates else None
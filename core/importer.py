@@ -0,0 +1,225 @@
+"""
+Массовый импорт заявок из CSV/JSONL.
+
+Заявки вставляются через bulk_create пачками, связи с услугами - прямой
+вставкой в Order.services.through, тоже пачками. Ни форма, ни save() не
+вызываются, поэтому сигналы (уведомления в Telegram, счетчики, поисковый
+индекс, ячейки времени мастеров) не срабатывают: индекс и ячейки обновляем
+сами после каждой пачки, счетчики и кеш расписания - в конце импорта.
+Заявки, время которых пересеклось с уже занятым, импортируются, но
+попадают в отчет (ImportResult.overlaps).
+
+Совместимость мастера и услуг проверяется по множествам, загруженным
+одним запросом до начала импорта.
+"""
+
+import csv
+import json
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .availability import invalidate_availability
+from .booking import reserve_many
+from .counters import reset_status_counts
+from .models import Master, Order, Service
+from .search import index_orders
+
+IMPORT_FORMATS = ("csv", "jsonl")
+DEFAULT_BATCH_SIZE = 1000
+STATUSES = {status for status, _ in Order.STATUS_CHOICES}
+
+
+class RowError(ValueError):
+    """Строка импорта не прошла проверку"""
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    links: int = 0
+    skipped: int = 0
+    errors: list = field(default_factory=list)
+    # id заявок, чье время пересеклось с другими заявками мастера
+    overlaps: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.created / self.elapsed if self.elapsed else 0.0
+
+
+def read_rows(file, import_format="csv"):
+    """
+    Генератор строк файла: словари для CSV, необработанные строки для JSONL.
+    JSON разбирается в OrderImporter.run - битая строка пропускается, а не
+    обрывает импорт
+    """
+    if import_format == "jsonl":
+        for line in file:
+            line = line.strip()
+            if line:
+                yield line
+    else:
+        yield from csv.DictReader(file)
+
+
+def _parse_row(row) -> dict:
+    if isinstance(row, str):
+        row = json.loads(row)
+    if not isinstance(row, dict):
+        raise RowError("Строка должна быть JSON-объектом")
+    return row
+
+
+def _parse_services(value) -> set[int]:
+    if not value:
+        return set()
+    if isinstance(value, int):
+        value = [value]
+    elif isinstance(value, str):
+        value = value.replace(";", ",").split(",")
+    return {int(item) for item in value if str(item).strip()}
+
+
+def _parse_datetime(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise RowError(f"Некорректная дата: {value}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class OrderImporter:
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, on_batch=None):
+        self.batch_size = batch_size
+        # Колбэк on_batch(result) - для вывода прогресса
+        self.on_batch = on_batch
+        # Все проверки по справочникам - по множествам в памяти
+        self.service_durations = dict(Service.objects.values_list("id", "duration"))
+        self.service_ids = set(self.service_durations)
+        self.master_services = defaultdict(set)
+        for master_id, service_id in Master.services.through.objects.values_list(
+            "master_id", "service_id"
+        ):
+            self.master_services[master_id].add(service_id)
+        self.master_ids = set(Master.objects.values_list("id", flat=True))
+
+    def build_order(self, row) -> tuple[Order, set[int], object]:
+        """Собирает несохраненную заявку и множество услуг из строки"""
+        name = (row.get("name") or "").strip()
+        phone = (row.get("phone") or "").strip()
+        if not name or not phone:
+            raise RowError("Не указаны имя или телефон")
+
+        status = row.get("status") or "new"
+        if status not in STATUSES:
+            raise RowError(f"Неизвестный статус: {status}")
+
+        master_id = int(row["master"]) if row.get("master") else None
+        if master_id is not None and master_id not in self.master_ids:
+            raise RowError(f"Мастер {master_id} не найден")
+
+        services = _parse_services(row.get("services"))
+        unknown = services - self.service_ids
+        if unknown:
+            raise RowError(f"Услуги не найдены: {sorted(unknown)}")
+        if master_id is not None:
+            foreign = services - self.master_services[master_id]
+            if foreign:
+                raise RowError(
+                    f"Мастер {master_id} не предоставляет услуги: {sorted(foreign)}"
+                )
+
+        order = Order(
+            name=name,
+            phone=phone,
+            comment=row.get("comment") or None,
+            master_id=master_id,
+            status=status,
+            order_date=_parse_datetime(row.get("order_date")),
+        )
+        order.fill_phone_search_fields()
+        return order, services, _parse_datetime(row.get("created_at"))
+
+    def flush(self, batch, result):
+        orders = [order for order, _, _ in batch]
+        with transaction.atomic():
+            Order.objects.bulk_create(orders, batch_size=self.batch_size)
+
+            # auto_now_add перезаписывает created_at при вставке - возвращаем
+            # исторические даты одним executemany (bulk_update строит CASE на всю пачку)
+            dated = [
+                (created_at, order.pk)
+                for order, _, created_at in batch
+                if created_at is not None
+            ]
+            if dated:
+                field = Order._meta.get_field("created_at")
+                with connection.cursor() as cursor:
+                    cursor.executemany(
+                        f"UPDATE {Order._meta.db_table} SET {field.column} = %s "
+                        f"WHERE {Order._meta.pk.column} = %s",
+                        [
+                            (field.get_db_prep_save(created_at, connection), pk)
+                            for created_at, pk in dated
+                        ],
+                    )
+
+            Through = Order.services.through
+            links = [
+                Through(order_id=order.pk, service_id=service_id)
+                for order, services, _ in batch
+                for service_id in services
+            ]
+            Through.objects.bulk_create(links, batch_size=self.batch_size)
+            index_orders(orders)
+
+            # Время мастеров - только у предстоящих заявок, как и в миграции 0013
+            now = timezone.now()
+            upcoming = [
+                order for order in orders if order.order_date and order.order_date >= now
+            ]
+            durations = {
+                order.pk: sum(self.service_durations[service_id] for service_id in services)
+                for order, services, _ in batch
+            }
+            result.overlaps.extend(sorted(reserve_many(upcoming, durations)))
+
+        result.created += len(orders)
+        result.links += len(links)
+
+    def run(self, rows) -> ImportResult:
+        result = ImportResult()
+        started = time.perf_counter()
+        batch = []
+        for line_number, row in enumerate(rows, start=1):
+            try:
+                batch.append(self.build_order(_parse_row(row)))
+            except (RowError, ValueError, KeyError, TypeError, AttributeError) as error:
+                # json.JSONDecodeError - тоже ValueError
+                result.skipped += 1
+                result.errors.append((line_number, str(error)))
+                continue
+
+            if len(batch) >= self.batch_size:
+                self.flush(batch, result)
+                batch = []
+                result.elapsed = time.perf_counter() - started
+                if self.on_batch:
+                    self.on_batch(result)
+
+        if batch:
+            self.flush(batch, result)
+        result.elapsed = time.perf_counter() - started
+        # Счетчики статусов пересчитаются при следующем обращении
+        reset_status_counts()
+        invalidate_availability()
+        return result
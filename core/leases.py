@@ -0,0 +1,47 @@
+"""
+Очереди задач в таблицах БД с арендой строк.
+
+Так устроены очередь модерации отзывов (core/moderation_queue.py), outbox
+уведомлений (core/notifications.py) и очередь обработки картинок
+(core/images.py): строка-задача доступна, пока ее время аренды в прошлом.
+Воркер выбирает кандидатов и захватывает каждого условным UPDATE, который
+сдвигает аренду вперед и считает попытку. Два воркера одну строку не
+получат, а строка упавшего воркера вернется в выборку, когда аренда истечет.
+"""
+
+from datetime import timedelta
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+
+def claim(
+    queryset,
+    limit: int,
+    lease_seconds: int,
+    *,
+    available=None,
+    lease_field: str = "available_at",
+    attempts_field: str = "attempts",
+    order_by=("available_at", "id"),
+) -> list[int]:
+    """
+    Захватывает до limit строк queryset, доступных сейчас, на lease_seconds.
+    available(now) -> Q - условие доступности (по умолчанию аренда истекла).
+    Возвращает id захваченных строк.
+    """
+    now = timezone.now()
+    available_q = available(now) if available else Q(**{f"{lease_field}__lte": now})
+    candidates = list(
+        queryset.filter(available_q).order_by(*order_by).values_list("id", flat=True)[:limit]
+    )
+    claimed = []
+    lease = now + timedelta(seconds=lease_seconds)
+    for pk in candidates:
+        # Условный UPDATE: строку получит только один воркер
+        updated = queryset.filter(available_q, pk=pk).update(
+            **{lease_field: lease, attempts_field: F(attempts_field) + 1}
+        )
+        if updated:
+            claimed.append(pk)
+    return claimed
@@ -0,0 +1,167 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from core.models import Master, Review
+from core.moderation_backends import load_backend, set_moderation_backend
+from core.moderation_queue import PENDING, run_worker
+
+BACKENDS = {
+    "stub": {"BACKEND": "core.moderation_backends.StubBackend"},
+    "keyword": {"BACKEND": "core.moderation_backends.KeywordBackend"},
+    "mistral": {"BACKEND": "core.moderation_backends.MistralBackend"},
+}
+BENCHMARK_NAME = "benchmark"
+# Кеш на время бенчмарка - в памяти процесса, чтобы данные одноразовой БД
+# (мастер, варианты в формах) не попали в общий кеш рабочего сайта
+BENCHMARK_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+def ms(seconds):
+    return seconds * 1000
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+class TimingBackend:
+    """Обертка бэкенда: запоминает, когда был готов ответ по каждому тексту"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = backend.name
+        self.done_at = {}
+        self._lock = threading.Lock()
+
+    def are_bad(self, texts, grades=None):
+        result = self.backend.are_bad(texts, grades)
+        now = time.perf_counter()
+        with self._lock:
+            for text in texts:
+                self.done_at[text] = now
+        return result
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест отзывов: POST в ReviewCreateView + воркер модерации. "
+        "Считает пропускную способность и p50/p99 задержки для каждого бэкенда"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--backend",
+            action="append",
+            choices=list(BACKENDS),
+            help="Какие бэкенды проверять (по умолчанию stub и keyword)",
+        )
+        parser.add_argument("--reviews", type=int, default=200)
+        parser.add_argument("--stub-latency-ms", type=int, default=50)
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument("--batch-size", type=int, default=20)
+        parser.add_argument("--max-wait-ms", type=int, default=50)
+        parser.add_argument(
+            "--timeout", type=float, default=120, help="Сколько ждать модерации, с"
+        )
+
+    def handle(self, *args, **options):
+        # Отзывы и вердикты модерации пишутся в одноразовую тестовую БД
+        # (settings.DATABASES["default"]["TEST"]), рабочая БД не затрагивается
+        database_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES):
+                master = Master.objects.create(
+                    first_name="Бенчмарк", last_name="Мастер", phone="89990000000"
+                )
+                for name in options["backend"] or ["stub", "keyword"]:
+                    self.run_backend(name, master, options)
+        finally:
+            set_moderation_backend(None)
+            connection.creation.destroy_test_db(database_name, verbosity=0)
+
+    def run_backend(self, name, master, options):
+        config = dict(BACKENDS[name])
+        if name == "stub":
+            config["OPTIONS"] = {"latency_ms": options["stub_latency_ms"]}
+        backend = TimingBackend(load_backend(config))
+        set_moderation_backend(backend)
+
+        stop = threading.Event()
+
+        def worker():
+            try:
+                run_worker(
+                    concurrency=options["concurrency"],
+                    batch_size=options["batch_size"],
+                    max_wait_ms=options["max_wait_ms"],
+                    poll_interval=0.01,
+                    stop_event=stop,
+                )
+            finally:
+                close_old_connections()
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+
+        client = Client(HTTP_HOST="127.0.0.1")
+        url = reverse("review_create")
+        posted_at = {}
+        request_latencies = []
+        started = time.perf_counter()
+        for number in range(options["reviews"]):
+            # Уникальный текст: без попаданий в кеш модерации и без локальных решений
+            text = f"Отзыв {name} {number}: подстригли неплохо, но пришлось подождать"
+            request_started = time.perf_counter()
+            response = client.post(
+                url,
+                {
+                    "client_name": BENCHMARK_NAME,
+                    "text": text,
+                    "master": master.pk,
+                    "rating": 5,
+                },
+            )
+            posted_at[text] = request_started
+            request_latencies.append(time.perf_counter() - request_started)
+            if response.status_code != 302:
+                raise CommandError(f"Отзыв не принят: HTTP {response.status_code}")
+        posted = time.perf_counter() - started
+
+        deadline = time.monotonic() + options["timeout"]
+        pending = Review.objects.filter(client_name=BENCHMARK_NAME, ai_checked_status=PENDING)
+        while pending.exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        total = time.perf_counter() - started
+        stop.set()
+        thread.join()
+
+        end_to_end = [
+            backend.done_at[text] - posted_at[text]
+            for text in posted_at
+            if text in backend.done_at
+        ]
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Бэкенд: {name}"))
+        self.stdout.write(
+            f"  POST: {len(request_latencies) / posted:.1f} отзывов/с, "
+            f"p50 {ms(percentile(request_latencies, 50)):.1f} мс, "
+            f"p99 {ms(percentile(request_latencies, 99)):.1f} мс"
+        )
+        self.stdout.write(
+            f"  До результата модерации: {len(end_to_end) / total:.1f} отзывов/с, "
+            f"p50 {ms(percentile(end_to_end, 50)):.1f} мс, "
+            f"p99 {ms(percentile(end_to_end, 99)):.1f} мс "
+            f"(проверено {len(end_to_end)} из {len(posted_at)})"
+        )
+        Review.objects.filter(client_name=BENCHMARK_NAME).delete()
@@ -0,0 +1,42 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from core.notifications import run_dispatcher
+
+
+class Command(BaseCommand):
+    help = "Диспетчер уведомлений: отправляет сообщения из outbox в Telegram"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=20, help="Сколько сообщений забирать за раз"
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=1.0, help="Пауза при пустой очереди, с"
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Разослать очередь и завершиться"
+        )
+        parser.add_argument(
+            "--digest-window",
+            type=float,
+            help="Окно дайджеста, с (0 - без дайджеста). По умолчанию из настроек",
+        )
+        parser.add_argument(
+            "--digest-max",
+            type=int,
+            help="Сколько заказов максимум в одном дайджесте",
+        )
+
+    def handle(self, *args, **options):
+        sent = asyncio.run(
+            run_dispatcher(
+                batch_size=options["batch_size"],
+                poll_interval=options["poll_interval"],
+                once=options["once"],
+                window=options["digest_window"],
+                max_orders=options["digest_max"],
+            )
+        )
+        self.stdout.write(self.style.SUCCESS(f"Отправлено уведомлений: {sent}"))
@@ -0,0 +1,56 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from core.export import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, stream_orders
+from core.models import Order
+from core.order_filters import OrderFilter
+
+
+class Command(BaseCommand):
+    help = "Потоковая выгрузка заявок в CSV или JSONL с фильтрами как в списке заявок"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+        parser.add_argument(
+            "--output", "-o", help="Файл для выгрузки. По умолчанию - stdout"
+        )
+        parser.add_argument("--q", help="Поисковый запрос")
+        parser.add_argument(
+            "--search-by",
+            action="append",
+            choices=["phone", "name", "comment"],
+            default=[],
+            help="Где искать запрос (можно указать несколько раз)",
+        )
+        parser.add_argument(
+            "--status",
+            action="append",
+            choices=[status for status, _ in Order.STATUS_CHOICES],
+            default=[],
+            help="Статус заявки (можно указать несколько раз)",
+        )
+        parser.add_argument("--order", choices=["desc", "asc"], default="desc")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        # Переводим аргументы в те же параметры, что приходят из формы списка заявок
+        params = {"order_by_date": options["order"]}
+        if options["q"]:
+            params["q"] = options["q"]
+        for field in options["search_by"]:
+            params[f"search_by_{field}"] = "true"
+        for status in options["status"]:
+            params[f"status_{status}"] = "true"
+
+        lines = stream_orders(
+            OrderFilter(params),
+            export_format=options["format"],
+            chunk_size=options["chunk_size"],
+        )
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8", newline="") as file:
+                file.writelines(lines)
+        else:
+            sys.stdout.writelines(lines)
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+
+from core.importer import DEFAULT_BATCH_SIZE, IMPORT_FORMATS, OrderImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Массовый импорт заявок из CSV/JSONL. Поля: name, phone, comment, master (id), "
+        "services (id через ; или список), status, order_date, created_at"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл с заявками")
+        parser.add_argument(
+            "--format",
+            choices=IMPORT_FORMATS,
+            help="Формат файла. По умолчанию - по расширению",
+        )
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            "--max-errors",
+            type=int,
+            default=20,
+            help="Сколько ошибок строк вывести в отчете",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        import_format = options["format"] or ("jsonl" if path.endswith(".jsonl") else "csv")
+
+        def report(result):
+            if options["verbosity"] >= 1:
+                self.stdout.write(
+                    f"Загружено {result.created} заявок, "
+                    f"{result.rate:.0f} заявок/с"
+                )
+
+        importer = OrderImporter(batch_size=options["batch_size"], on_batch=report)
+        with open(path, encoding="utf-8", newline="") as file:
+            result = importer.run(read_rows(file, import_format))
+
+        for line_number, error in result.errors[: options["max_errors"]]:
+            self.stderr.write(f"Строка {line_number}: {error}")
+        if result.overlaps:
+            shown = ", ".join(str(pk) for pk in result.overlaps[: options["max_errors"]])
+            self.stderr.write(
+                f"Время мастера пересекается с другими заявками у {len(result.overlaps)} "
+                f"заявок (id: {shown})"
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Готово: {result.created} заявок, {result.links} связей с услугами, "
+                f"пропущено {result.skipped} строк за {result.elapsed:.2f} с "
+                f"({result.rate:.0f} заявок/с)"
+            )
+        )
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+
+from core.moderation_cache import verdict_cache
+from core.moderation_queue import requeue_unchecked, run_worker
+from core import premoderation
+
+
+class Command(BaseCommand):
+    help = "Воркер модерации отзывов: проверяет отзывы из очереди через Mistral"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, default=4, help="Сколько пачек проверять параллельно"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=20, help="Максимум отзывов в одном запросе к API"
+        )
+        parser.add_argument(
+            "--max-wait-ms",
+            type=int,
+            default=200,
+            help="Сколько ждать заполнения пачки после первого отзыва, мс",
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=1.0, help="Пауза при пустой очереди, с"
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Разобрать очередь и завершиться"
+        )
+        parser.add_argument(
+            "--requeue",
+            action="store_true",
+            help="Перед запуском вернуть в очередь непроверенные отзывы (ai_checked_false)",
+        )
+
+    def handle(self, *args, **options):
+        if options["requeue"]:
+            self.stdout.write(f"Возвращено в очередь отзывов: {requeue_unchecked()}")
+
+        processed = run_worker(
+            concurrency=options["concurrency"],
+            batch_size=options["batch_size"],
+            max_wait_ms=options["max_wait_ms"],
+            poll_interval=options["poll_interval"],
+            once=options["once"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Обработано отзывов: {processed}"))
+        stats = verdict_cache.get_stats()
+        self.stdout.write(
+            f"Кеш модерации: в памяти {stats['memory_hits']}, в БД {stats['db_hits']}, "
+            f"промахов {stats['misses']} (попаданий {stats['hit_rate']:.0%})"
+        )
+        local = premoderation.stats.snapshot()
+        counters = local["counters"]
+        timings = local["timings_ms"]
+        self.stdout.write(
+            f"Локальная проверка: личные данные {counters['pii']}, мат {counters['profanity']}, "
+            f"безопасные {counters['safe']}, в API {counters['remote']}; "
+            f"без запроса к API решено {local['avoided_calls']} из {local['checked']}"
+        )
+        self.stdout.write(
+            "Время стадий, мс: "
+            + ", ".join(f"{stage} {value:.2f}" for stage, value in timings.items())
+        )
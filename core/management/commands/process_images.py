@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from core.images import enqueue_existing, run_image_worker
+
+
+class Command(BaseCommand):
+    help = "Воркер изображений: делает WebP-миниатюры и уменьшенные копии загрузок"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=10, help="Сколько картинок забирать за раз"
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=1.0, help="Пауза при пустой очереди, с"
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Разобрать очередь и завершиться"
+        )
+        parser.add_argument(
+            "--enqueue-existing",
+            action="store_true",
+            help="Перед запуском поставить в очередь все уже загруженные фото и аватары",
+        )
+
+    def handle(self, *args, **options):
+        if options["enqueue_existing"]:
+            self.stdout.write(f"Поставлено в очередь изображений: {enqueue_existing()}")
+
+        processed = run_image_worker(
+            batch_size=options["batch_size"],
+            poll_interval=options["poll_interval"],
+            once=options["once"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Обработано изображений: {processed}"))
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает сводки рейтингов мастеров по опубликованным отзывам"
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = rebuild_ratings()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"Пересчитано рейтингов мастеров: {total} за {elapsed:.2f} с")
+        )
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.availability import invalidate_availability
+from core.booking import rebuild_slots
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересобирает ячейки времени мастеров (MasterSlot) для предстоящих заявок: "
+        "после смены BOOKING_SLOT_STEP_MINUTES, длительности услуг или правок в обход сигналов"
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total, conflicts = rebuild_slots()
+        invalidate_availability()
+        elapsed = time.perf_counter() - started
+        if conflicts:
+            self.stderr.write(
+                f"Время пересекается с более ранними заявками у {len(conflicts)} заявок "
+                f"(id: {', '.join(str(pk) for pk in sorted(conflicts)[:20])})"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f"Пересобрано заявок: {total} за {elapsed:.2f} с")
+        )
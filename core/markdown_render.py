@@ -0,0 +1,95 @@
+"""
+Рендеринг Markdown для фильтра md_html.
+
+Создание markdown.Markdown с расширениями (и подсветка кода через Pygments)
+стоит дороже самой конвертации короткого текста. Поэтому:
+- готовые экземпляры Markdown лежат в пуле и переиспользуются
+  (экземпляр не потокобезопасен, поэтому каждый поток берет свой и
+  после конвертации сбрасывает его через reset());
+- готовый HTML хранится в ограниченном LRU-кеше по хешу исходного текста,
+  и повторный рендер того же блока вообще не вызывает Markdown.
+"""
+
+import hashlib
+import queue
+import threading
+from collections import OrderedDict
+
+import markdown
+
+EXTENSIONS = ["fenced_code", "codehilite", "tables"]
+# Сколько готовых экземпляров Markdown держать в пуле
+POOL_SIZE = 8
+# Сколько отрендеренных блоков держать в памяти процесса
+CACHE_SIZE = 512
+
+
+class MarkdownPool:
+    def __init__(self, extensions=None, size=POOL_SIZE):
+        self.extensions = list(extensions or EXTENSIONS)
+        self._pool = queue.LifoQueue(maxsize=size)
+
+    def _acquire(self) -> markdown.Markdown:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            # Пул пуст (все заняты другими потоками) - создаем еще один
+            return markdown.Markdown(extensions=self.extensions)
+
+    def _release(self, md: markdown.Markdown) -> None:
+        md.reset()
+        try:
+            self._pool.put_nowait(md)
+        except queue.Full:
+            pass
+
+    def convert(self, text: str) -> str:
+        md = self._acquire()
+        try:
+            return md.convert(text)
+        finally:
+            self._release(md)
+
+
+class MarkdownCache:
+    """LRU-кеш HTML по sha256 исходного текста"""
+
+    def __init__(self, pool=None, max_size=CACHE_SIZE):
+        self.pool = pool or MarkdownPool()
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def render(self, text: str) -> str:
+        key = hashlib.sha256(text.encode()).hexdigest()
+        with self._lock:
+            html = self._items.get(key)
+            if html is not None:
+                self._items.move_to_end(key)
+                self.stats["hits"] += 1
+                return html
+            self.stats["misses"] += 1
+
+        # Конвертируем вне блокировки: разные блоки рендерятся параллельно
+        html = self.pool.convert(text)
+        with self._lock:
+            self._items[key] = html
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return html
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+# Один кеш (и пул) на процесс
+markdown_cache = MarkdownCache()
+
+
+def render_markdown(text: str) -> str:
+    if not text:
+        return ""
+    return markdown_cache.render(text)
@@ -0,0 +1,70 @@
+"""
+Карта "мастер -> услуги" для формы заявки.
+
+Раньше каждое переключение мастера в форме было POST-запросом с разбором JSON
+и двумя запросами к БД. Теперь карта всех мастеров строится одним запросом
+по промежуточной таблице Master.services.through и лежит в кеше вместе с
+ETag для каждого мастера и для карты целиком. Браузер получает ее GET-запросом,
+повторные запросы с If-None-Match отвечают 304 без тела.
+
+Кеш сбрасывается сигналами (m2m_changed на Master.services.through,
+изменение и удаление мастеров и услуг) - см. core/signals.py.
+"""
+
+import hashlib
+import json
+
+from django.core.cache import cache
+
+CACHE_KEY = "master_services:map"
+# Страховка на случай изменений в обход сигналов (bulk-операции, правка в БД)
+CACHE_TIMEOUT = 60 * 60
+
+
+def make_etag(payload) -> str:
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return '"%s"' % hashlib.sha256(data.encode()).hexdigest()[:32]
+
+
+def build_services_map() -> dict:
+    """
+    Строит карту одним запросом к связям (плюс один - за списком мастеров,
+    чтобы мастера без услуг тоже попали в карту с пустым списком)
+    """
+    from .models import Master
+
+    masters = {
+        str(master_id): [] for master_id in Master.objects.values_list("id", flat=True)
+    }
+    links = (
+        Master.services.through.objects.order_by("master_id", "service__name", "service_id")
+        .values_list("master_id", "service_id", "service__name")
+    )
+    for master_id, service_id, name in links:
+        masters.setdefault(str(master_id), []).append({"id": service_id, "name": name})
+
+    return {
+        "etag": make_etag(masters),
+        "masters": {
+            master_id: {"services": services, "etag": make_etag(services)}
+            for master_id, services in masters.items()
+        },
+    }
+
+
+def get_services_map() -> dict:
+    """Карта из кеша, при промахе - строим и кладем в кеш"""
+    services_map = cache.get(CACHE_KEY)
+    if services_map is None:
+        services_map = build_services_map()
+        cache.set(CACHE_KEY, services_map, CACHE_TIMEOUT)
+    return services_map
+
+
+def get_master_services(master_id) -> dict | None:
+    """{"services": [...], "etag": ...} или None, если мастера нет"""
+    return get_services_map()["masters"].get(str(master_id))
+
+
+def invalidate_services_map() -> None:
+    cache.delete(CACHE_KEY)
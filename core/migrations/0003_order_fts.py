@@ -0,0 +1,35 @@
+from django.db import migrations
+
+FTS_TABLE = "core_order_fts"
+
+
+def create_fts(apps, schema_editor):
+    # FTS5 есть только в SQLite - на других СУБД поиск остается на icontains
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+        "USING fts5(phone, name, comment, tokenize='unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE} (rowid, phone, name, comment) "
+        "SELECT id, COALESCE(phone, ''), COALESCE(name, ''), COALESCE(comment, '') "
+        "FROM core_order"
+    )
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0002_order_created_id_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
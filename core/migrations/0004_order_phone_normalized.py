@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+from core.phones import normalize_phone
+
+
+def backfill_phone_search_fields(apps, schema_editor):
+    # Заполняем служебные поля у существующих заявок пачками
+    Order = apps.get_model("core", "Order")
+    batch = []
+    for order in Order.objects.only("id", "phone").iterator(chunk_size=2000):
+        order.phone_normalized = normalize_phone(order.phone)
+        order.phone_reversed = order.phone_normalized[::-1]
+        batch.append(order)
+        if len(batch) >= 2000:
+            Order.objects.bulk_update(batch, ["phone_normalized", "phone_reversed"])
+            batch = []
+    if batch:
+        Order.objects.bulk_update(batch, ["phone_normalized", "phone_reversed"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_order_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='phone_normalized',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20, verbose_name='Телефон (цифры)'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='phone_reversed',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20, verbose_name='Телефон (цифры в обратном порядке)'),
+        ),
+        migrations.RunPython(backfill_phone_search_fields, migrations.RunPython.noop),
+    ]
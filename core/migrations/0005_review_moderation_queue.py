@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_order_phone_normalized'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='ai_attempts',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Попыток проверки ИИ'),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='ai_locked_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Проверка заблокирована до'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['ai_checked_status', 'created_at'], name='review_ai_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:59
+
+import core.images
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_order_status_created_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='review',
+            name='photo',
+            field=models.ImageField(blank=True, null=True, upload_to='reviews/', validators=[core.images.validate_image_upload], verbose_name='Фотография'),
+        ),
+        migrations.CreateModel(
+            name='ProcessedImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True, verbose_name='Исходный файл')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает обработки'), ('done', 'Готово'), ('failed', 'Ошибка обработки')], default='pending', max_length=20, verbose_name='Статус')),
+                ('variants', models.JSONField(blank=True, default=dict, verbose_name='Варианты')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Доступно с')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата обработки')),
+            ],
+            options={
+                'verbose_name': 'Обработанное изображение',
+                'verbose_name_plural': 'Обработанные изображения',
+                'indexes': [models.Index(fields=['status', 'available_at'], name='image_queue_idx')],
+            },
+        ),
+    ]
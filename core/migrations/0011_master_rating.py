@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_master_ratings(apps, schema_editor):
+    # Сводки по уже опубликованным отзывам - как rebuild_ratings() из core/ratings.py
+    Review = apps.get_model("core", "Review")
+    MasterRating = apps.get_model("core", "MasterRating")
+    rows = (
+        Review.objects.filter(
+            is_published=True, ai_checked_status="ai_checked_true", master__isnull=False
+        )
+        .values("master_id")
+        .annotate(
+            review_count=Count("id"),
+            rating_sum=Sum("rating"),
+            **{f"count_{rating}": Count("id", filter=Q(rating=rating)) for rating in range(1, 6)},
+        )
+    )
+    MasterRating.objects.bulk_create([MasterRating(**row) for row in rows], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_stored_file'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MasterRating',
+            fields=[
+                ('master', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating', serialize=False, to='core.master', verbose_name='Мастер')),
+                ('review_count', models.PositiveIntegerField(default=0, verbose_name='Отзывов')),
+                ('rating_sum', models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')),
+                ('count_1', models.PositiveIntegerField(default=0, verbose_name='Оценок 1')),
+                ('count_2', models.PositiveIntegerField(default=0, verbose_name='Оценок 2')),
+                ('count_3', models.PositiveIntegerField(default=0, verbose_name='Оценок 3')),
+                ('count_4', models.PositiveIntegerField(default=0, verbose_name='Оценок 4')),
+                ('count_5', models.PositiveIntegerField(default=0, verbose_name='Оценок 5')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг мастера',
+                'verbose_name_plural': 'Рейтинги мастеров',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(condition=models.Q(('ai_checked_status', 'ai_checked_true'), ('is_published', True)), fields=['master', 'created_at', 'id'], name='review_master_feed_idx'),
+        ),
+        migrations.RunPython(backfill_master_ratings, migrations.RunPython.noop),
+    ]
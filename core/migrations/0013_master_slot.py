@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+from django.utils import timezone
+
+from core.booking import slot_starts
+
+
+def backfill_master_slots(apps, schema_editor):
+    # Занимаем время предстоящих заявок. Уже пересекающиеся заявки
+    # (записаны до появления ячеек) пропускаем, а не роняем миграцию
+    Order = apps.get_model("core", "Order")
+    MasterSlot = apps.get_model("core", "MasterSlot")
+    rows = (
+        Order.objects.filter(master__isnull=False, order_date__gte=timezone.now())
+        .exclude(status="cancelled")
+        .order_by("order_date", "id")
+        .annotate(minutes=Sum("services__duration"))
+        .values_list("id", "master_id", "order_date", "minutes")
+    )
+    slots = [
+        MasterSlot(master_id=master_id, starts_at=starts_at, order_id=order_id)
+        for order_id, master_id, order_date, minutes in rows
+        if minutes
+        for starts_at in slot_starts(order_date, minutes)
+    ]
+    MasterSlot.objects.bulk_create(slots, batch_size=2000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_order_master_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MasterSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('starts_at', models.DateTimeField(verbose_name='Начало ячейки')),
+                ('master', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='core.master', verbose_name='Мастер')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='core.order', verbose_name='Заявка')),
+            ],
+            options={
+                'verbose_name': 'Занятое время мастера',
+                'verbose_name_plural': 'Занятое время мастеров',
+                'constraints': [models.UniqueConstraint(fields=('master', 'starts_at'), name='master_slot_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_master_slots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Now
+
+
+def backfill_created_at(apps, schema_editor):
+    # Старые заявки без даты создания: берем дату обновления или дату заказа
+    Order = apps.get_model("core", "Order")
+    Order.objects.filter(created_at__isnull=True).update(
+        created_at=Coalesce("updated_at", "order_date", Now())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_master_slot'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_created_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='Дата создания'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:19
+
+from django.db import migrations, models
+
+from core.name_search import fold_name
+
+
+def backfill_name_search(apps, schema_editor):
+    Master = apps.get_model("core", "Master")
+    Service = apps.get_model("core", "Service")
+    masters = list(Master.objects.only("id", "last_name", "first_name"))
+    for master in masters:
+        master.last_name_search = fold_name(master.last_name)
+        master.first_name_search = fold_name(master.first_name)
+    Master.objects.bulk_update(masters, ["last_name_search", "first_name_search"], batch_size=2000)
+    services = list(Service.objects.only("id", "name"))
+    for service in services:
+        service.name_search = fold_name(service.name)
+    Service.objects.bulk_update(services, ["name_search"], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_order_created_at_not_null'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='master',
+            name='first_name_search',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100, verbose_name='Имя (для поиска)'),
+        ),
+        migrations.AddField(
+            model_name='master',
+            name='last_name_search',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100, verbose_name='Фамилия (для поиска)'),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='name_search',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=200, verbose_name='Название (для поиска)'),
+        ),
+        migrations.RunPython(backfill_name_search, migrations.RunPython.noop),
+    ]
@@ -2,7 +2,8 @@
 from barbershop.settings import MISTRAL_MODERATIONS_GRADES
 import os
 from dotenv import load_dotenv
-from mistralai import Mistral
+from .moderation_client import get_moderation_client
+from .moderation_backends import MistralBackend
 from pprint import pprint
 
 
@@ -11,26 +12,13 @@ load_dotenv()
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
 
 
-def is_bad_review(
-    review_text: str,
-    api_key: str = MISTRAL_API_KEY,
-    grades: dict = MISTRAL_MODERATIONS_GRADES,
-) -> bool:
-    # Создаем клиента Mistral с переданным API ключом
-    client = Mistral(api_key=api_key)
+MODERATION_MODEL = "mistral-moderation-latest"
 
-    # Формируем запрос
-    response = client.classifiers.moderate_chat(
-        model="mistral-moderation-latest",
-        inputs=[{"role": "user", "content": review_text}],
-    )
-    # Вытаскиваем данные с оценкой
-    result = response.results[0].category_scores
 
+def scores_to_verdict(category_scores: dict, grades: dict = MISTRAL_MODERATIONS_GRADES) -> bool:
+    """Сверяет оценки категорий с порогами MISTRAL_MODERATIONS_GRADES"""
     # Округляем значения до двух знаков после запятой
-    result = {key: round(value, 2) for key, value in result.items()}
-
-    pprint(result)
+    result = {key: round(value, 2) for key, value in category_scores.items()}
 
     # Словарь под результаты проверки
     checked_result = {}
@@ -43,7 +31,45 @@ def is_bad_review(
     return any(checked_result.values())
 
 
+def are_bad_reviews(
+    review_texts: list[str],
+    api_key: str = MISTRAL_API_KEY,
+    grades: dict = MISTRAL_MODERATIONS_GRADES,
+) -> list[bool]:
+    """
+    Проверяет пачку отзывов одним запросом к API.
+    moderate_chat принимает список диалогов - каждый отзыв отправляется
+    отдельным диалогом из одного сообщения (см. MistralBackend), результаты
+    приходят в том же порядке.
+    """
+    return MistralBackend(api_key=api_key).are_bad(review_texts, grades)
+
+
+def is_bad_review(
+    review_text: str,
+    api_key: str = MISTRAL_API_KEY,
+    grades: dict = MISTRAL_MODERATIONS_GRADES,
+) -> bool:
+    # Берем общий клиент Mistral для переданного API ключа
+    client = get_moderation_client(api_key)
+
+    # Формируем запрос и вытаскиваем данные с оценкой
+    result = client.moderate_chat(
+        model=MODERATION_MODEL,
+        inputs=[{"role": "user", "content": review_text}],
+    )[0]
+
+    pprint(result)
+
+    return scores_to_verdict(result, grades)
+
+
 if __name__ == "__main__":
+    # Запуск: python -m core.mistral (клиенту нужны настройки Django)
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "barbershop.settings")
+    django.setup()
     print(
         is_bad_review("Классно подстригли. Меня зовут Семен, номер телефона +79111111111")
     )
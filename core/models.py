@@ -1,4 +1,9 @@
 from django.db import models
+from django.utils import timezone
+
+from .images import validate_image_upload
+from .name_search import fold_name
+from .phones import normalize_phone
 
 
 class Master(models.Model):
@@ -12,10 +17,27 @@ class Master(models.Model):
     )
     email = models.EmailField(null=True, blank=True, verbose_name="Email")
     services = models.ManyToManyField("Service", verbose_name="Услуги", related_name="masters")
+    # Служебные колонки для поиска по началу имени (заполняются в save)
+    last_name_search = models.CharField(
+        max_length=100, blank=True, default="", editable=False, db_index=True,
+        verbose_name="Фамилия (для поиска)",
+    )
+    first_name_search = models.CharField(
+        max_length=100, blank=True, default="", editable=False, db_index=True,
+        verbose_name="Имя (для поиска)",
+    )
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
+    def save(self, *args, **kwargs):
+        self.last_name_search = fold_name(self.last_name)
+        self.first_name_search = fold_name(self.first_name)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"last_name", "first_name"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "last_name_search", "first_name_search"}
+        super().save(*args, **kwargs)
+
     class Meta:
         # на русском языке - в ед. числе и мн. числе
         verbose_name = "Мастер"
@@ -36,6 +58,15 @@ class Order(models.Model):
     
     name  = models.CharField(max_length=100, verbose_name="Имя")
     phone = models.CharField(max_length=20, verbose_name="Телефон")
+    # Служебные колонки для поиска по телефону (заполняются в save)
+    phone_normalized = models.CharField(
+        max_length=20, blank=True, default="", editable=False, db_index=True,
+        verbose_name="Телефон (цифры)",
+    )
+    phone_reversed = models.CharField(
+        max_length=20, blank=True, default="", editable=False, db_index=True,
+        verbose_name="Телефон (цифры в обратном порядке)",
+    )
     comment = models.TextField(verbose_name="Комментарий", null=True, blank=True)
     master = models.ForeignKey(
         Master,
@@ -61,16 +92,51 @@ class Order(models.Model):
     order_date = models.DateTimeField(
         verbose_name="Дата заказа", null=True, default=None
     )
-    created_at = models.DateTimeField(
-        auto_now_add=True, verbose_name="Дата создания", null=True, blank=True
-    )
+    # Не NULL: по (created_at, id) строится курсорная пагинация списка заявок
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(
         auto_now=True, verbose_name="Дата обновления", null=True, blank=True
     )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем статус из БД, чтобы сигналы могли сдвинуть счетчики статусов
+        if "status" in field_names:
+            instance._loaded_status = instance.status
+        # И время записи - по нему сигналы решают, пересобирать ли ячейки MasterSlot
+        if {"master_id", "order_date", "status"} <= set(field_names):
+            instance._loaded_booking = instance.booking_state()
+        return instance
+
+    def booking_state(self):
+        return (self.master_id, self.order_date, self.status)
+
+    def fill_phone_search_fields(self):
+        """Заполняет служебные поля поиска по телефону. Нужна и для bulk_create"""
+        self.phone_normalized = normalize_phone(self.phone)
+        self.phone_reversed = self.phone_normalized[::-1]
+
+    def save(self, *args, **kwargs):
+        self.fill_phone_search_fields()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "phone" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "phone_normalized", "phone_reversed"}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
+        indexes = [
+            # Составной индекс под курсорную пагинацию списка заявок
+            models.Index(fields=["created_at", "id"], name="order_created_id_idx"),
+            # Список заявок в админке с фильтром по статусу
+            models.Index(
+                fields=["status", "created_at", "id"], name="order_status_created_idx"
+            ),
+            # Занятость мастера по датам (core/availability.py)
+            models.Index(fields=["master", "order_date"], name="order_master_date_idx"),
+        ]
 
 
 class Review(models.Model):
@@ -98,7 +164,11 @@ class Review(models.Model):
         Master, on_delete=models.SET_NULL, null=True, verbose_name="Мастер"
     )
     photo = models.ImageField(
-        upload_to="reviews/", blank=True, null=True, verbose_name="Фотография"
+        upload_to="reviews/",
+        blank=True,
+        null=True,
+        validators=[validate_image_upload],
+        verbose_name="Фотография",
     )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     rating = models.PositiveSmallIntegerField(
@@ -112,9 +182,110 @@ class Review(models.Model):
         default="ai_checked_false",
         verbose_name="Статус ИИ",
     )
+    # Служебные поля очереди модерации (см. core/moderation_queue.py)
+    ai_locked_until = models.DateTimeField(
+        null=True, blank=True, editable=False,
+        verbose_name="Проверка заблокирована до",
+    )
+    ai_attempts = models.PositiveSmallIntegerField(
+        default=0, editable=False, verbose_name="Попыток проверки ИИ"
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем, как отзыв учитывался в рейтинге мастера (см. core/ratings.py)
+        if {"master_id", "rating", "is_published", "ai_checked_status"} <= set(field_names):
+            instance._loaded_rating_state = instance.rating_state()
+        return instance
+
+    def is_visible(self) -> bool:
+        """Опубликован администратором и одобрен модерацией"""
+        return self.is_published and self.ai_checked_status == "ai_checked_true"
+
+    def rating_state(self):
+        """(мастер, оценка), если отзыв входит в рейтинг мастера, иначе None"""
+        if self.master_id is None or not self.is_visible():
+            return None
+        return (self.master_id, self.rating)
+
     class Meta:
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
+        indexes = [
+            # Выборка очереди на модерацию: статус + порядок поступления
+            models.Index(
+                fields=["ai_checked_status", "created_at"], name="review_ai_queue_idx"
+            ),
+            # Лента опубликованных отзывов мастера с курсорной пагинацией.
+            # Частичный индекс: в нем только видимые отзывы, условие совпадает
+            # с core.ratings.VISIBLE_Q
+            models.Index(
+                fields=["master", "created_at", "id"],
+                condition=models.Q(is_published=True, ai_checked_status="ai_checked_true"),
+                name="review_master_feed_idx",
+            ),
+        ]
+
+
+class ModerationVerdict(models.Model):
+    """
+    Сохраненный результат модерации текста (постоянный уровень кеша модерации).
+    Ключ - хеш нормализованного текста и действующих порогов MISTRAL_MODERATIONS_GRADES.
+    """
+
+    key = models.CharField(max_length=64, primary_key=True, verbose_name="Ключ")
+    is_bad = models.BooleanField(verbose_name="Отклонен")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    expires_at = models.DateTimeField(db_index=True, verbose_name="Действует до")
+
+    class Meta:
+        verbose_name = "Результат модерации"
+        verbose_name_plural = "Результаты модерации"
+
+
+class NotificationOutbox(models.Model):
+    """
+    Исходящие уведомления в Telegram (transactional outbox).
+    Запись создается в той же транзакции, что и заявка, а отправляет ее
+    отдельный процесс manage.py dispatch_notifications.
+    """
+
+    STATUS_CHOICES = [
+        ("pending", "Ожидает отправки"),
+        ("sent", "Отправлено"),
+        ("failed", "Ошибка отправки"),
+    ]
+
+    chat_id = models.CharField(max_length=64, verbose_name="Чат")
+    text = models.TextField(verbose_name="Текст")
+    parse_mode = models.CharField(
+        max_length=20, default="Markdown", blank=True, verbose_name="Разметка"
+    )
+    order = models.ForeignKey(
+        "Order",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="notifications",
+        verbose_name="Заказ",
+    )
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default="pending", verbose_name="Статус"
+    )
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    # До этого момента сообщение не берется в работу: аренда диспетчером или пауза перед повтором
+    available_at = models.DateTimeField(default=timezone.now, verbose_name="Доступно с")
+    last_error = models.TextField(blank=True, default="", verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата отправки")
+
+    class Meta:
+        verbose_name = "Уведомление"
+        verbose_name_plural = "Уведомления"
+        indexes = [
+            models.Index(fields=["status", "available_at"], name="outbox_queue_idx"),
+        ]
 
 
 class Service(models.Model):
@@ -125,10 +296,155 @@ class Service(models.Model):
         verbose_name="Длительность", help_text="Время выполнения в минутах", default=20
     )
     is_popular = models.BooleanField(default=False, verbose_name="Популярная услуга")
+    # Служебная колонка для поиска по началу названия (заполняется в save)
+    name_search = models.CharField(
+        max_length=200, blank=True, default="", editable=False, db_index=True,
+        verbose_name="Название (для поиска)",
+    )
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.name_search = fold_name(self.name)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "name" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "name_search"}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Услуга"
         verbose_name_plural = "Услуги"
+
+
+class ProcessedImage(models.Model):
+    """
+    Уменьшенные WebP-копии загруженного изображения (фото отзыва, аватар).
+    Строка одновременно задача для воркера manage.py process_images
+    и справочник готовых вариантов для шаблонов (см. core/images.py).
+    """
+
+    STATUS_CHOICES = [
+        ("pending", "Ожидает обработки"),
+        ("done", "Готово"),
+        ("failed", "Ошибка обработки"),
+    ]
+
+    # Имя исходного файла в хранилище (FieldFile.name)
+    source = models.CharField(max_length=255, unique=True, verbose_name="Исходный файл")
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default="pending", verbose_name="Статус"
+    )
+    # {"thumb": {...}, "320": {"name": ..., "width": ..., "height": ..., "size": ...}, ...}
+    variants = models.JSONField(default=dict, blank=True, verbose_name="Варианты")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    available_at = models.DateTimeField(default=timezone.now, verbose_name="Доступно с")
+    last_error = models.TextField(blank=True, default="", verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата обработки")
+
+    class Meta:
+        verbose_name = "Обработанное изображение"
+        verbose_name_plural = "Обработанные изображения"
+        indexes = [
+            models.Index(fields=["status", "available_at"], name="image_queue_idx"),
+        ]
+
+    def __str__(self):
+        return self.source
+
+
+class StoredFile(models.Model):
+    """
+    Файл в контентно-адресуемом хранилище (core/storage.py).
+    refcount - сколько сохранений ссылается на этот файл.
+    """
+
+    name = models.CharField(max_length=255, primary_key=True, verbose_name="Имя файла")
+    sha256 = models.CharField(max_length=64, verbose_name="SHA-256")
+    size = models.PositiveBigIntegerField(verbose_name="Размер, байт")
+    refcount = models.PositiveIntegerField(default=1, verbose_name="Ссылок")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+
+    class Meta:
+        verbose_name = "Файл хранилища"
+        verbose_name_plural = "Файлы хранилища"
+
+    def __str__(self):
+        return self.name
+
+
+class MasterRating(models.Model):
+    """
+    Сводка оценок мастера по опубликованным отзывам.
+    Поддерживается инкрементально сигналами (core/ratings.py),
+    пересчитывается командой manage.py rebuild_master_ratings.
+    """
+
+    master = models.OneToOneField(
+        Master,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="rating",
+        verbose_name="Мастер",
+    )
+    review_count = models.PositiveIntegerField(default=0, verbose_name="Отзывов")
+    rating_sum = models.PositiveIntegerField(default=0, verbose_name="Сумма оценок")
+    # Гистограмма: сколько отзывов с каждой оценкой
+    count_1 = models.PositiveIntegerField(default=0, verbose_name="Оценок 1")
+    count_2 = models.PositiveIntegerField(default=0, verbose_name="Оценок 2")
+    count_3 = models.PositiveIntegerField(default=0, verbose_name="Оценок 3")
+    count_4 = models.PositiveIntegerField(default=0, verbose_name="Оценок 4")
+    count_5 = models.PositiveIntegerField(default=0, verbose_name="Оценок 5")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Рейтинг мастера"
+        verbose_name_plural = "Рейтинги мастеров"
+
+    def __str__(self):
+        return f"{self.master}: {self.average:.1f} ({self.review_count})"
+
+    @property
+    def average(self) -> float:
+        return self.rating_sum / self.review_count if self.review_count else 0.0
+
+    @property
+    def histogram(self) -> list[dict]:
+        """[{rating, count, percent}] от 5 к 1 - для полосок в шаблоне"""
+        return [
+            {
+                "rating": rating,
+                "count": getattr(self, f"count_{rating}"),
+                "percent": round(100 * getattr(self, f"count_{rating}") / self.review_count)
+                if self.review_count
+                else 0,
+            }
+            for rating in range(5, 0, -1)
+        ]
+
+
+class MasterSlot(models.Model):
+    """
+    Занятая ячейка сетки записи (BOOKING_SLOT_STEP_MINUTES) мастера.
+    Уникальность (мастер, начало) не дает двум заявкам занять одно время
+    даже при одновременной записи - см. core/booking.py.
+    """
+
+    master = models.ForeignKey(
+        Master, on_delete=models.CASCADE, related_name="slots", verbose_name="Мастер"
+    )
+    starts_at = models.DateTimeField(verbose_name="Начало ячейки")
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, related_name="slots", verbose_name="Заявка"
+    )
+
+    class Meta:
+        verbose_name = "Занятое время мастера"
+        verbose_name_plural = "Занятое время мастеров"
+        constraints = [
+            models.UniqueConstraint(fields=["master", "starts_at"], name="master_slot_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.master}: {self.starts_at:%Y-%m-%d %H:%M}"
@@ -0,0 +1,128 @@
+"""
+Бэкенды модерации отзывов.
+
+Воркер модерации не знает, кто проверяет тексты: бэкенд выбирается
+настройкой MODERATION_BACKEND (по аналогии с EMAIL_BACKEND):
+
+    MODERATION_BACKEND = {
+        "BACKEND": "core.moderation_backends.StubBackend",
+        "OPTIONS": {"latency_ms": 50},
+    }
+
+- MistralBackend - настоящая проверка через API Mistral;
+- StubBackend - детерминированная заглушка с заданной задержкой и оценками,
+  для нагрузочных тестов без сети;
+- KeywordBackend - офлайн-проверка по словарю и регуляркам личных данных.
+
+Бэкенд возвращает оценки категорий, а решение принимается одинаково для всех -
+по порогам MISTRAL_MODERATIONS_GRADES.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class BaseModerationBackend:
+    # Имя бэкенда входит в ключ кеша модерации, чтобы ответы заглушки
+    # не выдавались за ответы настоящего API
+    name = "base"
+
+    def moderate(self, texts: list[str]) -> list[dict]:
+        """Оценки категорий для каждого текста"""
+        raise NotImplementedError
+
+    def are_bad(self, texts: list[str], grades: dict | None = None) -> list[bool]:
+        from .mistral import scores_to_verdict
+
+        if not texts:
+            return []
+        if grades is None:
+            grades = settings.MISTRAL_MODERATIONS_GRADES
+        return [scores_to_verdict(scores, grades) for scores in self.moderate(texts)]
+
+
+class MistralBackend(BaseModerationBackend):
+    name = "mistral"
+
+    def __init__(self, api_key=None, model=None):
+        from .mistral import MISTRAL_API_KEY, MODERATION_MODEL
+
+        self.api_key = api_key or MISTRAL_API_KEY
+        self.model = model or MODERATION_MODEL
+
+    def moderate(self, texts):
+        from .moderation_client import get_moderation_client
+
+        results = get_moderation_client(self.api_key).moderate_chat(
+            model=self.model,
+            inputs=[[{"role": "user", "content": text}] for text in texts],
+        )
+        if len(results) != len(texts):
+            raise ValueError(
+                f"Ожидали {len(texts)} результатов модерации, получили {len(results)}"
+            )
+        return results
+
+
+class StubBackend(BaseModerationBackend):
+    """Заглушка: ждет latency_ms на каждый вызов и отдает одинаковые оценки"""
+
+    name = "stub"
+
+    def __init__(self, latency_ms=0, scores=None):
+        self.latency_ms = latency_ms
+        self.scores = scores or {}
+
+    def moderate(self, texts):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return [dict(self.scores) for _ in texts]
+
+
+class KeywordBackend(BaseModerationBackend):
+    """Офлайн-проверка регулярками из core.premoderation"""
+
+    name = "keyword"
+
+    def moderate(self, texts):
+        from .premoderation import EMAIL_RE, PHONE_RE, PROFANITY_RE
+
+        results = []
+        for text in texts:
+            has_pii = bool(PHONE_RE.search(text) or EMAIL_RE.search(text))
+            has_profanity = bool(PROFANITY_RE.search(text))
+            results.append(
+                {
+                    "pii": 1.0 if has_pii else 0.0,
+                    "hate_and_discrimination": 1.0 if has_profanity else 0.0,
+                }
+            )
+        return results
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def load_backend(config: dict) -> BaseModerationBackend:
+    backend_class = import_string(config["BACKEND"])
+    return backend_class(**config.get("OPTIONS", {}))
+
+
+def get_moderation_backend() -> BaseModerationBackend:
+    """Бэкенд из настройки MODERATION_BACKEND, один на процесс"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = load_backend(settings.MODERATION_BACKEND)
+        return _backend
+
+
+def set_moderation_backend(backend: BaseModerationBackend | None) -> None:
+    """Подменяет бэкенд процесса (None - снова взять из настроек)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
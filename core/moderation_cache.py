@@ -0,0 +1,152 @@
+"""
+Кеш результатов модерации.
+
+Многие отзывы совпадают ("Отлично!", "Спасибо"), а каждая проверка - это
+запрос к Mistral. Результат запоминаем по хешу нормализованного текста
+и действующих порогов MISTRAL_MODERATIONS_GRADES (при смене порогов ключи
+меняются и старые ответы больше не используются).
+
+Два уровня:
+- LRU-словарь в памяти процесса (ответ за микросекунды), с тем же сроком
+  жизни записи, что и в БД;
+- таблица ModerationVerdict в БД с TTL (общая для всех воркеров, переживает перезапуск).
+"""
+
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ModerationVerdict
+
+# "@", "." и "+" остаются в ключе: "a@b.ru" или "+7..." - почта и телефон
+# (личные данные), а "a b ru" - уже нет, и вердикты у них разные
+PUNCTUATION_RE = re.compile(r"[^\w@.+]+", re.UNICODE)
+
+
+def normalize_text(text: str) -> str:
+    """Регистр, ё/е, пунктуация и лишние пробелы не влияют на ключ"""
+    text = (text or "").casefold().replace("ё", "е")
+    # Точки в конце слов - конец предложения, а не часть адреса
+    words = (word.rstrip(".") for word in PUNCTUATION_RE.sub(" ", text).split())
+    return " ".join(word for word in words if word)
+
+
+def make_key(text: str, grades: dict, namespace: str = "") -> str:
+    """namespace - имя бэкенда модерации, у каждого бэкенда свои ответы"""
+    payload = json.dumps(
+        [namespace, normalize_text(text), sorted(grades.items())], ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class VerdictCache:
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = max_size or settings.MODERATION_CACHE_SIZE
+        self.ttl = ttl or settings.MODERATION_CACHE_TTL
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+    def _remember(self, key, is_bad, expires_at):
+        # Вызывается под self._lock
+        self._memory[key] = (is_bad, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys) -> dict[str, bool]:
+        """Ищет ключи сначала в памяти, затем одним запросом в БД"""
+        found = {}
+        now = timezone.now()
+        with self._lock:
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry is None:
+                    continue
+                is_bad, expires_at = entry
+                if expires_at <= now:
+                    # Просрочен - как и в БД, больше не используем
+                    del self._memory[key]
+                    continue
+                self._memory.move_to_end(key)
+                found[key] = is_bad
+            self.stats["memory_hits"] += len(found)
+
+        missing = [key for key in keys if key not in found]
+        if missing:
+            rows = ModerationVerdict.objects.filter(
+                key__in=missing, expires_at__gt=now
+            ).values_list("key", "is_bad", "expires_at")
+            with self._lock:
+                for key, is_bad, expires_at in rows:
+                    found[key] = is_bad
+                    self._remember(key, is_bad, expires_at)
+                    self.stats["db_hits"] += 1
+                self.stats["misses"] += len(keys) - len(found)
+        return found
+
+    def set_many(self, verdicts: dict[str, bool]) -> None:
+        if not verdicts:
+            return
+        expires_at = timezone.now() + timedelta(seconds=self.ttl)
+        ModerationVerdict.objects.bulk_create(
+            [
+                ModerationVerdict(key=key, is_bad=is_bad, expires_at=expires_at)
+                for key, is_bad in verdicts.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["key"],
+            update_fields=["is_bad", "expires_at"],
+        )
+        with self._lock:
+            for key, is_bad in verdicts.items():
+                self._remember(key, is_bad, expires_at)
+
+    def purge_expired(self) -> int:
+        """Удаляет из БД просроченные записи"""
+        deleted, _ = ModerationVerdict.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats, memory_size=len(self._memory))
+        lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["memory_hits"] + stats["db_hits"]) / lookups if lookups else 0.0
+        )
+        return stats
+
+
+# Один кеш на процесс
+verdict_cache = VerdictCache()
+
+
+def cached_verdicts(texts: list[str], check_texts, grades=None, namespace="") -> list[bool]:
+    """
+    Возвращает результаты модерации для texts. В check_texts (например,
+    backend.are_bad) уходят только уникальные тексты, которых нет в кеше.
+    """
+    if grades is None:
+        grades = settings.MISTRAL_MODERATIONS_GRADES
+    keys = [make_key(text, grades, namespace) for text in texts]
+    found = verdict_cache.get_many(list(dict.fromkeys(keys)))
+
+    # Один текст на ключ - дубликаты внутри пачки проверяются один раз
+    to_check = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in to_check:
+            to_check[key] = text
+
+    if to_check:
+        results = check_texts(list(to_check.values()))
+        fresh = dict(zip(to_check.keys(), results))
+        verdict_cache.set_many(fresh)
+        found.update(fresh)
+
+    return [found[key] for key in keys]
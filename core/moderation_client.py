@@ -0,0 +1,183 @@
+"""
+Долгоживущий клиент модерации Mistral.
+
+Раньше на каждую проверку создавался новый Mistral(api_key=...): новое
+TLS-соединение, без таймаута и без защиты от зависшего провайдера.
+Здесь один клиент на процесс (и на API-ключ) с общим пулом соединений httpx,
+дедлайном на каждый вызов, ограниченным числом повторов со случайной
+задержкой (jitter) и автоматическим выключателем (circuit breaker).
+
+Пока выключатель разомкнут, запросы к API не отправляются вовсе -
+вызов сразу падает с CircuitOpenError, и воркер не висит на таймаутах.
+
+Адрес API задается MISTRAL_SERVER_URL, поэтому клиент можно проверить
+на локальном тестовом HTTP-сервере.
+"""
+
+import logging
+import random
+import threading
+import time
+
+import httpx
+from django.conf import settings
+from mistralai import Mistral
+from mistralai.models import SDKError
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Выключатель разомкнут: API считается недоступным"""
+
+
+class CircuitBreaker:
+    """
+    closed - запросы идут как обычно;
+    open - после failure_threshold ошибок подряд запросы не идут reset_timeout секунд;
+    half_open - после паузы пропускаем один пробный запрос.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> None:
+        with self._lock:
+            state = self._state()
+            if state == "open" or (state == "half_open" and self.trial_in_progress):
+                raise CircuitOpenError("API модерации временно недоступен")
+            if state == "half_open":
+                self.trial_in_progress = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_progress = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.trial_in_progress = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                # Ошибка пробного запроса снова размыкает выключатель на полный срок
+                self.opened_at = time.monotonic()
+
+
+def is_transient(error: Exception) -> bool:
+    """Имеет ли смысл повторять запрос после такой ошибки"""
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, SDKError):
+        status = getattr(error, "status_code", None)
+        return status is None or status == 429 or status >= 500
+    return False
+
+
+class ModerationClient:
+    def __init__(
+        self,
+        api_key,
+        server_url=None,
+        timeout_ms=5000,
+        max_retries=2,
+        backoff_ms=200,
+        pool_size=10,
+        breaker=None,
+    ):
+        self.timeout_ms = timeout_ms
+        self.max_retries = max_retries
+        self.backoff_ms = backoff_ms
+        self.breaker = breaker or CircuitBreaker()
+        # Общий пул keep-alive соединений для всех потоков воркера
+        self.http = httpx.Client(
+            timeout=timeout_ms / 1000,
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+        )
+        self.sdk = Mistral(
+            api_key=api_key,
+            server_url=server_url,
+            client=self.http,
+            timeout_ms=timeout_ms,
+        )
+
+    def _sleep_before_retry(self, attempt: int) -> None:
+        # Экспоненциальная пауза с "полным" jitter, чтобы воркеры не били в API одновременно
+        cap = self.backoff_ms * 2**attempt
+        time.sleep(random.uniform(0, cap) / 1000)
+
+    def moderate_chat(self, model: str, inputs: list) -> list[dict]:
+        """Возвращает category_scores для каждого входа"""
+        self.breaker.before_call()
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.sdk.classifiers.moderate_chat(
+                    model=model, inputs=inputs, timeout_ms=self.timeout_ms
+                )
+            except Exception as error:
+                if not is_transient(error):
+                    # Ошибка в самом запросе - API жив, выключатель не трогаем
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt >= self.max_retries or self.breaker.state == "open":
+                    raise
+                logger.warning("Повтор запроса к API модерации: %s", error)
+                self._sleep_before_retry(attempt)
+            else:
+                self.breaker.record_success()
+                return [item.category_scores for item in response.results]
+
+    def close(self) -> None:
+        self.http.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_moderation_client(api_key) -> ModerationClient:
+    """Один клиент на процесс для каждого API-ключа"""
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = ModerationClient(
+                api_key=api_key,
+                server_url=settings.MISTRAL_SERVER_URL,
+                timeout_ms=settings.MISTRAL_TIMEOUT_MS,
+                max_retries=settings.MISTRAL_MAX_RETRIES,
+                pool_size=settings.MISTRAL_POOL_SIZE,
+                breaker=CircuitBreaker(
+                    failure_threshold=settings.MISTRAL_BREAKER_THRESHOLD,
+                    reset_timeout=settings.MISTRAL_BREAKER_RESET_SECONDS,
+                ),
+            )
+            _clients[api_key] = client
+        return client
+
+
+def reset_moderation_clients() -> None:
+    """Закрывает и забывает все клиенты (для тестов и смены настроек)"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
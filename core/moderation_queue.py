@@ -0,0 +1,218 @@
+"""
+Очередь модерации отзывов в БД.
+
+Очередью служит сама таблица отзывов: новый отзыв сохраняется одним INSERT
+со статусом ai_checked_in_progress, а воркер (manage.py moderate_reviews)
+забирает такие отзывы пачками и проверяет каждую пачку одним запросом
+к бэкенду модерации (MODERATION_BACKEND), отправляя несколько пачек параллельно.
+
+Все переходы статусов - условные UPDATE ... WHERE со старым статусом,
+поэтому два воркера не возьмут один отзыв, а ручное решение модератора
+не будет перезаписано результатом проверки.
+
+Пока выключатель API разомкнут, отзывы пачки остаются в очереди: их аренда
+продлевается на MISTRAL_BREAKER_RESET_SECONDS (postpone), и после паузы
+воркер снова берет их сам - к этому времени выключатель пропускает пробный
+запрос. Попытки при этом не тратятся.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import leases, ratings
+from .models import Review
+from .moderation_backends import get_moderation_backend
+from .moderation_client import CircuitOpenError
+from .moderation_cache import cached_verdicts, verdict_cache
+from .premoderation import moderate_texts
+
+logger = logging.getLogger(__name__)
+
+PENDING = "ai_checked_in_progress"
+APPROVED = "ai_checked_true"
+REJECTED = "ai_cancelled"
+NOT_CHECKED = "ai_checked_false"
+
+# На сколько секунд воркер "арендует" отзыв. Если воркер упал,
+# после истечения аренды отзыв снова попадет в выборку
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 3
+# Пауза перед повтором после ошибки: RETRY_DELAY * номер попытки
+RETRY_DELAY = 30
+# Как часто добирать отзывы в пачку, пока ждем ее заполнения
+BATCH_POLL_SECONDS = 0.05
+# Как часто чистить просроченные записи кеша модерации, с
+CACHE_PURGE_INTERVAL = 60 * 60
+
+
+def available_q(now):
+    return Q(ai_checked_status=PENDING) & (
+        Q(ai_locked_until__isnull=True) | Q(ai_locked_until__lte=now)
+    )
+
+
+def claim_batch(limit: int) -> list[int]:
+    """Забирает до limit отзывов из очереди. Возвращает id захваченных отзывов"""
+    return leases.claim(
+        Review.objects.all(),
+        limit,
+        LEASE_SECONDS,
+        available=available_q,
+        lease_field="ai_locked_until",
+        attempts_field="ai_attempts",
+        order_by=["created_at"],
+    )
+
+
+def finish(review_id: int, is_bad: bool) -> bool:
+    """Записывает результат проверки, если отзыв все еще ждет его"""
+    updated = bool(
+        Review.objects.filter(pk=review_id, ai_checked_status=PENDING).update(
+            ai_checked_status=REJECTED if is_bad else APPROVED,
+            ai_locked_until=None,
+        )
+    )
+    if updated and not is_bad:
+        # UPDATE не отправляет сигналов: уже опубликованный отзыв
+        # после одобрения попадает в рейтинг мастера здесь
+        review = (
+            Review.objects.filter(pk=review_id, is_published=True, master__isnull=False)
+            .values("master_id", "rating")
+            .first()
+        )
+        if review:
+            ratings.apply_change(None, (review["master_id"], review["rating"]))
+    return updated
+
+
+def fail(review_id: int) -> None:
+    """
+    Ошибка проверки: откладываем повтор, а после MAX_ATTEMPTS попыток
+    оставляем отзыв непроверенным для ручной модерации
+    """
+    review = Review.objects.filter(pk=review_id).values("ai_attempts").first()
+    if review is None:
+        return
+    if review["ai_attempts"] >= MAX_ATTEMPTS:
+        Review.objects.filter(pk=review_id, ai_checked_status=PENDING).update(
+            ai_checked_status=NOT_CHECKED, ai_locked_until=None
+        )
+    else:
+        retry_at = timezone.now() + timedelta(seconds=RETRY_DELAY * review["ai_attempts"])
+        Review.objects.filter(pk=review_id, ai_checked_status=PENDING).update(
+            ai_locked_until=retry_at
+        )
+
+
+def postpone(review_id: int) -> None:
+    """
+    API недоступен: отзыв остается в очереди и вернется в выборку, когда
+    выключатель снова пропустит запрос. Захват попыткой не считается
+    """
+    retry_at = timezone.now() + timedelta(seconds=settings.MISTRAL_BREAKER_RESET_SECONDS)
+    Review.objects.filter(pk=review_id, ai_checked_status=PENDING).update(
+        ai_locked_until=retry_at, ai_attempts=F("ai_attempts") - 1
+    )
+
+
+def requeue_unchecked() -> int:
+    """Возвращает в очередь непроверенные отзывы (ai_checked_false), в том числе после MAX_ATTEMPTS"""
+    return Review.objects.filter(ai_checked_status=NOT_CHECKED).update(
+        ai_checked_status=PENDING, ai_locked_until=None, ai_attempts=0
+    )
+
+
+def collect_batch(max_size: int, max_wait_ms: int) -> list[int]:
+    """
+    Набирает пачку отзывов для одного запроса к API: до max_size отзывов
+    или пока не пройдет max_wait_ms с момента первого найденного отзыва
+    """
+    claimed = claim_batch(max_size)
+    if not claimed:
+        return claimed
+    deadline = time.monotonic() + max_wait_ms / 1000
+    while len(claimed) < max_size and time.monotonic() < deadline:
+        time.sleep(min(BATCH_POLL_SECONDS, max(deadline - time.monotonic(), 0)))
+        claimed += claim_batch(max_size - len(claimed))
+    return claimed
+
+
+def process_batch(review_ids: list[int]) -> None:
+    """Проверяет пачку захваченных отзывов одним запросом к API"""
+    backend = get_moderation_backend()
+
+    try:
+        reviews = list(
+            Review.objects.filter(pk__in=review_ids).values_list("id", "text")
+        )
+        if not reviews:
+            return
+        try:
+            # Сначала локальные проверки, затем кеш - в API уходят только
+            # неоднозначные тексты, которых еще не видели
+            verdicts = moderate_texts(
+                [text for _, text in reviews],
+                lambda texts: cached_verdicts(texts, backend.are_bad, namespace=backend.name),
+            )
+        except CircuitOpenError:
+            # API недоступен: откладываем пачку до закрытия выключателя
+            logger.warning("API модерации недоступен, отзывы %s отложены", review_ids)
+            for review_id, _ in reviews:
+                postpone(review_id)
+            return
+        except Exception:
+            logger.exception("Ошибка проверки пачки отзывов %s", review_ids)
+            for review_id, _ in reviews:
+                fail(review_id)
+            return
+        for (review_id, _), is_bad in zip(reviews, verdicts):
+            finish(review_id, is_bad)
+    finally:
+        # У каждого потока свое соединение с БД - закрываем его после задачи
+        close_old_connections()
+
+
+def run_worker(
+    concurrency=4,
+    batch_size=20,
+    max_wait_ms=200,
+    poll_interval=1.0,
+    once=False,
+    stop_event=None,
+) -> int:
+    """
+    Основной цикл воркера. Набирает пачки отзывов и отправляет каждую одним
+    запросом к API; до concurrency запросов идут параллельно в пуле потоков
+    (проверка - это ожидание сети, а не работа CPU).
+    stop_event (threading.Event) - остановить воркер, когда очередь опустеет.
+    Возвращает количество обработанных отзывов.
+    """
+    processed = 0
+    slots = threading.BoundedSemaphore(concurrency)
+    next_purge = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while True:
+            if time.monotonic() >= next_purge:
+                verdict_cache.purge_expired()
+                next_purge = time.monotonic() + CACHE_PURGE_INTERVAL
+
+            claimed = collect_batch(batch_size, max_wait_ms)
+            if claimed:
+                # Не набираем новых пачек, пока все потоки заняты
+                slots.acquire()
+                future = pool.submit(process_batch, claimed)
+                future.add_done_callback(lambda _: slots.release())
+                processed += len(claimed)
+                logger.info("Отправлено на проверку отзывов: %s", len(claimed))
+                continue
+            if once or (stop_event is not None and stop_event.is_set()):
+                return processed
+            time.sleep(poll_interval)
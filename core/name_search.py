@@ -0,0 +1,40 @@
+"""
+Поиск по началу имени через индекс.
+
+LIKE в SQLite регистронезависим (и то только для ASCII), поэтому обычный
+индекс по last_name ему не помогает. Вместо этого у модели есть служебные
+колонки с индексом, где значение уже приведено к нижнему регистру
+(fold_name, заполняются в save), а поиск по началу - диапазон
+[prefix, следующая строка), который индекс отрабатывает в любой СУБД.
+"""
+
+from django.db.models import Q
+
+
+def fold_name(value: str | None) -> str:
+    """Регистр и ё/е не влияют на поиск"""
+    return " ".join((value or "").casefold().replace("ё", "е").split())
+
+
+def prefix_range_q(field: str, prefix: str) -> Q:
+    # Верхняя граница - prefix с увеличенным последним символом:
+    # все строки, начинающиеся с prefix, лежат строго внутри диапазона
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return Q(**{f"{field}__gte": prefix, f"{field}__lt": upper})
+
+
+def prefix_search_q(term: str, fields) -> Q | None:
+    """
+    Каждое слово запроса - начало хотя бы одного из полей fields (как поиск
+    админки с "^"). None - если в запросе нет слов.
+    """
+    words = fold_name(term).split()
+    if not words:
+        return None
+    query = Q()
+    for word in words:
+        word_q = Q()
+        for field in fields:
+            word_q |= prefix_range_q(field, word)
+        query &= word_q
+    return query
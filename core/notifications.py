@@ -0,0 +1,360 @@
+"""
+Уведомления в Telegram через transactional outbox.
+
+Сигнал заказа больше не ходит в Telegram сам: он пишет строку в
+NotificationOutbox в той же транзакции, что и заказ. Отправкой занимается
+долгоживущий asyncio-диспетчер (manage.py dispatch_notifications):
+- один telegram.Bot и одна HTTP-сессия на весь процесс;
+- лимиты Telegram соблюдаются корзинами токенов (общая и на каждый чат);
+- ошибки повторяются с паузой, RetryAfter от Telegram уважается.
+
+Режим дайджеста (TELEGRAM_DIGEST_WINDOW_SECONDS > 0). В спокойное время
+заказ уходит отдельным сообщением сразу. Если чату недавно уже писали,
+новые уведомления копятся, пока самому старому не исполнится окно или их не
+наберется TELEGRAM_DIGEST_MAX_ORDERS, и уходят одним сообщением,
+сгруппированным по хештегу мастера.
+
+Сообщения размечены HTML (parse_mode="HTML"), все данные клиента
+экранируются html.escape: имя или комментарий со звездочкой или "<" не
+ломают разметку. Если Telegram все же отклонил дайджест (BadRequest),
+его заказы уходят по одному - неудачным окажется только виновный.
+
+Доставка "как минимум один раз": строка помечается отправленной только
+после успешного ответа Telegram, а зависшая аренда истекает и строка
+снова попадает в выборку.
+"""
+
+import asyncio
+import html
+import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+import telegram
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, F, Min, Prefetch
+from django.utils import timezone
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from . import leases
+from .models import NotificationOutbox, Order, Service
+
+logger = logging.getLogger(__name__)
+
+# На сколько секунд диспетчер арендует сообщение
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 5
+# Пауза перед повтором: RETRY_DELAY * 2 ** (попытка - 1)
+RETRY_DELAY = 5
+# Лимит Telegram на длину одного сообщения
+MAX_MESSAGE_LENGTH = 4096
+PARSE_MODE = "HTML"
+
+
+def master_tag(order) -> str:
+    return order.master.last_name if order.master else "Не указан"
+
+
+def build_order_message(order) -> str:
+    """Текст уведомления о новом заказе в HTML"""
+    services = [service.name for service in order.services.all()]
+    master = html.escape(master_tag(order))
+    return (
+        f"<b>Новый заказ {order.created_at.strftime('%d.%m.%Y %H:%M')}</b>\n"
+        f"Имя: {html.escape(order.name)}\n"
+        f"Телефон: {html.escape(order.phone)}\n"
+        f"Мастер: {master}\n"
+        f"Услуги: {html.escape(', '.join(services)) or 'Не указано'}\n"
+        "---\n"
+        f"Комментарий: {html.escape(order.comment or '') or 'Не указан'}\n"
+        f"#заказ #{master}"
+    )
+
+
+def enqueue_order_notification(order) -> NotificationOutbox:
+    """Кладет уведомление о заказе в outbox (в текущей транзакции)"""
+    return NotificationOutbox.objects.create(
+        chat_id=str(settings.TELEGRAM_USER_ID),
+        text=build_order_message(order),
+        parse_mode=PARSE_MODE,
+        order=order,
+    )
+
+
+def build_digest_message(messages: list[NotificationOutbox]) -> str:
+    """Одно сообщение (HTML) на несколько заказов, сгруппированных по мастеру"""
+    orders = Order.objects.select_related("master").prefetch_related(
+        Prefetch("services", Service.objects.only("id", "name"))
+    ).in_bulk([message.order_id for message in messages if message.order_id])
+
+    groups = {}
+    others = []
+    for message in messages:
+        order = orders.get(message.order_id)
+        if order is None:
+            # Заказ уже удален - отправляем исходный текст (старые строки
+            # outbox размечены Markdown - их экранируем как обычный текст)
+            others.append(
+                message.text if message.parse_mode == PARSE_MODE else html.escape(message.text)
+            )
+            continue
+        services = ", ".join(service.name for service in order.services.all())
+        groups.setdefault(html.escape(master_tag(order)), []).append(
+            f"• {order.created_at.strftime('%H:%M')} {html.escape(order.name)},"
+            f" {html.escape(order.phone)} - {html.escape(services) or 'Не указано'}"
+        )
+
+    lines = [f"<b>Новые заказы: {len(messages)}</b>"]
+    for master, order_lines in groups.items():
+        lines.append("")
+        lines.append(f"#{master} ({len(order_lines)})")
+        lines.extend(order_lines)
+    for text in others:
+        lines.append("")
+        lines.append(text)
+    lines.append("")
+    lines.append("#заказ")
+    return "\n".join(lines)
+
+
+# --- Работа с очередью (синхронный ORM, вызывается через sync_to_async) ---
+
+
+def claim_messages(limit: int, chat_id: str | None = None) -> list[NotificationOutbox]:
+    """Забирает до limit сообщений, готовых к отправке (при chat_id - только этого чата)"""
+    queryset = NotificationOutbox.objects.filter(status="pending")
+    if chat_id is not None:
+        queryset = queryset.filter(chat_id=chat_id)
+    claimed = leases.claim(queryset, limit, LEASE_SECONDS)
+    return list(NotificationOutbox.objects.filter(pk__in=claimed).order_by("id"))
+
+
+def claim_digests(
+    window: float, max_orders: int, busy_chats=(), limit: int = 20
+) -> dict[str, list[NotificationOutbox]]:
+    """
+    Забирает уведомления чатов, которые пора отправлять:
+    - чат не в busy_chats (давно не писали) - сразу;
+    - иначе, когда накопилось max_orders или самое старое ждет дольше window.
+    Возвращает {chat_id: сообщения}, не больше max_orders на чат.
+    """
+    now = timezone.now()
+    rows = (
+        NotificationOutbox.objects.filter(status="pending", available_at__lte=now)
+        .values("chat_id")
+        .annotate(count=Count("id"), oldest=Min("created_at"))
+        .order_by("oldest")
+    )
+    ready = [
+        row["chat_id"]
+        for row in rows
+        if row["chat_id"] not in busy_chats
+        or row["count"] >= max_orders
+        or row["oldest"] <= now - timedelta(seconds=window)
+    ]
+    batches = {}
+    for chat_id in ready[:limit]:
+        messages = claim_messages(max_orders, chat_id=chat_id)
+        if messages:
+            batches[chat_id] = messages
+    return batches
+
+
+def mark_sent(message_ids: list[int]) -> None:
+    NotificationOutbox.objects.filter(pk__in=message_ids, status="pending").update(
+        status="sent", sent_at=timezone.now(), last_error=""
+    )
+
+
+def mark_retry(message_id: int, error: str, delay: float | None = None) -> None:
+    """Ошибка отправки: повторить позже или сдаться после MAX_ATTEMPTS"""
+    queryset = NotificationOutbox.objects.filter(pk=message_id, status="pending")
+    if delay is not None:
+        # Пауза по просьбе Telegram (RetryAfter) - не ошибка, попытку возвращаем
+        queryset.update(
+            available_at=timezone.now() + timedelta(seconds=delay),
+            attempts=F("attempts") - 1,
+            last_error=error,
+        )
+        return
+
+    message = queryset.values("attempts").first()
+    if message is None:
+        return
+    if message["attempts"] >= MAX_ATTEMPTS:
+        mark_failed(message_id, error)
+        return
+    delay = RETRY_DELAY * 2 ** (message["attempts"] - 1)
+    queryset.update(
+        available_at=timezone.now() + timedelta(seconds=delay), last_error=error
+    )
+
+
+def mark_failed(message_id: int, error: str) -> None:
+    NotificationOutbox.objects.filter(pk=message_id, status="pending").update(
+        status="failed", last_error=error
+    )
+
+
+# --- Асинхронный диспетчер ---
+
+
+class TokenBucket:
+    """Корзина токенов: не больше rate отправок в секунду с запасом capacity"""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    value = error.retry_after
+    return value.total_seconds() if isinstance(value, timedelta) else float(value)
+
+
+class Dispatcher:
+    def __init__(self, bot, rate=None, chat_rate=None):
+        self.bot = bot
+        self.bucket = TokenBucket(rate or settings.TELEGRAM_RATE_PER_SECOND)
+        chat_rate = chat_rate or settings.TELEGRAM_CHAT_RATE_PER_SECOND
+        self.chat_buckets = defaultdict(lambda: TokenBucket(chat_rate, capacity=1))
+        # Когда в чат последний раз ушло сообщение (time.monotonic())
+        self.last_sent = {}
+        self.sent = 0
+
+    async def send(
+        self, chat_id: str, text: str, parse_mode: str, message_ids: list[int], fallback=None
+    ):
+        """
+        Отправляет один текст и отмечает результат для всех message_ids.
+        fallback - корутина-функция, которую вызвать вместо отметки
+        об ошибке, если Telegram отклонил текст (BadRequest)
+        """
+        await self.chat_buckets[chat_id].acquire()
+        await self.bucket.acquire()
+        try:
+            await self.bot.send_message(
+                chat_id=chat_id, text=text, parse_mode=parse_mode or None
+            )
+        except RetryAfter as error:
+            # Telegram сам сказал, сколько ждать - попытку не засчитываем в ошибки
+            delay = retry_after_seconds(error)
+            logger.warning("Telegram просит подождать %s с", delay)
+            for message_id in message_ids:
+                await sync_to_async(mark_retry)(message_id, str(error), delay)
+        except BadRequest as error:
+            if fallback is None:
+                logger.error("Сообщение не может быть доставлено: %s", error)
+                for message_id in message_ids:
+                    await sync_to_async(mark_failed)(message_id, str(error))
+                return
+            logger.warning("Telegram отклонил сообщение, отправляем по частям: %s", error)
+            await fallback()
+        except Forbidden as error:
+            # Повтор не поможет: бот заблокирован или чата нет
+            logger.error("Сообщение не может быть доставлено: %s", error)
+            for message_id in message_ids:
+                await sync_to_async(mark_failed)(message_id, str(error))
+        except Exception as error:
+            logger.warning("Ошибка отправки в Telegram: %s", error)
+            for message_id in message_ids:
+                await sync_to_async(mark_retry)(message_id, str(error))
+        else:
+            self.last_sent[chat_id] = time.monotonic()
+            await sync_to_async(mark_sent)(message_ids)
+            self.sent += len(message_ids)
+
+    def busy_chats(self, window: float) -> set[str]:
+        """Чаты, куда писали меньше window секунд назад"""
+        now = time.monotonic()
+        return {chat_id for chat_id, sent in self.last_sent.items() if now - sent < window}
+
+    async def send_digest(self, chat_id: str, messages: list[NotificationOutbox]):
+        """Один заказ - обычное сообщение, несколько - дайджест"""
+        if len(messages) == 1:
+            message = messages[0]
+            await self.send(chat_id, message.text, message.parse_mode, [message.id])
+            return
+        text = await sync_to_async(build_digest_message)(messages)
+        if len(text) > MAX_MESSAGE_LENGTH:
+            # Не влезает в одно сообщение - делим пополам
+            middle = len(messages) // 2
+            await self.send_digest(chat_id, messages[:middle])
+            await self.send_digest(chat_id, messages[middle:])
+            return
+        await self.send(
+            chat_id,
+            text,
+            PARSE_MODE,
+            [message.id for message in messages],
+            # Дайджест отклонен - каждый заказ отдельным сообщением со своим текстом
+            fallback=lambda: self.send_each(chat_id, messages),
+        )
+
+    async def send_each(self, chat_id: str, messages: list[NotificationOutbox]):
+        for message in messages:
+            await self.send(chat_id, message.text, message.parse_mode, [message.id])
+
+    async def dispatch(self, messages: list[NotificationOutbox]) -> None:
+        await asyncio.gather(
+            *(
+                self.send(message.chat_id, message.text, message.parse_mode, [message.id])
+                for message in messages
+            )
+        )
+
+
+async def run_dispatcher(
+    token=None, batch_size=20, poll_interval=1.0, once=False, window=None, max_orders=None
+) -> int:
+    """
+    Основной цикл диспетчера. Один Bot (и одна HTTP-сессия) на все время работы.
+    window/max_orders - параметры дайджеста (по умолчанию из настроек).
+    Возвращает количество отправленных уведомлений.
+    """
+    if window is None:
+        window = settings.TELEGRAM_DIGEST_WINDOW_SECONDS
+    if max_orders is None:
+        max_orders = settings.TELEGRAM_DIGEST_MAX_ORDERS
+    bot = telegram.Bot(token=token or settings.TELEGRAM_BOT_API_KEY)
+    async with bot:
+        dispatcher = Dispatcher(bot)
+        while True:
+            if window:
+                # При --once ждать окна некому - отправляем все накопленное
+                busy = set() if once else dispatcher.busy_chats(window)
+                batches = await sync_to_async(claim_digests)(
+                    window, max_orders, busy, batch_size
+                )
+                if batches:
+                    await asyncio.gather(
+                        *(
+                            dispatcher.send_digest(chat_id, messages)
+                            for chat_id, messages in batches.items()
+                        )
+                    )
+                    continue
+            else:
+                messages = await sync_to_async(claim_messages)(batch_size)
+                if messages:
+                    await dispatcher.dispatch(messages)
+                    continue
+            if once:
+                return dispatcher.sent
+            await asyncio.sleep(poll_interval)
@@ -0,0 +1,99 @@
+"""
+Фильтры списка заявок.
+
+Один и тот же набор параметров (q, search_by_*, status_*, order_by_date)
+используется в OrderListView, в потоковой выгрузке заявок и в команде export_orders.
+Параметры передаются любым словарем с методом get: request.GET или обычным dict.
+"""
+
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+
+from . import search
+from .models import Order
+from .phones import phone_search_q
+
+
+class OrderFilter:
+    def __init__(self, params):
+        self.params = params
+        self.q = params.get("q")
+
+    def is_checked(self, name):
+        return self.params.get(name, "false") == "true"
+
+    def is_descending(self):
+        return self.params.get("order_by_date", "desc") != "asc"
+
+    def get_search_fields(self):
+        """Поля, отмеченные чекбоксами search_by_*"""
+        return [
+            field
+            for field in search.FTS_COLUMNS
+            if self.is_checked(f"search_by_{field}")
+        ]
+
+    def get_text_search_fields(self):
+        """Поля для полнотекстового поиска (телефон ищется отдельно)"""
+        return [field for field in self.get_search_fields() if field != "phone"]
+
+    def get_statuses(self):
+        """Статусы, отмеченные чекбоксами status_*"""
+        return [
+            status
+            for status, _ in Order.STATUS_CHOICES
+            if self.is_checked(f"status_{status}")
+        ]
+
+    def is_ranked(self):
+        """Сортировка по релевантности возможна только при поиске по индексу FTS5"""
+        return (
+            self.params.get("order_by_date") == "rank"
+            and search.fts_available()
+            and search.build_match_expression(self.q, self.get_text_search_fields())
+            is not None
+        )
+
+    def get_q(self):
+        # Создаем базовую Q
+        base_q = Q()
+        search_fields = self.get_search_fields()
+
+        if self.q and search_fields:
+            # Телефон ищем по нормализованным колонкам: начало номера или последние цифры
+            if "phone" in search_fields:
+                phone_q = phone_search_q(self.q)
+                if phone_q is not None:
+                    base_q |= phone_q
+
+            text_fields = self.get_text_search_fields()
+            match = search.match_sql(self.q, text_fields) if search.fts_available() else None
+            if match:
+                # Ищем по полнотекстовому индексу вместо LIKE '%q%' по всей таблице
+                base_q |= Q(id__in=RawSQL(*match))
+            else:
+                for field in text_fields:
+                    base_q |= Q(**{f"{field}__icontains": self.q})
+
+        # Чекбоксы статусов заявок
+        for status in self.get_statuses():
+            base_q |= Q(status=status)
+
+        return base_q
+
+    def apply(self, queryset, allow_ranking=True):
+        """Фильтрует и сортирует queryset заявок"""
+        # Ветвление по радиокнопкам направления сортировки по дате
+        # id добавлен как второй ключ - он нужен курсорной пагинации
+        if allow_ranking and self.is_ranked():
+            # bm25: чем меньше значение, тем выше релевантность
+            # Совпавшие только по телефону (без оценки) идут в конце
+            queryset = queryset.annotate(
+                search_rank=RawSQL(*search.rank_sql(self.q, self.get_text_search_fields()))
+            ).order_by(F("search_rank").asc(nulls_last=True), "-id")
+        elif self.is_descending():
+            queryset = queryset.order_by("-created_at", "-id")
+        else:
+            queryset = queryset.order_by("created_at", "id")
+
+        return queryset.filter(self.get_q())
@@ -0,0 +1,88 @@
+"""
+Кеш страниц (и фрагментов страниц) по поколениям.
+
+У каждой страницы свой счетчик поколения в кеше. Ключ готового HTML включает
+номер поколения, поэтому для сброса достаточно увеличить счетчик
+(bump_generation) - старые записи больше не читаются и сами истекают.
+Счетчики увеличивают сигналы моделей, от которых зависит страница
+(см. core/signals.py). Те же счетчики (get_generation/bump_generation)
+версионируют и другие кеши: варианты выбора в формах (core/form_choices.py)
+и расписание мастеров (core/availability.py).
+
+Защита от "давки" (cache stampede): после сброса страницу перестраивает
+только один запрос - тот, что первым взял блокировку через cache.add.
+Остальные в это время получают предыдущую версию страницы, а если ее нет -
+недолго ждут готовый результат.
+"""
+
+import time
+
+from django.core.cache import cache
+
+GENERATION_KEY = "page_cache:generation:{}"
+VALUE_KEY = "page_cache:{}:{}:{}"
+STALE_KEY = "page_cache:stale:{}:{}"
+LOCK_KEY = "page_cache:lock:{}:{}:{}"
+
+# Страховка от изменений, о которых сигналы не сообщили (bulk-операции,
+# правка в БД): дольше этого устаревшая страница не показывается
+CACHE_TIMEOUT = 5 * 60
+# Сколько держится блокировка, если перестраивающий процесс упал
+LOCK_TIMEOUT = 30
+# Сколько ждать чужой результат, когда старой версии нет
+WAIT_SECONDS = 2.0
+WAIT_STEP = 0.05
+
+
+def get_generation(name: str) -> int:
+    key = GENERATION_KEY.format(name)
+    generation = cache.get(key)
+    if generation is None:
+        # Начинаем со времени, чтобы после потери счетчика не попасть на старые записи
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(name: str) -> None:
+    key = GENERATION_KEY.format(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def get_or_build(name: str, part: str, build, timeout=CACHE_TIMEOUT):
+    """
+    Значение part страницы name из кеша текущего поколения.
+    При промахе build() вызывает только один процесс за раз.
+    """
+    generation = get_generation(name)
+    value_key = VALUE_KEY.format(name, generation, part)
+    value = cache.get(value_key)
+    if value is not None:
+        return value
+
+    stale_key = STALE_KEY.format(name, part)
+    lock_key = LOCK_KEY.format(name, generation, part)
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            value = build()
+            # Последняя версия отдельно - ее отдаем, пока строится следующая
+            cache.set_many({value_key: value, stale_key: value}, timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    stale = cache.get(stale_key)
+    if stale is not None:
+        return stale
+
+    deadline = time.monotonic() + WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        value = cache.get(value_key)
+        if value is not None:
+            return value
+    # Не дождались - строим сами, но в кеш не кладем: это сделает владелец блокировки
+    return build()
@@ -0,0 +1,107 @@
+"""
+Курсорная (keyset) пагинация.
+
+В отличие от OFFSET-пагинации, где для страницы N базе приходится
+пропустить N * per_page строк, курсор хранит ключ последней показанной строки
+(created_at, id). Следующая страница - это WHERE по этому ключу + LIMIT,
+который отрабатывает по составному индексу одинаково быстро для любой страницы.
+"""
+
+import base64
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from django.db.models import Q, QuerySet
+
+
+def encode_cursor(created_at: datetime, pk: int) -> str:
+    """Упаковывает ключ строки в строку для GET-параметра"""
+    raw = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str | None) -> tuple[datetime, int] | None:
+    """Распаковывает курсор. Для битого курсора возвращает None (первая страница)"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        created_at, pk = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+@dataclass
+class KeysetPage:
+    object_list: list = field(default_factory=list)
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        return self.prev_cursor is not None
+
+
+def _after_q(key: tuple[datetime, int], descending: bool) -> Q:
+    """Условие 'строго после ключа' в заданном направлении сортировки"""
+    created_at, pk = key
+    if descending:
+        return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+    return Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+
+
+def keyset_paginate(
+    queryset: QuerySet,
+    per_page: int,
+    after: str | None = None,
+    before: str | None = None,
+    descending: bool = True,
+) -> KeysetPage:
+    """
+    Возвращает страницу queryset по ключу (created_at, id).
+
+    :param after: курсор - показать строки после него (вперед)
+    :param before: курсор - показать строки перед ним (назад)
+    :param descending: направление сортировки по дате создания
+    """
+    order = ("-created_at", "-id") if descending else ("created_at", "id")
+    reverse_order = ("created_at", "id") if descending else ("-created_at", "-id")
+
+    after_key = decode_cursor(after)
+    before_key = decode_cursor(before)
+
+    if before_key and not after_key:
+        # Идем назад: выбираем в обратном порядке и разворачиваем список
+        rows = list(
+            queryset.filter(_after_q(before_key, not descending))
+            .order_by(*reverse_order)[: per_page + 1]
+        )
+        has_more = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        page = KeysetPage(object_list=rows)
+        if rows:
+            page.next_cursor = encode_cursor(rows[-1].created_at, rows[-1].pk)
+            if has_more:
+                page.prev_cursor = encode_cursor(rows[0].created_at, rows[0].pk)
+        return page
+
+    if after_key:
+        queryset = queryset.filter(_after_q(after_key, descending))
+
+    # Берем на одну строку больше, чтобы узнать, есть ли следующая страница
+    rows = list(queryset.order_by(*order)[: per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    page = KeysetPage(object_list=rows)
+    if rows:
+        if has_more:
+            page.next_cursor = encode_cursor(rows[-1].created_at, rows[-1].pk)
+        if after_key:
+            page.prev_cursor = encode_cursor(rows[0].created_at, rows[0].pk)
+    return page
@@ -0,0 +1,51 @@
+"""
+Нормализация телефонов заявок.
+
+Телефон хранится так, как его ввел клиент: +79991234567 или 89991234567.
+Для поиска держим рядом нормализованную форму (только цифры, ведущая 8 -> 7)
+и ее перевернутую копию. Обе колонки с индексами, поэтому и поиск по началу
+номера, и поиск по последним цифрам сводится к диапазонному запросу по индексу.
+"""
+
+import re
+
+from django.db.models import Q
+
+NON_DIGITS_RE = re.compile(r"\D")
+
+
+def phone_digits(value: str | None) -> str:
+    """Оставляет в строке только цифры"""
+    return NON_DIGITS_RE.sub("", value or "")
+
+
+def normalize_phone(value: str | None) -> str:
+    """
+    Приводит российский номер к виду 7XXXXXXXXXX.
+    8XXXXXXXXXX и +7XXXXXXXXXX дают одинаковый результат.
+    """
+    digits = phone_digits(value)
+    if len(digits) == 11 and digits[0] == "8":
+        digits = "7" + digits[1:]
+    return digits
+
+
+def _prefix_range(field: str, prefix: str) -> Q:
+    # Вместо LIKE 'prefix%' используем диапазон: его индекс понимает в любой СУБД.
+    # ":" идет в ASCII сразу после "9", поэтому это верхняя граница всех продолжений.
+    return Q(**{f"{field}__gte": prefix, f"{field}__lt": prefix + ":"})
+
+
+def phone_search_q(query: str) -> Q | None:
+    """
+    Условие поиска заявок по телефону: совпадение по началу номера
+    (в нормализованном виде) или по последним цифрам.
+    Возвращает None, если в запросе нет цифр.
+    """
+    digits = phone_digits(query)
+    if not digits:
+        return None
+    prefix = "7" + digits[1:] if digits[0] == "8" else digits
+    return _prefix_range("phone_normalized", prefix) | _prefix_range(
+        "phone_reversed", digits[::-1]
+    )
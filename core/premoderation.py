@@ -0,0 +1,151 @@
+"""
+Локальная предварительная модерация отзывов.
+
+Многие отзывы можно решить без запроса к Mistral:
+- телефоны и e-mail (личные данные, порог "pii" в MISTRAL_MODERATIONS_GRADES
+  все равно отклонил бы такой отзыв) - отклоняем;
+- мат из словаря - отклоняем;
+- короткие отзывы только из "безопасных" слов ("Отлично, спасибо!") - принимаем.
+
+Каждая проверка - одно скомпилированное регулярное выражение (словарь
+собран в одну альтернацию), поэтому стадия занимает микросекунды.
+В API уходят только неоднозначные отзывы.
+"""
+
+import re
+import threading
+import time
+
+# Российские номера: +7 / 8 / 7 и еще 10 цифр, допускаются пробелы, дефисы, скобки
+PHONE_RE = re.compile(r"(?<!\d)(?:\+7|8|7)[\s\-()]*(?:\d[\s\-()]*){9}\d(?!\d)")
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+", re.UNICODE)
+
+# Основы нецензурных слов. Совпадение ищем с начала слова
+PROFANITY_STEMS = [
+    "бля",
+    "блят",
+    "ебан",
+    "ебал",
+    "ебат",
+    "ебуч",
+    "уеб",
+    "заеб",
+    "хуй",
+    "хуе",
+    "хуё",
+    "хуя",
+    "пизд",
+    "мудак",
+    "мудил",
+    "гандон",
+    "пидор",
+    "пидар",
+    "сука",
+    "суки",
+    "сучк",
+    "шлюх",
+    "долбоеб",
+]
+PROFANITY_RE = re.compile(
+    r"(?<!\w)(?:%s)" % "|".join(sorted(map(re.escape, PROFANITY_STEMS), key=len, reverse=True)),
+    re.IGNORECASE | re.UNICODE,
+)
+
+# Слова, из которых состоят типичные короткие положительные отзывы
+SAFE_WORDS = {
+    "отлично", "отличный", "отличная", "отличное", "супер", "класс", "классно",
+    "спасибо", "благодарю", "огромное", "большое", "все", "всё", "очень",
+    "понравилось", "нравится", "хорошо", "хороший", "хорошая", "рекомендую",
+    "лучший", "лучшая", "лучшие", "мастер", "мастеру", "мастера", "стрижка",
+    "стрижкой", "доволен", "довольна", "довольны", "приду", "еще", "ещё",
+    "снова", "вернусь", "обязательно", "и", "за", "с", "в", "мне", "нам",
+    "было", "быстро", "аккуратно", "качественно", "вежливо", "барбершоп",
+}
+SAFE_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Длиннее этого отзыв считаем неоднозначным, даже если все слова безопасные
+SAFE_MAX_WORDS = 12
+
+BAD = True
+GOOD = False
+
+
+class PremoderationStats:
+    """Счетчики решений и суммарное время по стадиям"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {"pii": 0, "profanity": 0, "safe": 0, "remote": 0}
+        self.timings = {"pii": 0.0, "profanity": 0.0, "safe": 0.0}
+
+    def add(self, decision, timings):
+        with self._lock:
+            self.counters[decision] += 1
+            for stage, seconds in timings.items():
+                self.timings[stage] += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+            timings = dict(self.timings)
+        total = sum(counters.values())
+        avoided = total - counters["remote"]
+        return {
+            "counters": counters,
+            "timings_ms": {stage: seconds * 1000 for stage, seconds in timings.items()},
+            "checked": total,
+            "avoided_calls": avoided,
+        }
+
+
+stats = PremoderationStats()
+
+
+def _is_safe(text: str) -> bool:
+    words = SAFE_WORD_RE.findall(text.casefold())
+    return 0 < len(words) <= SAFE_MAX_WORDS and all(word in SAFE_WORDS for word in words)
+
+
+def premoderate(text: str) -> bool | None:
+    """
+    Локальное решение по отзыву: True - отклонить, False - принять,
+    None - решить не удалось, нужна проверка через API
+    """
+    timings = {}
+
+    started = time.perf_counter()
+    has_pii = bool(PHONE_RE.search(text) or EMAIL_RE.search(text))
+    timings["pii"] = time.perf_counter() - started
+    if has_pii:
+        stats.add("pii", timings)
+        return BAD
+
+    started = time.perf_counter()
+    has_profanity = bool(PROFANITY_RE.search(text))
+    timings["profanity"] = time.perf_counter() - started
+    if has_profanity:
+        stats.add("profanity", timings)
+        return BAD
+
+    started = time.perf_counter()
+    is_safe = _is_safe(text)
+    timings["safe"] = time.perf_counter() - started
+    if is_safe:
+        stats.add("safe", timings)
+        return GOOD
+
+    stats.add("remote", timings)
+    return None
+
+
+def moderate_texts(texts: list[str], check_remote) -> list[bool]:
+    """
+    Результаты модерации для texts: сначала локальные проверки,
+    оставшиеся тексты одним вызовом check_remote(list[str]) -> list[bool]
+    """
+    verdicts = [premoderate(text) for text in texts]
+    undecided = [index for index, verdict in enumerate(verdicts) if verdict is None]
+    if undecided:
+        remote = check_remote([texts[index] for index in undecided])
+        for index, verdict in zip(undecided, remote):
+            verdicts[index] = verdict
+    return verdicts
@@ -0,0 +1,88 @@
+"""
+Рейтинг мастеров по опубликованным отзывам.
+
+AVG(rating) по всем отзывам на каждой странице мастера не масштабируется,
+поэтому для каждого мастера хранится сводка MasterRating: количество,
+сумма и гистограмма оценок. Отзыв входит в рейтинг, если он опубликован
+и одобрен модерацией (Review.rating_state()).
+
+Сводка меняется инкрементально: сигналы Review сравнивают прежнее и новое
+состояние отзыва и сдвигают счетчики через F-выражения после коммита.
+Массовые изменения в обход сигналов исправляет manage.py rebuild_master_ratings.
+"""
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import MasterRating, Review
+from .pagination import keyset_paginate
+
+VISIBLE_Q = Q(is_published=True, ai_checked_status="ai_checked_true")
+
+
+def _shift(master_id: int, rating: int, delta: int) -> None:
+    changes = {
+        "review_count": F("review_count") + delta,
+        "rating_sum": F("rating_sum") + delta * rating,
+        f"count_{rating}": F(f"count_{rating}") + delta,
+    }
+    if MasterRating.objects.filter(master_id=master_id).update(**changes):
+        return
+    if delta < 0:
+        # Сводки нет - вычитать не из чего, поправит rebuild_master_ratings
+        return
+    try:
+        with transaction.atomic():
+            MasterRating.objects.create(
+                master_id=master_id,
+                review_count=delta,
+                rating_sum=delta * rating,
+                **{f"count_{rating}": delta},
+            )
+    except IntegrityError:
+        # Сводку успел создать параллельный запрос
+        MasterRating.objects.filter(master_id=master_id).update(**changes)
+
+
+def apply_change(old_state, new_state) -> None:
+    """Состояния - (master_id, rating) или None (отзыв не в рейтинге)"""
+    if old_state == new_state:
+        return
+    if old_state is not None:
+        _shift(*old_state, -1)
+    if new_state is not None:
+        _shift(*new_state, 1)
+
+
+def rebuild_ratings() -> int:
+    """Пересчитывает сводки всех мастеров одним агрегирующим запросом"""
+    rows = (
+        Review.objects.filter(VISIBLE_Q, master__isnull=False)
+        .values("master_id")
+        .annotate(
+            review_count=Count("id"),
+            rating_sum=Sum("rating"),
+            **{f"count_{rating}": Count("id", filter=Q(rating=rating)) for rating in range(1, 6)},
+        )
+    )
+    ratings = [MasterRating(**row) for row in rows]
+    with transaction.atomic():
+        MasterRating.objects.exclude(master_id__in=[rating.master_id for rating in ratings]).delete()
+        MasterRating.objects.bulk_create(
+            ratings,
+            update_conflicts=True,
+            unique_fields=["master"],
+            update_fields=["review_count", "rating_sum", *(f"count_{r}" for r in range(1, 6))],
+        )
+    return len(ratings)
+
+
+def published_reviews(master_id: int, per_page=10, after=None, before=None):
+    """
+    Страница опубликованных отзывов мастера, новые сверху.
+    Курсор по (created_at, id) идет по индексу review_master_feed_idx.
+    """
+    queryset = Review.objects.filter(VISIBLE_Q, master_id=master_id).only(
+        "id", "client_name", "text", "photo", "rating", "created_at", "master_id"
+    )
+    return keyset_paginate(queryset, per_page=per_page, after=after, before=before)
@@ -0,0 +1,146 @@
+"""
+Полнотекстовый поиск заявок на SQLite FTS5.
+
+Поиск через icontains превращается в LIKE '%q%' - это полный проход по таблице
+на каждый запрос. Здесь держим отдельную виртуальную таблицу FTS5 с полями
+phone, name, comment (rowid = id заявки) и ищем по ней с ранжированием bm25.
+
+Таблица создается миграцией 0003 только на SQLite. На других СУБД
+fts_available() вернет False и OrderListView откатится на icontains.
+"""
+
+import re
+
+from django.db import connection, transaction
+
+FTS_TABLE = "core_order_fts"
+FTS_COLUMNS = ("phone", "name", "comment")
+
+# Слова запроса: буквы, цифры, подчеркивание
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+_fts_ready = None
+
+
+def fts_available() -> bool:
+    """Проверяем (один раз на процесс), что индекс есть в текущей БД"""
+    global _fts_ready
+    if _fts_ready is None:
+        _fts_ready = (
+            connection.vendor == "sqlite"
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_ready
+
+
+def build_match_expression(query: str, fields) -> str | None:
+    """
+    Собирает выражение MATCH: каждое слово ищется по префиксу, слова через AND,
+    поиск ограничен выбранными колонками. Кавычки экранируем, чтобы пользовательский
+    ввод не интерпретировался как синтаксис FTS5.
+    """
+    fields = [f for f in fields if f in FTS_COLUMNS]
+    words = WORD_RE.findall(query or "")
+    if not fields or not words:
+        return None
+    terms = " AND ".join('"{}"*'.format(w.replace('"', '""')) for w in words)
+    return "{%s} : (%s)" % (" ".join(fields), terms)
+
+
+def match_sql(query: str, fields) -> tuple[str, list] | None:
+    """
+    SQL подзапроса с id подходящих заявок для Q(id__in=RawSQL(...)).
+    Возвращает None, если искать нечего.
+    """
+    expression = build_match_expression(query, fields)
+    if expression is None:
+        return None
+    return f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expression]
+
+
+def rank_sql(query: str, fields) -> tuple[str, list] | None:
+    """
+    Коррелированный подзапрос с оценкой bm25 для аннотации заявки.
+    Чем меньше значение, тем релевантнее совпадение.
+    """
+    expression = build_match_expression(query, fields)
+    if expression is None:
+        return None
+    sql = (
+        f"SELECT bm25({FTS_TABLE}) FROM {FTS_TABLE} "
+        f'WHERE {FTS_TABLE} MATCH %s AND rowid = "core_order"."id"'
+    )
+    return sql, [expression]
+
+
+def _row(order) -> list:
+    return [order.pk, order.phone or "", order.name or "", order.comment or ""]
+
+
+def index_order(order) -> None:
+    """Добавляет или обновляет заявку в индексе"""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {FTS_TABLE} (rowid, phone, name, comment) "
+            "VALUES (%s, %s, %s, %s)",
+            _row(order),
+        )
+
+
+def index_orders(orders) -> None:
+    """Добавляет в индекс пачку заявок одним executemany (для bulk_create)"""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO {FTS_TABLE} (rowid, phone, name, comment) "
+            "VALUES (%s, %s, %s, %s)",
+            [_row(order) for order in orders],
+        )
+
+
+def unindex_order(pk: int) -> None:
+    """Удаляет заявку из индекса"""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [pk])
+
+
+def rebuild_index(batch_size: int = 2000) -> int:
+    """
+    Полностью перестраивает индекс пачками. Нужен после bulk_create/update,
+    которые не отправляют сигналы. Возвращает количество проиндексированных заявок.
+    """
+    from .models import Order
+
+    if not fts_available():
+        return 0
+
+    total = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        rows = Order.objects.values_list("id", "phone", "name", "comment").order_by("id")
+        batch = []
+        for pk, phone, name, comment in rows.iterator(chunk_size=batch_size):
+            batch.append([pk, phone or "", name or "", comment or ""])
+            if len(batch) >= batch_size:
+                cursor.executemany(
+                    f"INSERT INTO {FTS_TABLE} (rowid, phone, name, comment) "
+                    "VALUES (%s, %s, %s, %s)",
+                    batch,
+                )
+                total += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, phone, name, comment) "
+                "VALUES (%s, %s, %s, %s)",
+                batch,
+            )
+            total += len(batch)
+        # Сливаем сегменты индекса после массовой вставки
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return total
@@ -1,56 +1,236 @@
-from django.db.models.signals import post_save, m2m_changed
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
-from .models import Review, Order
-from .mistral import is_bad_review
-from .telegram_bot import send_telegram_message
-from barbershop.settings import TELEGRAM_BOT_API_KEY, TELEGRAM_USER_ID
-import asyncio
+from .models import Review, Order, Master, Service
+from .notifications import enqueue_order_notification
+from .search import index_order, unindex_order
+from .counters import change_status_count, reset_status_counts
+from .master_services import invalidate_services_map
+from .form_choices import invalidate_choices
+from .page_cache import bump_generation
+from .images import enqueue_image, release_image
+from .ratings import apply_change, rebuild_ratings
+from .availability import invalidate_availability
+from .booking import sync_slots
 
 
-@receiver(post_save, sender=Review)
-def check_review(sender, instance, created, **kwargs):
-    # Created - это флаг, который показывает, что запись была создана
-    if created:
-        # Меняем статус на ai_checked_in_progress
+@receiver(pre_save, sender=Review)
+def check_review(sender, instance, **kwargs):
+    """
+    Новый отзыв сразу ставим в очередь модерации: он сохраняется одним INSERT
+    со статусом ai_checked_in_progress, а проверку через Mistral выполняет
+    воркер manage.py moderate_reviews (см. core/moderation_queue.py)
+    """
+    if instance._state.adding and instance.ai_checked_status == "ai_checked_false":
         instance.ai_checked_status = "ai_checked_in_progress"
-        instance.save()
 
-        # Отправляем на проверку
-        review_text = instance.text
-        if is_bad_review(review_text):
-            instance.ai_checked_status = "ai_cancelled"
-        else:
-            instance.ai_checked_status = "ai_checked_true"
 
-        instance.save()
+@receiver(post_save, sender=Order)
+def order_search_index_update(sender, instance, **kwargs):
+    # Поддерживаем полнотекстовый индекс заявок в актуальном состоянии
+    index_order(instance)
+
+
+@receiver(post_delete, sender=Order)
+def order_search_index_delete(sender, instance, **kwargs):
+    unindex_order(instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def order_status_counts_update(sender, instance, created, **kwargs):
+    """Сдвигаем кешированные счетчики статусов вместо пересчета таблицы"""
+    new_status = instance.status
+    if not created and not hasattr(instance, "_loaded_status"):
+        # Прежний статус неизвестен (объект собран не из БД) - сбрасываем счетчики
+        transaction.on_commit(reset_status_counts)
+        instance._loaded_status = new_status
+        return
+
+    old_status = None if created else instance._loaded_status
+    if old_status == new_status:
+        return
+
+    def apply():
+        change_status_count(old_status, -1)
+        change_status_count(new_status, 1)
+
+    # Сдвигаем только после коммита, чтобы откат транзакции не испортил счетчики
+    transaction.on_commit(apply)
+    instance._loaded_status = new_status
+
+
+@receiver(post_delete, sender=Order)
+def order_status_counts_delete(sender, instance, **kwargs):
+    status = getattr(instance, "_loaded_status", instance.status)
+    transaction.on_commit(lambda: change_status_count(status, -1))
 
 
 @receiver(m2m_changed, sender=Order.services.through)
 def telegram_order_notify(sender, instance, action, **kwargs):
     """
     Обработчик сигнала m2m_changed для модели Order.
-    Отправляет уведомление только при создании НОВОГО заказа с услугами.
+    Ставит уведомление в outbox только при создании НОВОГО заказа с услугами.
+    Само сообщение отправляет диспетчер manage.py dispatch_notifications.
     """
     # action == 'post_add' - означает, что в M2M-связь добавили записи.
     # pk_set - содержит id добавленных услуг.
     # Проверяем, что заказ был создан менее 5 секунд назад.
     # Это позволяет отфильтровать именно создание нового заказа, а не обновление старого.
     if action == 'post_add' and kwargs.get('pk_set') and timezone.now() - instance.created_at < timedelta(seconds=5):
-        # Получаем список услуг
-        services = [service.name for service in instance.services.all()]
-
-        # Формируем сообщение в MD разметке
-        message = (
-            f"**Новый заказ {instance.created_at.strftime('%d.%m.%Y %H:%M')}**\n"
-            f"Имя: {instance.name}\n"
-            f"Телефон: {instance.phone}\n"
-            f"Мастер: {instance.master.last_name}\n"
-            f"Услуги: {', '.join(services) or 'Не указано'}\n"
-            "---\n"
-            f"Комментарий: {instance.comment or 'Не указан'}\n"
-            f"#заказ #{instance.master.last_name}"
-        )
-        # Отправляем сообщение в телеграм
-        asyncio.run(send_telegram_message(TELEGRAM_BOT_API_KEY, TELEGRAM_USER_ID, message))
\ No newline at end of file
+        # Запись в outbox попадает в ту же транзакцию, что и заказ
+        enqueue_order_notification(instance)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def order_availability_reset(sender, **kwargs):
+    # Новая, перенесенная или отмененная заявка меняет занятость мастера
+    transaction.on_commit(invalidate_availability)
+
+
+@receiver(post_save, sender=Order)
+def order_slots_update(sender, instance, created, **kwargs):
+    """
+    Перенос, смена мастера, отмена и возврат из отмены пересобирают ячейки
+    времени (core/booking.py) - откуда бы ни пришло сохранение.
+    Новая заявка займет время, когда к ней добавят услуги.
+    SlotTaken откатывает сохранение: время занято другой заявкой
+    """
+    if created or getattr(instance, "_slots_deferred", False):
+        return
+    state = instance.booking_state()
+    if getattr(instance, "_loaded_booking", None) != state:
+        sync_slots(instance)
+    instance._loaded_booking = state
+
+
+@receiver(m2m_changed, sender=Order.services.through)
+def order_services_slots_update(sender, instance, action, reverse, pk_set, **kwargs):
+    # Длительность записи - сумма услуг
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        if not getattr(instance, "_slots_deferred", False):
+            sync_slots(instance)
+        return
+    # service.orders.add(...) - пересобираем затронутые заявки
+    if pk_set:
+        for order in Order.objects.filter(pk__in=pk_set):
+            sync_slots(order)
+
+
+@receiver(m2m_changed, sender=Order.services.through)
+def order_services_availability_reset(sender, action, **kwargs):
+    # Длительность заявки - сумма ее услуг
+    if action in ("post_add", "post_remove", "post_clear"):
+        transaction.on_commit(invalidate_availability)
+
+
+def reset_master_caches():
+    """
+    Сбрасывает все, что зависит от мастеров и услуг: карту "мастер -> услуги",
+    варианты выбора в формах заявки, кеш лендинга и расписание мастеров
+    (длительность услуг)
+    """
+    invalidate_services_map()
+    invalidate_choices()
+    bump_generation("landing")
+    invalidate_availability()
+
+
+@receiver(m2m_changed, sender=Master.services.through)
+def master_services_changed(sender, action, **kwargs):
+    # Изменились услуги мастера - карту "мастер -> услуги" строим заново
+    if action in ("post_add", "post_remove", "post_clear"):
+        transaction.on_commit(reset_master_caches)
+
+
+@receiver(post_save, sender=Master)
+@receiver(post_delete, sender=Master)
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def master_services_map_reset(sender, **kwargs):
+    # Новый мастер, удаление или переименование услуги тоже меняют карту
+    transaction.on_commit(reset_master_caches)
+
+
+def enqueue_uploaded_image(image, created, update_fields):
+    # Сохранение без изменения файла (например, last_login у пользователя) пропускаем
+    if image and (created or update_fields is None or image.field.name in update_fields):
+        transaction.on_commit(lambda: enqueue_image(image.name))
+
+
+@receiver(post_save, sender=Review)
+def review_photo_enqueue(sender, instance, created, update_fields, **kwargs):
+    """Фото отзыва - в очередь на WebP-варианты (manage.py process_images)"""
+    enqueue_uploaded_image(instance.photo, created, update_fields)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_avatar_enqueue(sender, instance, created, update_fields, **kwargs):
+    enqueue_uploaded_image(instance.avatar, created, update_fields)
+
+
+def release_replaced_image(sender, instance, field_name, update_fields):
+    # Файл заменили или очистили - старый отпускаем после коммита
+    if instance._state.adding or (update_fields is not None and field_name not in update_fields):
+        return
+    old_name = sender.objects.filter(pk=instance.pk).values_list(field_name, flat=True).first()
+    image = getattr(instance, field_name)
+    new_name = image.name if image else ""
+    if old_name and old_name != new_name:
+        transaction.on_commit(lambda: release_image(old_name))
+
+
+@receiver(pre_save, sender=Review)
+def review_photo_replace(sender, instance, update_fields, **kwargs):
+    release_replaced_image(sender, instance, "photo", update_fields)
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def user_avatar_replace(sender, instance, update_fields, **kwargs):
+    release_replaced_image(sender, instance, "avatar", update_fields)
+
+
+@receiver(post_delete, sender=Review)
+def review_photo_release(sender, instance, **kwargs):
+    # Одинаковые фото хранятся один раз - файл удалится вместе с последней ссылкой
+    if instance.photo:
+        name = instance.photo.name
+        transaction.on_commit(lambda: release_image(name))
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_avatar_release(sender, instance, **kwargs):
+    if instance.avatar:
+        name = instance.avatar.name
+        transaction.on_commit(lambda: release_image(name))
+
+
+@receiver(post_save, sender=Review)
+def review_rating_update(sender, instance, created, **kwargs):
+    """Сдвигаем сводку рейтинга мастера вместо AVG по всем отзывам"""
+    new_state = instance.rating_state()
+    if created:
+        old_state = None
+    elif hasattr(instance, "_loaded_rating_state"):
+        old_state = instance._loaded_rating_state
+    else:
+        # Прежнее состояние неизвестно (объект собран не из БД) - пересчитываем
+        transaction.on_commit(rebuild_ratings)
+        instance._loaded_rating_state = new_state
+        return
+
+    if old_state != new_state:
+        transaction.on_commit(lambda: apply_change(old_state, new_state))
+    instance._loaded_rating_state = new_state
+
+
+@receiver(post_delete, sender=Review)
+def review_rating_delete(sender, instance, **kwargs):
+    old_state = getattr(instance, "_loaded_rating_state", instance.rating_state())
+    if old_state is not None:
+        transaction.on_commit(lambda: apply_change(old_state, None))
@@ -0,0 +1,122 @@
+"""
+Контентно-адресуемое хранилище медиафайлов.
+
+Имя файла - SHA-256 его содержимого: cas/ab/<sha256>.jpg. Одинаковые
+загрузки (клиент повторно отправил то же фото) лежат на диске один раз,
+а в таблице StoredFile для каждого файла хранится число ссылок.
+
+- save() читает загрузку кусками: каждый кусок сразу пишется во временный
+  файл и добавляется в хеш, поэтому большой файл целиком в память не попадает;
+  если файл с таким хешем уже есть - временный удаляется, счетчик ссылок растет;
+- delete() уменьшает счетчик и удаляет файл с диска только на последней ссылке.
+  Файлы, которых нет в StoredFile (загруженные до этого хранилища, аватар по
+  умолчанию), delete() не трогает.
+
+Подключается в settings.STORAGES["default"].
+"""
+
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+CAS_PREFIX = "cas"
+TEMP_DIR = ".tmp"
+
+
+def content_name(digest: str, original_name: str) -> str:
+    # Расширение сохраняем: по нему веб-сервер выставляет Content-Type
+    extension = os.path.splitext(original_name)[1].lower()
+    if extension == ".jpeg":
+        extension = ".jpg"
+    return f"{CAS_PREFIX}/{digest[:2]}/{digest}{extension}"
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя зависит от содержимого и вычисляется в _save
+        return name
+
+    def _write_temp(self, content) -> tuple[str, str, int]:
+        """Пишет content во временный файл кусками, считая SHA-256 по дороге"""
+        temp_dir = self.path(TEMP_DIR)
+        os.makedirs(temp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        if hasattr(content, "seek"):
+            content.seek(0)
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return temp_path, digest.hexdigest(), size
+
+    def _save(self, name, content):
+        temp_path, digest, size = self._write_temp(content)
+        name = content_name(digest, name)
+        full_path = self.path(name)
+        # Сначала ссылка, потом проверка файла: release() удаляет файл под
+        # блокировкой строки, и add_reference дожидается ее конца
+        self.add_reference(name, digest, size)
+        try:
+            if os.path.exists(full_path):
+                # Такое содержимое уже хранится
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                # os.replace атомарен: параллельная загрузка того же файла не повредит его
+                os.replace(temp_path, full_path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return name
+
+    def add_reference(self, name: str, digest: str, size: int) -> None:
+        from .models import StoredFile
+
+        if StoredFile.objects.filter(name=name).update(refcount=F("refcount") + 1):
+            return
+        try:
+            with transaction.atomic():
+                StoredFile.objects.create(name=name, sha256=digest, size=size, refcount=1)
+        except IntegrityError:
+            # Строку успел создать параллельный запрос
+            StoredFile.objects.filter(name=name).update(refcount=F("refcount") + 1)
+
+    def release(self, name: str) -> bool:
+        """Снимает одну ссылку. True - если это была последняя и файл удален"""
+        from .models import StoredFile
+
+        if not name:
+            return False
+        # Файл удаляется с диска внутри той же транзакции, что и строка.
+        # Строка заблокирована (на SQLite - вся БД: BEGIN IMMEDIATE), поэтому
+        # параллельный _save того же содержимого ждет в add_reference и после
+        # коммита уже не находит файл - кладет свой.
+        with transaction.atomic():
+            stored = StoredFile.objects.select_for_update().filter(name=name).first()
+            if stored is None:
+                # Файл не учтен хранилищем - не удаляем
+                return False
+            if stored.refcount > 1:
+                StoredFile.objects.filter(name=name).update(refcount=F("refcount") - 1)
+                return False
+            stored.delete()
+            super().delete(name)
+        return True
+
+    def delete(self, name):
+        self.release(name)
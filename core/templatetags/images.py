@@ -0,0 +1,59 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from core.images import THUMBNAIL_KEY, get_variants, pick_variant, width_variants
+
+register = template.Library()
+
+
+@register.filter
+def image_url(image, width=640):
+    """
+    URL самого маленького WebP-варианта не уже width px.
+    Пока варианты не готовы - URL оригинала.
+    Пример: {{ review.photo|image_url:320 }}
+    """
+    if not image:
+        return ""
+    variant = pick_variant(get_variants(image.name), int(width))
+    return default_storage.url(variant["name"]) if variant else image.url
+
+
+@register.filter
+def thumbnail_url(image):
+    """URL квадратной миниатюры. Пример: {{ user.avatar|thumbnail_url }}"""
+    if not image:
+        return ""
+    variant = get_variants(image.name).get(THUMBNAIL_KEY)
+    return default_storage.url(variant["name"]) if variant else image.url
+
+
+@register.simple_tag
+def responsive_image(image, width=640, sizes="100vw", alt="", css_class=""):
+    """
+    <img> со srcset из всех вариантов: браузер сам выберет подходящую ширину.
+    Пример: {% responsive_image review.photo 320 sizes="(max-width: 768px) 100vw, 33vw" alt="Фото" %}
+    """
+    if not image:
+        return ""
+    variants = get_variants(image.name)
+    variant = pick_variant(variants, int(width))
+    if variant is None:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="lazy">', image.url, alt, css_class
+        )
+    srcset = ", ".join(
+        f"{default_storage.url(item['name'])} {item['width']}w"
+        for item in width_variants(variants)
+    )
+    return format_html(
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" loading="lazy">',
+        default_storage.url(variant["name"]),
+        srcset,
+        sizes,
+        variant["width"],
+        variant["height"],
+        alt,
+        css_class,
+    )
@@ -1,3 +1,572 @@
-from django.test import TestCase
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import CustomUser
+from .models import Master, MasterRating, MasterSlot, Order, Review, Service
+from .availability import BusyIntervals, free_slots
+from .booking import SlotTaken, reserve_slots
+from .views import OrderListView
+from .counters import get_status_counts
+from .order_filters import OrderFilter
+from . import export, moderation_queue
+from .moderation_cache import VerdictCache, normalize_text
+from .moderation_client import CircuitBreaker, CircuitOpenError, ModerationClient
+from mistralai.models import SDKError
+
+
+# Сколько запросов к БД допускается на одну страницу списка заявок
+# (сессия, пользователь, заявки, услуги заявок, сохранение сессии в savepoint).
+# Счетчики статусов приходят из кеша и в бюджет не входят
+ORDER_LIST_QUERY_BUDGET = 7
+
+
+# Бюджет - запросы самой страницы. Кеш в БД (DatabaseCache) тоже ходит
+# в базу, поэтому здесь он заменен кешем в памяти
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class OrderListQueryBudgetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("staff", "staff@example.com", "pass")
+        cls.services = Service.objects.bulk_create(
+            [Service(name=f"Услуга {i}", price=100) for i in range(3)]
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        # Счетчики статусов берутся из кеша - прогреваем его заранее
+        cache.clear()
+        get_status_counts()
+
+    def create_orders(self, count):
+        orders = Order.objects.bulk_create(
+            [Order(name=f"Клиент {i}", phone="89990000000") for i in range(count)]
+        )
+        # Связи пишем напрямую в through-таблицу, чтобы не дергать сигнал уведомлений
+        Order.services.through.objects.bulk_create(
+            [
+                Order.services.through(order_id=order.id, service_id=service.id)
+                for order in orders
+                for service in self.services
+            ]
+        )
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.create_orders(2)
+        with self.assertNumQueries(ORDER_LIST_QUERY_BUDGET):
+            response = self.client.get(reverse("order_list"))
+        self.assertEqual(len(response.context["orders"]), 2)
+
+        self.create_orders(OrderListView.page_size)
+        with self.assertNumQueries(ORDER_LIST_QUERY_BUDGET):
+            response = self.client.get(reverse("order_list"))
+        self.assertEqual(len(response.context["orders"]), OrderListView.page_size)
+        self.assertContains(response, "Услуга 2", count=OrderListView.page_size)
+
+
+class StubModerationHandler(BaseHTTPRequestHandler):
+    """Отвечает как /v1/chat/moderations. Коды ответов берет из очереди server.statuses"""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests += 1
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        if status == 200:
+            results = []
+            for chat in body["input"]:
+                pii = 0.9 if "+7" in chat[0]["content"] else 0.0
+                results.append({"categories": {"pii": pii > 0.5}, "category_scores": {"pii": pii}})
+            payload = {"id": "stub", "model": body["model"], "results": results}
+        else:
+            payload = {"message": "error"}
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class ModerationClientStubServerTest(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubModerationHandler)
+        self.server.statuses = []
+        self.server.requests = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = ModerationClient(
+            api_key="test",
+            server_url=f"http://127.0.0.1:{self.server.server_port}",
+            timeout_ms=2000,
+            max_retries=2,
+            backoff_ms=1,
+            breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60),
+        )
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def moderate(self, *texts):
+        return self.client.moderate_chat(
+            model="mistral-moderation-latest",
+            inputs=[[{"role": "user", "content": text}] for text in texts],
+        )
+
+    def test_batch_scores_are_returned_in_order(self):
+        scores = self.moderate("Отлично", "Звоните +79111111111")
+        self.assertEqual([item["pii"] for item in scores], [0.0, 0.9])
+
+    def test_transient_error_is_retried(self):
+        self.server.statuses = [503]
+        self.assertEqual(len(self.moderate("Отлично")), 1)
+        self.assertEqual(self.server.requests, 2)
+
+    def test_breaker_opens_and_stops_requests(self):
+        self.server.statuses = [500, 500, 500]
+        with self.assertRaises(SDKError):
+            self.moderate("Отлично")
+        self.assertEqual(self.client.breaker.state, "open")
+        requests = self.server.requests
+        with self.assertRaises(CircuitOpenError):
+            self.moderate("Отлично")
+        self.assertEqual(self.server.requests, requests)
+
+
+class ConcurrentBookingTest(TransactionTestCase):
+    """
+    Клиенты в параллельных потоках записываются к одному мастеру на одни
+    и те же времена через OrderCreateView. Ни одна пара заявок не должна
+    пересечься; в выводе - сколько записей в секунду выдерживает сервер.
+    """
+
+    THREADS = 8
+    SERVICE_MINUTES = 30
+    # Начала записи с шагом 15 минут: соседние варианты пересекаются
+    STARTS = 40
+
+    def setUp(self):
+        cache.clear()
+        self.master = Master.objects.create(first_name="Мастер", last_name="Тестовый", phone="1")
+        self.service = Service.objects.create(
+            name="Стрижка", price=100, duration=self.SERVICE_MINUTES
+        )
+        self.master.services.add(self.service)
+        day = timezone.localdate() + timedelta(days=7)
+        first = timezone.make_aware(datetime.combine(day, datetime.min.time()).replace(hour=10))
+        self.starts = [first + timedelta(minutes=15 * index) for index in range(self.STARTS)]
+
+    def client_worker(self, number, results):
+        client = Client()
+        starts = self.starts[:]
+        random.Random(number).shuffle(starts)
+        try:
+            for start in starts:
+                response = client.post(
+                    reverse("order_create"),
+                    {
+                        "name": f"Клиент {number}",
+                        "phone": "89990000000",
+                        "master": self.master.pk,
+                        "services": [self.service.pk],
+                        "order_date": timezone.localtime(start).strftime("%Y-%m-%dT%H:%M"),
+                    },
+                )
+                results.append(response.status_code)
+        finally:
+            connection.close()
+
+    def test_overlapping_reservation_is_rejected_by_database(self):
+        # Проверку формы обе заявки прошли бы одновременно - решает уникальность ячеек
+        first = Order.objects.create(
+            name="Первый", phone="89990000000", master=self.master, order_date=self.starts[0]
+        )
+        reserve_slots(first, self.SERVICE_MINUTES)
+        second = Order.objects.create(
+            name="Второй", phone="89990000000", master=self.master, order_date=self.starts[1]
+        )
+        with self.assertRaises(SlotTaken):
+            reserve_slots(second, self.SERVICE_MINUTES)
+        self.assertFalse(MasterSlot.objects.filter(order=second).exists())
+
+        second.order_date = self.starts[2]
+        reserve_slots(second, self.SERVICE_MINUTES)
+        self.assertEqual(MasterSlot.objects.filter(master=self.master).count(), 4)
+
+    def test_parallel_bookings_do_not_overlap(self):
+        results = []
+        threads = [
+            threading.Thread(target=self.client_worker, args=(number, results))
+            for number in range(self.THREADS)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        # 302 - записан, 200 - форма с ошибкой "время занято"
+        self.assertEqual(len(results), self.THREADS * self.STARTS)
+        self.assertEqual(set(results) - {200, 302}, set())
+
+        orders = list(Order.objects.filter(master=self.master).order_by("order_date"))
+        self.assertEqual(len(orders), results.count(302))
+        self.assertGreater(len(orders), 0)
+        for previous, current in zip(orders, orders[1:]):
+            self.assertGreaterEqual(
+                current.order_date,
+                previous.order_date + timedelta(minutes=self.SERVICE_MINUTES),
+            )
+        self.assertEqual(
+            MasterSlot.objects.filter(master=self.master).count(),
+            len(orders) * self.SERVICE_MINUTES // 15,
+        )
+
+        print(
+            f"\n{len(results)} попыток записи в {self.THREADS} потоков за {elapsed:.2f} с: "
+            f"{len(results) / elapsed:.0f} решений/с, записано {len(orders)} "
+            f"({len(orders) / elapsed:.1f} записей/с), пересечений нет"
+        )
+
+
+class MasterServicesViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.master = Master.objects.create(first_name="Мастер", last_name="Тестовый", phone="1")
+        self.service = Service.objects.create(name="Стрижка", price=100)
+        self.master.services.add(self.service)
+
+    def test_etag_not_modified(self):
+        url = reverse("master_services", args=[self.master.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+
+        # Услуги мастера изменились - старый ETag больше не совпадает
+        with self.captureOnCommitCallbacks(execute=True):
+            self.master.services.add(Service.objects.create(name="Борода", price=50))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["services"]), 2)
+
+        map_response = self.client.get(reverse("master_services_map"))
+        response = self.client.get(
+            reverse("master_services_map"), HTTP_IF_NONE_MATCH=map_response["ETag"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_post_with_master_in_url(self):
+        url = reverse("master_services", args=[self.master.pk])
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["services"][0]["id"], self.service.pk)
+
+        response = self.client.post(reverse("master_services", args=[self.master.pk + 1]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_post_with_master_in_body(self):
+        response = self.client.post(
+            reverse("get_master_services"),
+            json.dumps({"master_id": self.master.pk}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["services"]), 1)
+
+
+class ModerationQueueBreakerTest(TestCase):
+    """Пока выключатель API разомкнут, отзывы не выпадают из очереди"""
+
+    def test_postponed_reviews_return_to_queue(self):
+        review = Review.objects.create(
+            text="Отлично", client_name="Клиент", ai_checked_status=moderation_queue.PENDING
+        )
+        claimed = moderation_queue.claim_batch(10)
+        self.assertEqual(claimed, [review.pk])
+
+        with mock.patch.object(
+            moderation_queue, "moderate_texts", side_effect=CircuitOpenError
+        ), mock.patch.object(moderation_queue, "close_old_connections"):
+            moderation_queue.process_batch(claimed)
+
+        review.refresh_from_db()
+        self.assertEqual(review.ai_checked_status, moderation_queue.PENDING)
+        self.assertEqual(review.ai_attempts, 0)
+        self.assertEqual(moderation_queue.claim_batch(10), [])
+
+        # Пауза выключателя прошла - воркер снова берет отзыв
+        Review.objects.filter(pk=review.pk).update(ai_locked_until=timezone.now())
+        self.assertEqual(moderation_queue.claim_batch(10), [review.pk])
+
+
+class OrderAdminSlotTakenTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_superuser("admin", "admin@example.com", "pass")
+        self.client.force_login(self.user)
+        self.master = Master.objects.create(first_name="Мастер", last_name="Тестовый", phone="1")
+        self.service = Service.objects.create(name="Стрижка", price=100, duration=30)
+        start = timezone.make_aware(
+            datetime.combine(timezone.localdate() + timedelta(days=7), datetime.min.time())
+        ).replace(hour=10)
+        self.start = start
+        first = Order.objects.create(
+            name="Первый", phone="89990000000", master=self.master, order_date=start
+        )
+        first.services.add(self.service)
+
+    def test_slot_taken_after_validation_is_reported(self):
+        # Проверка формы "не видит" первую заявку - как при гонке двух сохранений
+        with mock.patch("core.forms.find_conflict", return_value=False):
+            response = self.client.post(
+                reverse("admin:core_order_add"),
+                {
+                    "name": "Второй",
+                    "phone": "89990000001",
+                    "master": self.master.pk,
+                    "services": [self.service.pk],
+                    "status": "new",
+                    "order_date_0": timezone.localtime(self.start).strftime("%d.%m.%Y"),
+                    "order_date_1": timezone.localtime(self.start).strftime("%H:%M"),
+                },
+            )
+        self.assertRedirects(response, reverse("admin:core_order_add"), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.filter(name="Второй").exists())
+        self.assertEqual(MasterSlot.objects.count(), 2)
+
+
+class VerdictCacheTest(TestCase):
+    def test_memory_entries_expire_with_ttl(self):
+        verdicts = VerdictCache(max_size=10, ttl=60)
+        verdicts.set_many({"key": True})
+        self.assertEqual(verdicts.get_many(["key"]), {"key": True})
+
+        later = timezone.now() + timedelta(seconds=61)
+        with mock.patch("core.moderation_cache.timezone.now", return_value=later):
+            self.assertEqual(verdicts.get_many(["key"]), {})
+        self.assertEqual(verdicts.get_stats()["memory_size"], 0)
+
+    def test_key_keeps_contact_punctuation(self):
+        self.assertEqual(normalize_text("Отлично!!!  Спасибо."), normalize_text("отлично, спасибо"))
+        self.assertEqual(normalize_text("Пишите: Test@Mail.ru."), "пишите test@mail.ru")
+        self.assertNotEqual(normalize_text("test@mail.ru"), normalize_text("test mail ru"))
+        self.assertEqual(normalize_text("звоните +7 999"), "звоните +7 999")
+
+
+class OrderFullTextSearchTest(TestCase):
+    """Индекс FTS5 следует за заявками через сигналы, поиск ранжируется bm25"""
+
+    def search(self, query, **params):
+        order_filter = OrderFilter(
+            {"q": query, "search_by_name": "true", "search_by_comment": "true", **params}
+        )
+        return list(order_filter.apply(Order.objects.all()).values_list("name", flat=True))
+
+    def test_index_follows_save_and_delete(self):
+        order = Order.objects.create(name="Василий", phone="89990000000", comment="Борода")
+        self.assertEqual(self.search("васил"), ["Василий"])
+        self.assertEqual(self.search("бород"), ["Василий"])
+
+        order.name = "Григорий"
+        order.save()
+        self.assertEqual(self.search("васил"), [])
+        self.assertEqual(self.search("григ"), ["Григорий"])
+
+        order.delete()
+        self.assertEqual(self.search("григ"), [])
+
+    def test_rank_orders_by_relevance(self):
+        Order.objects.create(name="Иван", phone="89990000002", comment="Стрижка, стрижка и стрижка")
+        Order.objects.create(
+            name="Петр", phone="89990000001", comment="Просил стрижку покороче, а потом бороду"
+        )
+        Order.objects.create(name="Олег", phone="89990000003", comment="Только бритье")
+
+        # Без ранжирования - новые сверху
+        self.assertEqual(self.search("стрижк"), ["Петр", "Иван"])
+        self.assertEqual(self.search("стрижк", order_by_date="rank"), ["Иван", "Петр"])
+
+
+class PhoneSearchTest(TestCase):
+    """Поиск по началу номера в любом формате и по последним цифрам"""
+
+    def setUp(self):
+        Order.objects.create(name="Первый", phone="+7 (999) 123-45-67")
+        Order.objects.create(name="Второй", phone="89161234500")
+
+    def search(self, query):
+        order_filter = OrderFilter({"q": query, "search_by_phone": "true"})
+        return sorted(order_filter.apply(Order.objects.all()).values_list("name", flat=True))
+
+    def test_prefix_in_any_format(self):
+        self.assertEqual(self.search("8999"), ["Первый"])
+        self.assertEqual(self.search("+7 916"), ["Второй"])
+        self.assertEqual(self.search("7"), ["Второй", "Первый"])
+
+    def test_last_digits(self):
+        self.assertEqual(self.search("4567"), ["Первый"])
+        self.assertEqual(self.search("45-00"), ["Второй"])
+        self.assertEqual(self.search("1111"), [])
+
+
+class OrderExportTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("staff", "staff@example.com", "pass")
+        self.client.force_login(self.user)
+        master = Master.objects.create(first_name="Мастер", last_name="Тестовый", phone="1")
+        services = Service.objects.bulk_create(
+            [Service(name="Стрижка", price=100), Service(name="Борода", price=50)]
+        )
+        for index in range(5):
+            order = Order.objects.create(
+                name=f"Клиент {index}", phone="89990000000", master=master, comment="Без, запятых"
+            )
+            order.services.set(services)
+
+    def export(self, **params):
+        response = self.client.get(reverse("order_export"), params)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv(self):
+        lines = self.export(format="csv").splitlines()
+        self.assertEqual(lines[0].split(","), export.EXPORT_FIELDS)
+        self.assertEqual(len(lines), 6)
+        self.assertIn('"Без, запятых"', lines[1])
+        self.assertIn("Стрижка; Борода", lines[1])
+
+    def test_jsonl_reads_in_chunks(self):
+        # Пачки по 2 заявки: услуги подгружаются на каждую пачку
+        rows = [
+            json.loads(line)
+            for line in export.stream_orders(OrderFilter({}), "jsonl", chunk_size=2)
+        ]
+        self.assertEqual([row["name"] for row in rows], [f"Клиент {i}" for i in range(4, -1, -1)])
+        self.assertEqual(rows[0]["services"], ["Стрижка", "Борода"])
+        self.assertEqual(rows[0]["master"], "Мастер Тестовый")
+
+        self.assertEqual(len(self.export(format="jsonl").splitlines()), 5)
+
+
+class MasterRatingTest(TestCase):
+    """Сводка рейтинга сдвигается сигналами отзывов, без пересчета"""
+
+    def setUp(self):
+        self.master = Master.objects.create(first_name="Мастер", last_name="Тестовый", phone="1")
+
+    def save(self, review, **changes):
+        for field, value in changes.items():
+            setattr(review, field, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            review.save()
+
+    def summary(self):
+        rating = MasterRating.objects.filter(master=self.master).first()
+        if rating is None:
+            return None
+        return rating.review_count, rating.rating_sum, rating.count_5, rating.count_3
+
+    def test_publish_unpublish_and_rating_change(self):
+        review = Review(
+            text="Отлично", client_name="Клиент", master=self.master, rating=5,
+            ai_checked_status="ai_checked_true",
+        )
+        self.save(review)
+        # Не опубликован - в рейтинг не входит
+        self.assertIsNone(self.summary())
+
+        self.save(review, is_published=True)
+        self.assertEqual(self.summary(), (1, 5, 1, 0))
+
+        review = Review.objects.get(pk=review.pk)
+        self.save(review, rating=3)
+        self.assertEqual(self.summary(), (1, 3, 0, 1))
+
+        self.save(review, is_published=False)
+        self.assertEqual(self.summary(), (0, 0, 0, 0))
+
+        self.save(review, is_published=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            review.delete()
+        self.assertEqual(self.summary(), (0, 0, 0, 0))
+        self.assertEqual(MasterRating.objects.get(master=self.master).average, 0.0)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    BOOKING_DAY_START="10:00",
+    BOOKING_DAY_END="14:00",
+    BOOKING_SLOT_STEP_MINUTES=15,
+)
+class FreeSlotsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.master = Master.objects.create(first_name="Мастер", last_name="Тестовый", phone="1")
+        self.service = Service.objects.create(name="Стрижка", price=100, duration=30)
+        self.day = timezone.localdate() + timedelta(days=7)
+
+    def at(self, hour, minute=0):
+        return timezone.make_aware(datetime.combine(self.day, datetime.min.time())).replace(
+            hour=hour, minute=minute
+        )
+
+    def book(self, start, status="new"):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(
+                name="Клиент", phone="89990000000", master=self.master, order_date=start,
+                status=status,
+            )
+            order.services.add(self.service)
+
+    def free(self, duration):
+        return [
+            timezone.localtime(start).strftime("%H:%M")
+            for start in free_slots(self.master.pk, self.day, duration)
+        ]
+
+    def test_slots_skip_busy_intervals(self):
+        self.assertEqual(len(self.free(60)), 13)
+
+        self.book(self.at(11))
+        # Заявка не с начала шага занимает ячейки сетки целиком: 12:05-12:35 -> 12:00-12:45
+        self.book(self.at(12, 5))
+        self.assertEqual(self.free(60), ["10:00", "12:45", "13:00"])
+        self.assertEqual(
+            self.free(30),
+            ["10:00", "10:15", "10:30", "11:30", "12:45", "13:00", "13:15", "13:30"],
+        )
+
+    def test_cancelled_order_frees_time(self):
+        self.book(self.at(10), status="cancelled")
+        self.assertEqual(self.free(240), ["10:00"])
+        self.book(self.at(13, 30))
+        self.assertEqual(self.free(240), [])
+
+    def test_busy_intervals_merge(self):
+        intervals = BusyIntervals([(60, 90), (80, 120), (120, 130), (200, 210), (5, 5)])
+        self.assertEqual((intervals.starts, intervals.ends), ([60, 200], [130, 210]))
+        self.assertTrue(intervals.overlaps(129, 140))
+        self.assertFalse(intervals.overlaps(130, 200))
+        self.assertEqual(intervals.free_starts(0, 300, 60, 30), [0, 210, 240])
+        self.assertEqual(intervals.free_starts(0, 240, 30, 30), [0, 30, 150, 210])
@@ -2,15 +2,35 @@ from pickle import FLOAT
 from token import NAME, STRING
 from django.db.models.query import QuerySet
 from django.shortcuts import render
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.http import (
+    HttpRequest,
+    HttpResponse,
+    HttpResponseNotModified,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
 from .data import *
 
-from django.db.models import Q
+from django.db.models import Q, Prefetch
 from .models import Order, Master, Service, Review
 
 from django.shortcuts import redirect
 from django.core.exceptions import ObjectDoesNotExist
 from .forms import OrderForm, ReviewModelForm, OrderModelForm
+from .pagination import KeysetPage, keyset_paginate
+from .order_filters import OrderFilter
+from .counters import get_status_counts
+from .export import stream_orders
+from .master_services import get_master_services, get_services_map
+from .page_cache import get_or_build
+from .ratings import published_reviews
+from .availability import free_slots, services_duration
+from .booking import SlotTaken, book
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 
@@ -18,6 +38,8 @@ from django.views.generic import TemplateView, ListView, DetailView
 from django.views import View
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 import json
+from datetime import date
+from django.utils import timezone
 
 # Импорт LoginRequiredMixin, PermissionRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin, UserPassesTestMixin
@@ -33,14 +55,32 @@ class AdminStaffRequiredMixin(UserPassesTestMixin):
 
 
 class LandingView(View):
+    """
+    Самая посещаемая страница. Содержимое меняется только вместе с мастерами
+    и услугами, поэтому HTML кешируется по поколению "landing" (core/page_cache.py):
+    - анонимам без уведомлений отдаем готовую страницу целиком;
+    - остальным - меню и уведомления рендерим заново, а содержимое берем из кеша.
+    """
 
-    def get(self, request):
+    title = "Барбершоп - стрижки и бритье"
+
+    def render_content(self):
         context = {
-            "title": "Барбершоп - стрижки и бритье",
             "masters": Master.objects.all()[:3],
             "services": Service.objects.all(),
         }
-        return render(request, "landing.html", context)
+        return render_to_string("landing_content_include.html", context)
+
+    def render_page(self, request):
+        content = get_or_build("landing", "content", self.render_content)
+        context = {"title": self.title, "landing_content": mark_safe(content)}
+        return render_to_string("landing.html", context, request=request)
+
+    def get(self, request):
+        # Уведомления не читаем (len не помечает их прочитанными)
+        if request.user.is_authenticated or len(messages.get_messages(request)):
+            return HttpResponse(self.render_page(request))
+        return HttpResponse(get_or_build("landing", "anonymous", lambda: self.render_page(request)))
 
 
 
@@ -48,80 +88,87 @@ class OrderListView(LoginRequiredMixin, ListView):
     model = Order
     template_name = "order_list.html"
     context_object_name = "orders"
-    
+    # Размер страницы для курсорной пагинации
+    page_size = 30
+
+    def get_order_filter(self):
+        if not hasattr(self, "_order_filter"):
+            self._order_filter = OrderFilter(self.request.GET)
+        return self._order_filter
+
     def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+        order_filter = self.get_order_filter()
+        if order_filter.is_ranked():
+            # По релевантности показываем лучшие совпадения одной страницей
+            page = KeysetPage(object_list=list(self.object_list[: self.page_size]))
+        else:
+            # Вместо OFFSET-пагинации режем отфильтрованный queryset по курсору (created_at, id)
+            page = keyset_paginate(
+                self.object_list,
+                per_page=self.page_size,
+                after=self.request.GET.get("after"),
+                before=self.request.GET.get("before"),
+                descending=order_filter.is_descending(),
+            )
+        context = super().get_context_data(object_list=page.object_list, **kwargs)
         context["title"] = "Заявки на стрижки"
+        context["page"] = page
+        # Количество заявок по статусам для чекбоксов фильтра (из кеша)
+        context["status_counts"] = get_status_counts()
         return context
 
     def get_queryset(self):
-         # Получаем параметры запроса
-        q = self.request.GET.get("q")
-
-        # Чекбоксы поиска по телефону, имени и комментарию
-        search_by_phone = self.request.GET.get("search_by_phone", "false") == "true"
-        search_by_name = self.request.GET.get("search_by_name", "false") == "true"
-        search_by_comment = self.request.GET.get("search_by_comment", "false") == "true"
-
-        # Радиокнопки направления сорртировки по дате
-        order_by_date = self.request.GET.get("order_by_date", "desc")
-
-        # Чекбоксы статусов заказов
-        status_new = self.request.GET.get("status_new", "false") == "true"
-        status_confirmed = self.request.GET.get("status_confirmed", "false") == "true"
-        status_completed = self.request.GET.get("status_completed", "false") == "true"
-        status_cancelled = self.request.GET.get("status_cancelled", "false") == "true"
-
         # Cоздаем базовый запрос
-        query = Order.objects.all()
-
-        # Создаем базовую Q
-        base_q = Q()
-
-        # Серия IF где мы модифицируем базовый запрос в зависимости от чекбоксов и радиокнопок
-
-        # Представим, что в Order у нас есть поле status формата choises с следующими значениями:
-        # new, confirmed, completed, cancelled
-        if q:
-            if search_by_phone:
-                base_q |= Q(phone__icontains=q)
-
-            if search_by_name:
-                base_q |= Q(name__icontains=q)
-
-            if search_by_comment:
-                base_q |= Q(comment__icontains=q)
-
-        # Ветвление по радиокнопкам направления сортировки по дате
-        if order_by_date == "asc":
-            query = query.order_by("created_at")
-        else:
-            query = query.order_by("-created_at")
+        # Услуги подгружаем одним запросом на всю страницу, а не по запросу на каждую карточку
+        query = Order.objects.prefetch_related(
+            Prefetch("services", queryset=Service.objects.only("id", "name"))
+        )
+        # Поиск, чекбоксы статусов и сортировка - в OrderFilter
+        return self.get_order_filter().apply(query)
 
-        # Ветвление по чекбоксам статуса заявок
-        if status_new:
-            base_q |= Q(status="new")
 
-        if status_confirmed:
-            base_q |= Q(status="confirmed")
+class OrderExportView(LoginRequiredMixin, View):
+    """Потоковая выгрузка заявок с фильтрами списка заявок: ?format=csv|jsonl"""
 
-        if status_completed:
-            base_q |= Q(status="completed")
+    content_types = {
+        "csv": "text/csv; charset=utf-8",
+        "jsonl": "application/x-ndjson; charset=utf-8",
+    }
 
-        if status_cancelled:
-            base_q |= Q(status="cancelled")
-
-        # Объединяем базовый запрос и базовую Q
-        query = query.filter(base_q)
+    def get(self, request):
+        export_format = request.GET.get("format", "csv")
+        if export_format not in self.content_types:
+            export_format = "csv"
 
-        return query
-            
+        response = StreamingHttpResponse(
+            stream_orders(OrderFilter(request.GET), export_format=export_format),
+            content_type=self.content_types[export_format],
+        )
+        response["Content-Disposition"] = f'attachment; filename="orders.{export_format}"'
+        return response
 
 
 class MasterDetailView(DetailView):
     model = Master
     template_name = "master_detail.html"
     pk_url_kwarg = "master_id"
+    reviews_page_size = 10
+
+    def get_queryset(self):
+        # Сводка рейтинга - тем же запросом, что и мастер
+        return Master.objects.select_related("rating")
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["rating"] = getattr(self.object, "rating", None)
+        context["page"] = published_reviews(
+            self.object.pk,
+            per_page=self.reviews_page_size,
+            after=self.request.GET.get("after"),
+            before=self.request.GET.get("before"),
+        )
+        context["reviews"] = context["page"].object_list
+        return context
 
 class MasterListView(ListView):
     model = Master
@@ -131,7 +178,7 @@ class MasterListView(ListView):
 
     def get_queryset(self):
         # Определим мастеров у которых есть хотя бы одна услуга
-        masters = Master.objects.prefetch_related("services").filter(
+        masters = Master.objects.select_related("rating").prefetch_related("services").filter(
             services__isnull=False
         ).distinct()
         return masters
@@ -173,22 +220,84 @@ class MasterServicesView(View):
     #     if request.method != "POST":
     #         return JsonResponse({"error": "Иди отдыхай"}, status=405)
 
-    def post(self, request):
+    def get(self, request, master_id=None):
+        """
+        Кешируемый вариант: без master_id - карта услуг всех мастеров,
+        с master_id - услуги одного мастера. Поддерживает ETag / If-None-Match.
+        """
+        services_map = get_services_map()
+        if master_id is None:
+            etag = services_map["etag"]
+            data = {
+                "masters": {
+                    key: value["services"] for key, value in services_map["masters"].items()
+                }
+            }
+        else:
+            master_data = services_map["masters"].get(str(master_id))
+            if master_data is None:
+                return JsonResponse({"error": "Master not found"}, status=404)
+            etag = master_data["etag"]
+            data = {"services": master_data["services"]}
+
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+        else:
+            response = JsonResponse(data)
+        response["ETag"] = etag
+        # Браузер хранит ответ, но каждый раз сверяет ETag с сервером
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def post(self, request, master_id=None):
+        """Старый вариант: master_id в адресе или в JSON-теле запроса"""
         try:
-            data = json.loads(request.body)
-            master_id = data.get("master_id")
-            master = Master.objects.get(id=master_id)
-            services = master.services.all()
-            services_data = [
-                {"id": service.id, "name": service.name} for service in services
-            ]
-            return JsonResponse({"services": services_data})
+            if master_id is None:
+                master_id = json.loads(request.body).get("master_id")
+            master_data = get_master_services(master_id)
+            if master_data is None:
+                raise Master.DoesNotExist
+            return JsonResponse({"services": master_data["services"]})
         except Master.DoesNotExist:
             return JsonResponse({"error": "Master not found"}, status=404)
         except json.JSONDecodeError:
             return JsonResponse({"error": "Invalid JSON"}, status=400)
 
 
+class AvailabilityView(View):
+    """
+    Свободное время мастера на выбранные услуги:
+    GET ?master=1&services=2&services=3&date=2025-05-20
+    """
+
+    def get(self, request):
+        try:
+            master_id = int(request.GET["master"])
+            service_ids = [int(value) for value in request.GET.getlist("services")]
+            day = date.fromisoformat(request.GET["date"])
+        except (KeyError, ValueError):
+            return JsonResponse({"error": "Invalid parameters"}, status=400)
+        if get_master_services(master_id) is None:
+            return JsonResponse({"error": "Master not found"}, status=404)
+        duration = services_duration(service_ids)
+        if duration is None:
+            return JsonResponse({"error": "Service not found"}, status=404)
+
+        slots = [
+            timezone.localtime(start) for start in free_slots(master_id, day, duration)
+        ]
+        return JsonResponse(
+            {
+                "date": day.isoformat(),
+                "duration": duration,
+                "slots": [
+                    {"start": start.strftime("%Y-%m-%dT%H:%M"), "time": start.strftime("%H:%M")}
+                    for start in slots
+                ],
+            }
+        )
+
+
 
 class OrderUpdateView(AdminStaffRequiredMixin, UpdateView):
     model = Order
@@ -205,8 +314,14 @@ class OrderUpdateView(AdminStaffRequiredMixin, UpdateView):
         return context
     
     def form_valid(self, form):
+        # Перенос заявки занимает новое время атомарно (core/booking.py)
+        try:
+            self.object = book(form)
+        except SlotTaken:
+            form.add_error(None, "Это время уже занято. Выберите другое.")
+            return self.form_invalid(form)
         messages.success(self.request, "Заявка успешно обновлена")
-        return super().form_valid(form)
+        return HttpResponseRedirect(self.get_success_url())
     
     def form_invalid(self, form):
         messages.error(self.request, "Форма заполнена некорректно")
@@ -226,8 +341,15 @@ class OrderCreateView(CreateView):
         return context
     
     def form_valid(self, form):
+        # Заявка, ее услуги, время мастера и уведомление в outbox сохраняются
+        # одной транзакцией. Если время успели занять - ничего не сохраняется
+        try:
+            self.object = book(form)
+        except SlotTaken:
+            form.add_error(None, "Это время только что заняли. Выберите другое.")
+            return self.form_invalid(form)
         messages.success(self.request, "Заявка успешно создана")
-        return super().form_valid(form)
+        return HttpResponseRedirect(self.get_success_url())
     
     def form_invalid(self, form):
         messages.error(self.request, "Форма заполнена некорректно")
@@ -20,31 +20,46 @@ document.addEventListener("DOMContentLoaded", function () {
   const csrftoken = getCookie("csrftoken");
 
   if (masterSelect && servicesSelect) {
+    // Карта "мастер -> услуги" загружается один раз GET-запросом.
+    // Браузер кеширует ответ и сверяет его по ETag (304 без тела)
+    let servicesMap = null;
+
+    const renderServices = (services) => {
+      servicesSelect.innerHTML = ""; // Очищаем список услуг
+      services.forEach((service) => {
+        const option = document.createElement("option");
+        option.value = service.id;
+        option.textContent = service.name;
+        servicesSelect.appendChild(option);
+      });
+    };
+
+    const loadServicesMap = () => {
+      if (servicesMap) {
+        return Promise.resolve(servicesMap);
+      }
+      return fetch("/ajax/master-services/")
+        .then((response) => response.json())
+        .then((data) => {
+          servicesMap = data.masters || {};
+          return servicesMap;
+        });
+    };
+
     const updateServices = () => {
       const masterId = masterSelect.value;
       if (masterId) {
-        fetch("/ajax/get-master-services/", {
-          method: "POST",
-          headers: {
-            "Content-Type": "application/json",
-            "X-CSRFToken": csrftoken,
-          },
-          body: JSON.stringify({ master_id: masterId }),
-        })
-          .then((response) => response.json())
-          .then((data) => {
-            console.log("Данные о мастере:", data);
-            servicesSelect.innerHTML = ""; // Очищаем список услуг
-            if (data.services) {
-              console.log("Полученные услуги:", data.services);
-              data.services.forEach((service) => {
-                const option = document.createElement("option");
-                option.value = service.id;
-                option.textContent = service.name;
-                servicesSelect.appendChild(option);
-              });
+        loadServicesMap()
+          .then((map) => {
+            if (map[masterId]) {
+              return map[masterId];
             }
+            // Мастера нет в карте (добавлен после загрузки страницы) - спрашиваем отдельно
+            return fetch(`/ajax/master-services/${masterId}/`)
+              .then((response) => response.json())
+              .then((data) => data.services || []);
           })
+          .then(renderServices)
           .catch((error) => console.error("Ошибка при загрузке услуг:", error));
       } else {
         servicesSelect.innerHTML = ""; // Очищаем, если мастер не выбран
@@ -56,6 +71,53 @@ document.addEventListener("DOMContentLoaded", function () {
     updateServices();
   }
 
+  // Свободное время мастера: кнопки под полем даты, клик подставляет время
+  const orderDateInput = document.querySelector("#id_order_date");
+
+  if (masterSelect && servicesSelect && orderDateInput) {
+    const slotsContainer = document.createElement("div");
+    slotsContainer.className = "d-flex flex-wrap gap-2 mt-2";
+    orderDateInput.after(slotsContainer);
+
+    const renderSlots = (slots) => {
+      slotsContainer.innerHTML = "";
+      if (!slots.length) {
+        slotsContainer.textContent = "Нет свободного времени на этот день";
+        return;
+      }
+      slots.forEach((slot) => {
+        const button = document.createElement("button");
+        button.type = "button";
+        button.className = "btn btn-sm btn-outline-dark";
+        button.textContent = slot.time;
+        button.addEventListener("click", () => {
+          orderDateInput.value = slot.start;
+        });
+        slotsContainer.appendChild(button);
+      });
+    };
+
+    const updateSlots = () => {
+      const masterId = masterSelect.value;
+      const day = orderDateInput.value.split("T")[0];
+      const serviceIds = [...servicesSelect.selectedOptions].map((option) => option.value);
+      if (!masterId || !day || !serviceIds.length) {
+        slotsContainer.innerHTML = "";
+        return;
+      }
+      const params = new URLSearchParams({ master: masterId, date: day });
+      serviceIds.forEach((id) => params.append("services", id));
+      fetch(`/ajax/availability/?${params}`)
+        .then((response) => response.json())
+        .then((data) => renderSlots(data.slots || []))
+        .catch((error) => console.error("Ошибка при загрузке свободного времени:", error));
+    };
+
+    masterSelect.addEventListener("change", updateSlots);
+    servicesSelect.addEventListener("change", updateSlots);
+    orderDateInput.addEventListener("change", updateSlots);
+  }
+
   const toastElList = document.querySelectorAll(".toast");
   const toastList = [...toastElList].map((toastEl) => {
     const toast = new bootstrap.Toast(toastEl, {
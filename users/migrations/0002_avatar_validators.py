@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:59
+
+import core.images
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='avatar',
+            field=models.ImageField(blank=True, default='avatars/default_avatar.png', null=True, upload_to='avatars/', validators=[core.images.validate_image_upload], verbose_name='Аватар'),
+        ),
+    ]
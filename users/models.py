@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
+from core.images import validate_image_upload
+
 
 class CustomUser(AbstractUser):
     """
@@ -13,6 +15,7 @@ class CustomUser(AbstractUser):
         default="avatars/default_avatar.png",  # Убедитесь, что у вас есть это изображение в папке media/avatars/
         blank=True,
         null=True,
+        validators=[validate_image_upload],
         verbose_name="Аватар",
     )
     tg_id = models.CharField(